@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+"""
+A simulated HP switch SNMP agent the tests of `hpswitch` run against.
+
+The agent answers SNMPv2c GET, GETNEXT, GETBULK and SET requests on a local UDP port from an in-memory MIB that is
+populated like a 5406zl with a given number of ports, VLANs, IP addresses and learned MAC addresses. Requests can be
+delayed or dropped, and the operations of all requests received are recorded. `benchmarks.run` extends the agent
+with the accounting of the benchmarks.
+"""
+import bisect
+import heapq
+import random
+import select
+import socket
+import struct
+import threading
+import time
+
+from pyasn1.codec.ber import decoder, encoder
+from pysnmp.proto import api, rfc1902
+from pysnmp.smi import error
+
+from hpswitch.mib import mib_registry
+
+# The agent speaks SNMPv2c only
+pMod = api.protoModules[api.protoVersion2c]
+
+# Names of the request PDU types
+OPERATIONS = {
+    pMod.GetRequestPDU.tagSet: "get",
+    pMod.GetNextRequestPDU.tagSet: "getnext",
+    pMod.GetBulkRequestPDU.tagSet: "getbulk",
+    pMod.SetRequestPDU.tagSet: "set",
+}
+
+
+class SimulatedSwitchAgent(object):
+    """
+    An SNMP agent simulating an HP switch, running in a background thread.
+    """
+    def __init__(self, ports=48, vlans=4, ipv4_addresses=4, community="public", latency=0.0, loss=0.0,
+            max_message_size=1472, host="127.0.0.1", port=0, seed=0, mac_addresses=0, clock=time.time):
+        self.port_count = ports
+        self.vlan_count = vlans
+        self.ipv4_address_count = ipv4_addresses
+        self.mac_address_count = mac_addresses
+        self.community = community
+        # Delay before each response in seconds and probability of dropping a request
+        self.latency = latency
+        self.loss = loss
+        self.max_message_size = max_message_size
+        # Returns the current time in seconds, from which sysUpTime is computed
+        self.clock = clock
+
+        self._random = random.Random(seed)
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.bind((host, port))
+        self.address = self._socket.getsockname()
+        self._thread = None
+        self._running = False
+        self._started_at = clock()
+
+        self._values = {}
+        self._oids = []
+        # Names of the MIB objects that are not simulated because their MIB is not available
+        self.unsupported_objects = set()
+        self._populate()
+        self.reset_statistics()
+
+    def reset_statistics(self):
+        self.requests_received = 0
+        # Names of the operations of the requests answered, in the order they arrived
+        self.operations = []
+
+    def _set(self, name, value):
+        oid = mib_registry.get_oid(name)
+        if oid not in self._values:
+            bisect.insort(self._oids, oid)
+        self._values[oid] = value
+
+    def _populate(self):
+        port_list_size = (self.port_count + 7) // 8
+        self._set(("sysUpTime", 0), rfc1902.TimeTicks(0))
+        for port in range(1, self.port_count + 1):
+            identifier = "ABCDEFGH"[(port - 1) // 24] + str((port - 1) % 24 + 1)
+            self._set(("ifDescr", port), rfc1902.OctetString(identifier))
+            self._set(("ifAdminStatus", port), rfc1902.Integer(1))
+            self._set(("ifOperStatus", port), rfc1902.Integer(1 if port % 3 else 2))
+            self._set(("ifAlias", port), rfc1902.OctetString("port{0}".format(port)))
+            self._set(("ifHCInOctets", port), rfc1902.Counter64(port * 1000))
+            self._set(("ifHCOutOctets", port), rfc1902.Counter64(port * 2000))
+            self._set(("dot1dBasePort", port), rfc1902.Integer(port))
+
+        # Every port is untagged in one VLAN and tagged in the next one
+        vids = [1] + [10 * index for index in range(1, self.vlan_count)]
+        egress_ports = dict((vid, bytearray(port_list_size)) for vid in vids)
+        untagged_ports = dict((vid, bytearray(port_list_size)) for vid in vids)
+        for port in range(1, self.port_count + 1):
+            untagged_vid = vids[(port - 1) % len(vids)]
+            tagged_vid = vids[port % len(vids)]
+            for port_list in (untagged_ports[untagged_vid], egress_ports[untagged_vid], egress_ports[tagged_vid]):
+                # The first port is the most significant bit of the first byte
+                port_list[(port - 1) // 8] |= 0x80 >> ((port - 1) % 8)
+            self._set(("dot1qPvid", port), rfc1902.Gauge32(untagged_vid))
+        for vid in vids:
+            self._set(("dot1qVlanStaticName", vid), rfc1902.OctetString("VLAN{0}".format(vid)))
+            self._set(("dot1qVlanStaticEgressPorts", vid), rfc1902.OctetString(bytes(egress_ports[vid])))
+            self._set(("dot1qVlanStaticUntaggedPorts", vid), rfc1902.OctetString(bytes(untagged_ports[vid])))
+            # active == 1
+            self._set(("dot1qVlanStaticRowStatus", vid), rfc1902.Integer(1))
+
+        # MAC addresses are spread over all VLANs and ports; the FID of each VLAN is its VLAN ID
+        dynamic_counts = dict((vid, 0) for vid in vids)
+        for index in range(self.mac_address_count):
+            vid = vids[index % len(vids)]
+            address = struct.unpack("6B", struct.pack(">Q", 0x001122000000 + index)[2:])
+            self._set(("dot1qTpFdbPort", vid) + address, rfc1902.Integer(index % self.port_count + 1))
+            # learned == 3
+            self._set(("dot1qTpFdbStatus", vid) + address, rfc1902.Integer(3))
+            dynamic_counts[vid] += 1
+        for vid in vids:
+            self._set(("dot1qFdbDynamicCount", vid), rfc1902.Counter32(dynamic_counts[vid]))
+
+        if not self._is_available("hpicfIpAddressPrefixLength"):
+            return
+        for index in range(self.ipv4_address_count):
+            vid = vids[index % len(vids)]
+            address = struct.unpack("4B", struct.pack(">I", (10 << 24) + (index << 8) + 1))
+            self._set(("hpicfIpAddressPrefixLength", vid + 577, 1, 4) + address, rfc1902.Gauge32(24))
+
+    def _is_available(self, name):
+        """
+        Whether the MIB defining the object `name` is available, recording the object as unsupported otherwise.
+        """
+        try:
+            mib_registry.get_oid((name, ))
+        except error.SmiError:
+            self.unsupported_objects.add(name)
+            return False
+        return True
+
+    def start(self):
+        """
+        Start answering requests in a background thread.
+        """
+        self._running = True
+        self._thread = threading.Thread(target=self._serve)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._socket.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def _serve(self):
+        # Responses waiting for their injected latency to pass as (send time, sequence, data, address) tuples
+        scheduled = []
+        sequence = 0
+        while self._running:
+            now = time.time()
+            while scheduled and scheduled[0][0] <= now:
+                send_time, _, data, address = heapq.heappop(scheduled)
+                self._response_sent(data)
+                self._socket.sendto(data, address)
+            timeout = min(0.05, scheduled[0][0] - now) if scheduled else 0.05
+            readable, _, _ = select.select([self._socket], [], [], max(0, timeout))
+            if not readable:
+                continue
+            data, address = self._socket.recvfrom(65535)
+            self.requests_received += 1
+            self._request_received(data)
+            if self.loss and self._random.random() < self.loss:
+                self._request_dropped(data)
+                continue
+            response = self._handle(data)
+            if response is not None:
+                sequence += 1
+                heapq.heappush(scheduled, (time.time() + self.latency, sequence, response, address))
+
+    def _request_received(self, data):
+        """
+        Called for every request received, including the ones that are dropped.
+        """
+
+    def _request_dropped(self, data):
+        """
+        Called for every request that is dropped instead of being answered.
+        """
+
+    def _response_sent(self, data):
+        """
+        Called for every response right before it is sent, so that it is accounted for once the client has it.
+        """
+
+    def _handle(self, data):
+        try:
+            message, rest = decoder.decode(data, asn1Spec=pMod.Message())
+        except Exception:
+            return None
+        if str(pMod.apiMessage.getCommunity(message)) != self.community:
+            # Like real agents, ignore requests with the wrong community
+            return None
+        request_pdu = pMod.apiMessage.getPDU(message)
+        self.operations.append(OPERATIONS.get(request_pdu.tagSet))
+        response_pdu = pMod.apiPDU.getResponse(request_pdu)
+        self._values[mib_registry.get_oid(("sysUpTime", 0))] = rfc1902.TimeTicks(
+                int((self.clock() - self._started_at) * 100))
+
+        if request_pdu.isSameTypeWith(pMod.GetBulkRequestPDU()):
+            response_data = self._handle_get_bulk(request_pdu, response_pdu)
+            if response_data is not None:
+                return response_data
+        elif request_pdu.isSameTypeWith(pMod.SetRequestPDU()):
+            varbinds = pMod.apiPDU.getVarBinds(request_pdu)
+            for oid, value in varbinds:
+                self._set_value(tuple(oid), value)
+            pMod.apiPDU.setVarBinds(response_pdu, varbinds)
+        elif request_pdu.isSameTypeWith(pMod.GetNextRequestPDU()):
+            pMod.apiPDU.setVarBinds(response_pdu,
+                    [self._get_next(tuple(oid)) for (oid, value) in pMod.apiPDU.getVarBinds(request_pdu)])
+        else:
+            pMod.apiPDU.setVarBinds(response_pdu,
+                    [(oid, self._values.get(tuple(oid), pMod.NoSuchInstance()))
+                        for (oid, value) in pMod.apiPDU.getVarBinds(request_pdu)])
+
+        response_data = self._encode(response_pdu)
+        if len(response_data) > self.max_message_size:
+            # tooBig == 1
+            response_pdu = pMod.apiPDU.getResponse(request_pdu)
+            pMod.apiPDU.setErrorStatus(response_pdu, 1)
+            pMod.apiPDU.setVarBinds(response_pdu, pMod.apiPDU.getVarBinds(request_pdu))
+            response_data = self._encode(response_pdu)
+        return response_data
+
+    def _handle_get_bulk(self, request_pdu, response_pdu):
+        non_repeaters = int(pMod.apiBulkPDU.getNonRepeaters(request_pdu))
+        max_repetitions = int(pMod.apiBulkPDU.getMaxRepetitions(request_pdu))
+        request_oids = [tuple(oid) for (oid, value) in pMod.apiBulkPDU.getVarBinds(request_pdu)]
+        varbinds = [self._get_next(oid) for oid in request_oids[:non_repeaters]]
+        current_oids = request_oids[non_repeaters:]
+        rows = []
+        for repetition in range(max_repetitions):
+            row = [self._get_next(oid) for oid in current_oids]
+            rows.append(row)
+            current_oids = [tuple(oid) for (oid, value) in row]
+            if all(isinstance(value, pMod.EndOfMibView) for (oid, value) in row):
+                break
+        # Return as many rows as fit into a message
+        while True:
+            pMod.apiBulkPDU.setVarBinds(response_pdu, varbinds + [varbind for row in rows for varbind in row])
+            response_data = self._encode(response_pdu)
+            if len(response_data) <= self.max_message_size or len(rows) <= 1:
+                return response_data
+            rows = rows[:len(rows) // 2]
+
+    def _get_next(self, oid):
+        position = bisect.bisect_right(self._oids, oid)
+        if position >= len(self._oids):
+            return oid, pMod.EndOfMibView()
+        next_oid = self._oids[position]
+        return next_oid, self._values[next_oid]
+
+    def _set_value(self, oid, value):
+        if oid not in self._values:
+            bisect.insort(self._oids, oid)
+        # RowStatus createAndGo == 4 results in active == 1
+        if isinstance(value, rfc1902.Integer) and int(value) == 4 and oid[:-1] == mib_registry.get_oid(
+                ("dot1qVlanStaticRowStatus", )):
+            value = rfc1902.Integer(1)
+        self._values[oid] = value
+
+    def _encode(self, response_pdu):
+        message = pMod.Message()
+        pMod.apiMessage.setDefaults(message)
+        pMod.apiMessage.setCommunity(message, self.community)
+        pMod.apiMessage.setPDU(message, response_pdu)
+        return encoder.encode(message)
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+Run the `hpswitch` benchmark scenarios against a simulated switch agent.
+
+Usage: python -m benchmarks.run [--ports 96] [--vlans 16] [--latency 0.001] [--loss 0.0] [--output results.json]
+
+For each scenario, the number of requests and responses, the bytes exchanged, the wall time and the CPU time of the
+client are reported as JSON, so that results of different revisions can be compared.
+"""
+import argparse
+import json
+import sys
+import time
+
+from benchmarks.agent import SimulatedSwitchAgent
+from hpswitch.port import Port
+from hpswitch.switch import Switch
+from hpswitch.vlan import VLAN
+
+try:
+    import resource
+    # CPU time of the calling thread only, so that the agent thread is not measured
+    RUSAGE_THREAD = getattr(resource, "RUSAGE_THREAD", resource.RUSAGE_SELF)
+
+    def get_cpu_time():
+        usage = resource.getrusage(RUSAGE_THREAD)
+        return usage.ru_utime + usage.ru_stime
+except ImportError:
+    get_cpu_time = time.process_time
+
+
+class BenchmarkAgent(SimulatedSwitchAgent):
+    """
+    A `SimulatedSwitchAgent` populated like a fully equipped 5406zl that counts all packets and bytes it exchanges.
+    """
+    def __init__(self, ports=96, vlans=16, ipv4_addresses=16, mac_addresses=1024, **kwargs):
+        super(BenchmarkAgent, self).__init__(ports=ports, vlans=vlans, ipv4_addresses=ipv4_addresses,
+                mac_addresses=mac_addresses, **kwargs)
+
+    def reset_statistics(self):
+        super(BenchmarkAgent, self).reset_statistics()
+        self.requests_dropped = 0
+        self.responses_sent = 0
+        self.bytes_received = 0
+        self.bytes_sent = 0
+
+    def get_statistics(self):
+        return {
+            "requests_received": self.requests_received,
+            "requests_dropped": self.requests_dropped,
+            "responses_sent": self.responses_sent,
+            "bytes_received": self.bytes_received,
+            "bytes_sent": self.bytes_sent,
+        }
+
+    def supports(self, name):
+        """
+        Whether the object `name` is simulated by this agent.
+        """
+        return name not in self.unsupported_objects
+
+    def _request_received(self, data):
+        self.bytes_received += len(data)
+
+    def _request_dropped(self, data):
+        self.requests_dropped += 1
+
+    def _response_sent(self, data):
+        self.responses_sent += 1
+        self.bytes_sent += len(data)
+
+
+def list_ports(switch):
+    return len(switch.get_ports())
+
+
+def list_vlans_with_members(switch):
+    return [(vlan.vid, list(vlan.tagged_ports.base_ports()), list(vlan.untagged_ports.base_ports()))
+            for vlan in switch.get_vlans()]
+
+
+def port_tagged_vlans(switch):
+    return [vlan.vid for vlan in Port(switch, base_port=5).tagged_vlans]
+
+
+def untagged_move(switch):
+    VLAN(switch, 20).add_untagged_port(Port(switch, base_port=5))
+    VLAN(switch, 30).add_untagged_port(Port(switch, base_port=5))
+
+
+def ipv4_address_listing(switch):
+    return [(vlan.vid, [str(address) for address in vlan.ipv4_addresses]) for vlan in switch.get_vlans()]
+
+
+def ip_address_index(switch):
+    addresses = switch.ip_addresses()
+    return [(vlan.vid, [str(address) for address in addresses.get_ipv4_addresses(vlan)])
+            for vlan in switch.get_vlans()]
+
+
+def mac_table_lookup(switch):
+    mac_table = switch.mac_table()
+    return [entry.base_port for entry in mac_table.find("00:11:22:00:00:05")], len(mac_table.get_entries(port=5))
+
+
+# Names, functions and the MIB objects each scenario needs the agent to simulate
+SCENARIOS = (
+    ("list_ports", list_ports, ()),
+    ("list_vlans_with_members", list_vlans_with_members, ()),
+    ("port_tagged_vlans", port_tagged_vlans, ()),
+    ("untagged_move", untagged_move, ()),
+    ("ipv4_address_listing", ipv4_address_listing, ("hpicfIpAddressPrefixLength", )),
+    ("ip_address_index", ip_address_index, ("hpicfIpAddressPrefixLength", )),
+    ("mac_table_lookup", mac_table_lookup, ()),
+)
+
+
+def run_scenario(agent, scenario, repeat, timeout):
+    """
+    Run `scenario` `repeat` times against the `BenchmarkAgent` `agent` using a new Switch each time.
+
+    Returns a dict of measurements.
+    """
+    agent.reset_statistics()
+    error = None
+    wall_time = 0.0
+    cpu_time = 0.0
+    for iteration in range(repeat):
+        switch = Switch(agent.address[0], agent.community, port=agent.address[1], timeout=timeout, retries=2)
+        start_wall_time = time.time()
+        start_cpu_time = get_cpu_time()
+        try:
+            scenario(switch)
+        except Exception as e:
+            error = "{0}: {1}".format(type(e).__name__, e)
+            break
+        finally:
+            wall_time += time.time() - start_wall_time
+            cpu_time += get_cpu_time() - start_cpu_time
+            switch.close()
+    result = agent.get_statistics()
+    result.update({
+        "repeat": repeat,
+        "wall_time": wall_time,
+        "cpu_time": cpu_time,
+        "error": error,
+    })
+    return result
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Benchmark hpswitch against a simulated HP switch.")
+    parser.add_argument("--ports", type=int, default=96)
+    parser.add_argument("--vlans", type=int, default=16)
+    parser.add_argument("--ipv4-addresses", type=int, default=16)
+    parser.add_argument("--mac-addresses", type=int, default=1024)
+    parser.add_argument("--latency", type=float, default=0.0, help="response delay in seconds")
+    parser.add_argument("--loss", type=float, default=0.0, help="probability of dropping a request")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=0.5, help="client timeout in seconds")
+    parser.add_argument("--scenario", action="append", help="only run the named scenarios")
+    parser.add_argument("--output", help="write results to this file instead of stdout")
+    arguments = parser.parse_args(arguments)
+
+    results = {
+        "parameters": {
+            "ports": arguments.ports,
+            "vlans": arguments.vlans,
+            "ipv4_addresses": arguments.ipv4_addresses,
+            "mac_addresses": arguments.mac_addresses,
+            "latency": arguments.latency,
+            "loss": arguments.loss,
+        },
+        "scenarios": {},
+    }
+    with BenchmarkAgent(ports=arguments.ports, vlans=arguments.vlans,
+            ipv4_addresses=arguments.ipv4_addresses, mac_addresses=arguments.mac_addresses, latency=arguments.latency,
+            loss=arguments.loss) as agent:
+        for name, scenario, required_objects in SCENARIOS:
+            if arguments.scenario and name not in arguments.scenario:
+                continue
+            unsupported_objects = [object_name for object_name in required_objects
+                    if not agent.supports(object_name)]
+            if unsupported_objects:
+                # Running the scenario would only measure requests for objects that do not exist
+                reason = "MIB of {0} not available".format(", ".join(unsupported_objects))
+                sys.stderr.write("Skipping {0}: {1}\n".format(name, reason))
+                results["scenarios"][name] = {"skipped": reason}
+                continue
+            results["scenarios"][name] = run_scenario(agent, scenario, arguments.repeat, arguments.timeout)
+
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if arguments.output:
+        with open(arguments.output, "w") as output_file:
+            output_file.write(output + "\n")
+    else:
+        sys.stdout.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
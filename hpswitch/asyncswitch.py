@@ -0,0 +1,804 @@
+# -*- coding: utf-8 -*-
+"""
+Non-blocking access to switches using `asyncio`.
+
+`AsyncSwitch` offers the same operations as `Switch`, but as coroutines, so that a single event loop can keep requests
+to many switches in flight at the same time. Ports and VLANs of an `AsyncSwitch` are `AsyncPort` and `AsyncVLAN`
+objects whose reads and writes are coroutine methods instead of properties.
+"""
+import asyncio
+import contextvars
+import random
+import socket
+import string
+import time
+import weakref
+
+from pysnmp.proto import rfc1902
+
+from hpswitch.mib import mib_registry
+from hpswitch.port import Port, PortSet, PortInstantiationError
+from hpswitch.session import (SNMPError, SNMPTimeoutError, SNMPDeadlineError, SNMPUnavailableError, SNMPSession,
+        RequestEvent, RetransmissionTimer, RetryBudget, CircuitBreaker, SYS_UP_TIME_OID, pMod, build_get_pdu,
+        build_get_bulk_pdu, build_set_pdu, encode_request, decode_response, get_response_varbinds,
+        get_response_varbind_table, notify_observers)
+from hpswitch.switch import Switch, SubtreeWalk
+from hpswitch.traps import TrapProcessor
+from hpswitch.vlan import (VLAN, VLANChangeSet, get_add_ip_address_varbinds, get_ip_interface,
+        get_remove_ip_address_varbinds)
+
+
+class AsyncSNMPSession(object):
+    """
+    A persistent SNMPv2c session with the agent of a single switch that is driven by the `asyncio` event loop.
+
+    Any number of requests may be in flight at the same time; responses are matched to requests by their request ID.
+    Retransmissions, the retry budget, deadlines and the circuit breaker work like in `SNMPSession`.
+    """
+    def __init__(self, hostname, community="public", port=161, timeout=8, retries=5):
+        self.hostname = hostname
+        self.community = community
+        self.port = port
+        self.timeout = timeout
+        self.retries = retries
+
+        self.address = None
+        # Objects whose request_completed method is called with a RequestEvent after each request
+        self.observers = []
+        self.timer = RetransmissionTimer(maximum=timeout)
+        self.retry_budget = RetryBudget()
+        self.circuit_breaker = CircuitBreaker()
+        self._transport = None
+        self._probe_task = None
+        # Holds the deadline of the operation running in each task
+        self._deadline = contextvars.ContextVar("deadline", default=None)
+        self._open_lock = asyncio.Lock()
+        # Maps the IDs of requests awaiting a response to the futures receiving the response PDU
+        self._pending = {}
+        self._request_id = random.randrange(1, 0x7fffffff)
+
+    async def open(self):
+        """
+        Resolve the address of the switch and create the datagram endpoint used for all requests.
+        """
+        async with self._open_lock:
+            if self._transport is None:
+                loop = asyncio.get_running_loop()
+                family, socktype, proto, canonname, address = (await loop.getaddrinfo(
+                        self.hostname, self.port, type=socket.SOCK_DGRAM))[0]
+                self._transport, protocol = await loop.create_datagram_endpoint(
+                        lambda: _SNMPProtocol(self), remote_addr=address)
+                self.address = address
+
+    def close(self):
+        """
+        Close the datagram endpoint of this session. The session is opened again by the next request.
+        """
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+        if self._probe_task is not None:
+            # The next request starts over with a closed circuit breaker
+            self._probe_task.cancel()
+            self._probe_task = None
+            self.circuit_breaker.record_success()
+
+    is_open = property(lambda self: self._transport is not None)
+
+    def _next_request_id(self):
+        # Request IDs are signed 32 bit integers
+        self._request_id = self._request_id % 0x7fffffff + 1
+        return self._request_id
+
+    def _get_deadline(self):
+        return self._deadline.get()
+
+    def _set_deadline(self, deadline):
+        self._deadline.set(deadline)
+
+    deadline = SNMPSession.deadline
+    _get_attempt_timeout = SNMPSession._get_attempt_timeout
+
+    def _response_received(self, data):
+        response_pdu = decode_response(data)
+        if response_pdu is None:
+            return
+        future = self._pending.get(int(pMod.apiPDU.getRequestID(response_pdu)))
+        if future is not None and not future.done():
+            future.set_result((response_pdu, len(data)))
+
+    def _error_received(self, exc):
+        error = SNMPError("Error communicating with {0}: {1}".format(self.hostname, exc))
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(error)
+
+    async def request(self, pdu):
+        """
+        Send the request `pdu` to the switch and wait for the matching response, retransmitting the request on timeout.
+
+        Returns the response PDU.
+        """
+        if self._transport is None:
+            await self.open()
+        if self.circuit_breaker.is_open:
+            raise SNMPUnavailableError("{0} did not answer recently and is not sent requests until it answers a probe"
+                    .format(self.hostname))
+        event = RequestEvent(self.hostname, pdu) if self.observers else None
+        start = time.time()
+        try:
+            response_pdu = await self._request(pdu, event)
+        except SNMPDeadlineError:
+            if event is not None:
+                event.timed_out = True
+            raise
+        except SNMPTimeoutError:
+            if self.circuit_breaker.record_failure():
+                self._probe_task = asyncio.get_running_loop().create_task(self._probe())
+            if event is not None:
+                event.timed_out = True
+            raise
+        except SNMPError as e:
+            if event is not None:
+                event.error = e
+            raise
+        else:
+            self.circuit_breaker.record_success()
+            if event is not None:
+                event.error_status = int(pMod.apiPDU.getErrorStatus(response_pdu))
+            return response_pdu
+        finally:
+            if event is not None:
+                event.latency = time.time() - start
+                notify_observers(self.observers, event)
+
+    async def _request(self, pdu, event, max_attempts=None):
+        request_id = self._next_request_id()
+        request_data = encode_request(self.community, pdu, request_id)
+        self.retry_budget.deposit()
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            attempts = 0
+            for attempt in range(max_attempts or self.retries + 1):
+                timeout, truncated = self._get_attempt_timeout(attempt)
+                if timeout is None:
+                    break
+                if self._transport is None:
+                    raise SNMPError("The session with {0} has been closed".format(self.hostname))
+                sent = time.time()
+                self._transport.sendto(request_data)
+                attempts += 1
+                if event is not None:
+                    event.attempts = attempts
+                    event.request_size = len(request_data)
+                try:
+                    response_pdu, response_size = await asyncio.wait_for(asyncio.shield(future), timeout)
+                except asyncio.TimeoutError:
+                    if truncated:
+                        # See SNMPSession._request
+                        raise SNMPDeadlineError("Deadline passed waiting for a response from {0}".format(
+                                self.hostname))
+                    self.timer.backoff()
+                    continue
+                # Only responses to the first transmission measure the round trip time, see SNMPSession._request
+                if attempt == 0:
+                    self.timer.update(time.time() - sent)
+                if event is not None:
+                    event.response_size = response_size
+                return response_pdu
+            raise SNMPTimeoutError("No response from {0} after {1} attempts".format(self.hostname, attempts))
+        finally:
+            del self._pending[request_id]
+
+    async def _probe(self):
+        """
+        Send a GET request for `sysUpTime` to the switch every `probe_interval` seconds until it answers, then close
+        the circuit breaker.
+        """
+        while self.circuit_breaker.is_open:
+            await asyncio.sleep(self.circuit_breaker.probe_interval)
+            if self._transport is None:
+                # The session was closed, so the next request starts over
+                self.circuit_breaker.record_success()
+                return
+            try:
+                await self._request(build_get_pdu([SYS_UP_TIME_OID]), None, max_attempts=1)
+            except SNMPError:
+                continue
+            self.circuit_breaker.record_success()
+
+    async def get(self, oids):
+        """
+        Perform an SNMP GET request for all `oids`.
+
+        Returns the error status, error index and (oid, value) pairs of the response.
+        """
+        return get_response_varbinds(await self.request(build_get_pdu(oids)))
+
+    async def get_bulk(self, non_repeaters, max_repetitions, oids):
+        """
+        Perform an SNMP GETBULK request for all `oids`.
+
+        Returns the error status, error index and a table of (oid, value) pairs with one row per repetition.
+        """
+        pdu = build_get_bulk_pdu(non_repeaters, max_repetitions, oids)
+        return get_response_varbind_table(pdu, await self.request(pdu))
+
+    async def set(self, varbinds):
+        """
+        Perform an SNMP SET request setting all (oid, value) pairs in `varbinds`.
+
+        Returns the error status, error index and (oid, value) pairs of the response.
+        """
+        return get_response_varbinds(await self.request(build_set_pdu(varbinds)))
+
+
+class _SNMPProtocol(asyncio.DatagramProtocol):
+    def __init__(self, session):
+        self.session = session
+
+    def datagram_received(self, data, address):
+        self.session._response_received(data)
+
+    def error_received(self, exc):
+        self.session._error_received(exc)
+
+
+class AsyncSwitch(object):
+    """
+    Represents a generic HP Networking switch that is accessed without blocking.
+    """
+    max_repetitions = Switch.max_repetitions
+    max_repetitions_limit = Switch.max_repetitions_limit
+    max_message_size = Switch.max_message_size
+    expected_value_size = Switch.expected_value_size
+
+    def __init__(self, hostname, community="public", port=161, timeout=8, retries=5):
+        """
+        Construct a new AsyncSwitch whose SNMP agent is reachable at `hostname` and the UDP port `port`. Requests are
+        retransmitted after `timeout` seconds, at most `retries` times.
+        """
+        self.hostname = hostname
+        self.community = community
+
+        self.mib_registry = mib_registry
+        self.session = AsyncSNMPSession(hostname, community, port=port, timeout=timeout, retries=retries)
+        # The AsyncPort and AsyncVLAN objects of this switch, see intern_object
+        self.interned_objects = weakref.WeakValueDictionary()
+
+    _get_oid_for_managed_object_name = Switch._get_oid_for_managed_object_name
+    _split_oids_for_message_size = Switch._split_oids_for_message_size
+    _get_available_message_size = Switch._get_available_message_size
+    _get_walk_repetitions = Switch._get_walk_repetitions
+    _split_for_message_size = Switch._split_for_message_size
+    _split_varbinds_for_message_size = Switch._split_varbinds_for_message_size
+
+    add_observer = Switch.add_observer
+    remove_observer = Switch.remove_observer
+    deadline = Switch.deadline
+
+    async def open(self):
+        """
+        Resolve the address of the switch and set up the SNMP session used for all requests to it.
+        """
+        await self.session.open()
+        return self
+
+    def close(self):
+        """
+        Release the resources held by the SNMP session of this switch.
+        """
+        self.session.close()
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    async def snmp_get(self, oid):
+        """
+        Perform an SNMP GET request on the switch.
+
+        Returns the value returned by the switch, which is a NoSuchInstance or NoSuchObject value if the object does
+        not exist. Raises SNMPError if the switch reports an error.
+        """
+        return (await self._snmp_get_varbinds([self._get_oid_for_managed_object_name(oid)]))[0]
+
+    async def snmp_get_many(self, oids):
+        """
+        Perform as few SNMP GET requests as possible to get the values of all objects in `oids`. The requests are sent
+        concurrently.
+
+        Returns the values in the order of `oids`.
+        """
+        resolved_oids = [self._get_oid_for_managed_object_name(oid) for oid in oids]
+        results = await asyncio.gather(*[self._snmp_get_varbinds(request_oids)
+                for request_oids in self._split_oids_for_message_size(resolved_oids)])
+        return [value for values in results for value in values]
+
+    async def _snmp_get_varbinds(self, oids):
+        errorStatus, errorIndex, varBinds = await self.session.get(oids)
+        if errorStatus:
+            # tooBig == 1
+            if int(errorStatus) == 1 and len(oids) > 1:
+                half = len(oids) // 2
+                return (await self._snmp_get_varbinds(oids[:half])) + (await self._snmp_get_varbinds(oids[half:]))
+            raise SNMPError(errorStatus.prettyPrint())
+        return [value for oid, value in varBinds]
+
+    async def snmp_set(self, *variables_to_set):
+        """
+        Perform an SNMP SET request on the switch.
+
+        Takes an arbitrary number of (oid, value) pairs as arguments. Raises SNMPError if the switch rejects the
+        request.
+        """
+        errorStatus, errorIndex, varBinds = await self.session.set(
+                [(self._get_oid_for_managed_object_name(oid), value) for (oid, value) in variables_to_set])
+        if errorStatus:
+            raise SNMPError(errorStatus.prettyPrint())
+
+    async def snmp_set_many(self, variables_to_set):
+        """
+        Perform as few SNMP SET requests as possible to set all (oid, value) pairs in `variables_to_set`, like
+        `Switch.snmp_set_many`. The requests are sent one after the other in the given order.
+        """
+        resolved_variables = [(self._get_oid_for_managed_object_name(oid), value) for (oid, value) in variables_to_set]
+        for request_variables in self._split_varbinds_for_message_size(resolved_variables):
+            errorStatus, errorIndex, varBinds = await self.session.set(request_variables)
+            if errorStatus:
+                raise SNMPError(errorStatus.prettyPrint())
+
+    async def snmp_get_subtree(self, oid, max_repetitions=None):
+        """
+        Recursively get all objects that have `oid` as a parent using SNMP GETBULK.
+
+        Returns a list of (oid, value) pairs.
+        """
+        return [row async for row in self.snmp_iter_subtree(oid, max_repetitions)]
+
+    async def snmp_iter_subtree(self, oid, max_repetitions=None):
+        """
+        Recursively walk all objects that have `oid` as a parent using SNMP GETBULK.
+
+        Yields (oid, value) pairs as soon as the response containing them arrives, adapting the number of rows per
+        request like `Switch.snmp_iter_subtree`.
+        """
+        walk = SubtreeWalk(self, [oid], max_repetitions)
+        while True:
+            request = walk.get_request()
+            if request is None:
+                return
+            errorStatus, errorIndex, varBindTable = await self.session.get_bulk(0, *request)
+            for column, row_oid, value in walk.process_response(errorStatus, varBindTable):
+                yield row_oid, value
+
+    async def get_ports(self):
+        """
+        Get all ports of this switch.
+
+        Returns AsyncPort objects.
+        """
+        return [AsyncPort(self, base_port=int(value))
+                async for oid, value in self.snmp_iter_subtree(("dot1dBasePort",))]
+
+    async def get_port_by_alias(self, alias):
+        """
+        Get the port that currently has the friendly name `alias`.
+
+        Unlike `Port(switch, alias=...)`, which looks the alias up in the `PortAliasIndex` of a `Switch`, this walks
+        `ifAlias` on every call, since the index is built with blocking requests. To look up many aliases, walk
+        `ifAlias` once with `snmp_get_subtree` instead.
+        """
+        matching_ifindexes = []
+        async for oid, ifAlias in self.snmp_iter_subtree(("ifAlias", )):
+            if str(ifAlias) == alias:
+                matching_ifindexes.append(oid[-1])
+                if len(matching_ifindexes) > 1:
+                    raise PortInstantiationError("Multiple ports with matching alias exist")
+        if not matching_ifindexes:
+            raise PortInstantiationError("No port with matching alias exists")
+        return AsyncPort(self, base_port=matching_ifindexes[0])
+
+    async def get_vlans(self):
+        """
+        Get all VLANs currently configured on this switch.
+
+        Returns AsyncVLAN objects.
+        """
+        return [AsyncVLAN(self, int(oid[-1]))
+                async for oid, value in self.snmp_iter_subtree(("dot1qVlanStaticRowStatus",))]
+
+    async def create_vlans(self, vids):
+        """
+        Create the VLANs with the VLAN IDs `vids` on the switch unless they are already known there, like
+        `Switch.create_vlans`.
+
+        Returns AsyncVLAN objects.
+        """
+        row_statuses = await self.snmp_get_many([("dot1qVlanStaticRowStatus", vid) for vid in vids])
+        # createAndGo == 4
+        await self.snmp_set_many([(("dot1qVlanStaticRowStatus", vid), rfc1902.Integer(4))
+            for (vid, row_status) in zip(vids, row_statuses) if not bool(row_status)])
+        return [AsyncVLAN(self, vid) for vid in vids]
+
+    def vlan_changes(self, membership=None):
+        """
+        Start a set of VLAN membership changes that are applied together, see `Switch.vlan_changes`.
+
+        Use the returned AsyncVLANChangeSet with `async with`.
+        """
+        return AsyncVLANChangeSet(self, membership)
+
+
+def _get_sync_property(name, replacement):
+    """
+    Get a property replacing the property `name` inherited from the blocking classes, which cannot be used with an
+    `AsyncSwitch`, by an error pointing to the coroutine methods `replacement`.
+    """
+    def fail(self, *args):
+        raise TypeError("{0}.{1} cannot be used with an AsyncSwitch, use {2} instead".format(type(self).__name__,
+                name, replacement))
+    return property(fail, fail)
+
+
+class AsyncPort(Port):
+    """
+    Represents a physical port on a switch accessed through an `AsyncSwitch`.
+
+    Use the coroutine methods of this class instead of the properties of `Port`, which raise TypeError.
+    """
+    __slots__ = ()
+
+    alias = _get_sync_property("alias", "get_alias() and set_alias()")
+    description = _get_sync_property("description", "get_description()")
+    enabled = _get_sync_property("enabled", "get_enabled() and set_enabled()")
+    operational = _get_sync_property("operational", "get_operational()")
+    untagged_vlan = _get_sync_property("untagged_vlan", "get_untagged_vlan()")
+    tagged_vlans = _get_sync_property("tagged_vlans", "get_tagged_vlans()")
+
+    def __new__(cls, switch, identifier=None, base_port=None, alias=None):
+        if identifier is None and base_port is None and alias is not None:
+            # Port looks aliases up in the PortAliasIndex of a Switch, which an AsyncSwitch does not have
+            raise TypeError("AsyncPort cannot be constructed from an alias, use AsyncSwitch.get_port_by_alias() "
+                    "instead")
+        return Port.__new__(cls, switch, identifier, base_port, alias)
+
+    async def get_alias(self):
+        """
+        Get the friendly name configured for this port.
+        """
+        return str(await self.switch.snmp_get(("ifAlias", self.ifindex)))
+
+    async def set_alias(self, value):
+        """
+        Configure the name `value` as the friendly name for this port.
+        """
+        assert(all(map(lambda letter: letter in (string.ascii_letters + string.digits), value)))
+        await self.switch.snmp_set((("ifAlias", self.ifindex), rfc1902.OctetString(value)))
+
+    async def get_description(self):
+        """
+        Get descriptive name for this port.
+        """
+        return str(await self.switch.snmp_get(("ifDescr", self.ifindex)))
+
+    async def get_enabled(self):
+        """
+        Get the admin status of this port.
+        """
+        return int(await self.switch.snmp_get(("ifAdminStatus", self.ifindex))) == 1
+
+    async def set_enabled(self, value):
+        """
+        Set the admin status of this port.
+        """
+        await self.switch.snmp_set((("ifAdminStatus", self.ifindex), rfc1902.Integer(1 if value else 2)))
+
+    async def get_operational(self):
+        """
+        Get the operational status of this port.
+        """
+        return int(await self.switch.snmp_get(("ifOperStatus", self.ifindex))) == 1
+
+    async def get_untagged_vlan(self, membership=None):
+        """
+        Get the untagged VLAN configured on this port, see `Port.get_untagged_vlan`.
+        """
+        if membership is not None:
+            vid = membership.untagged_vlan(self)
+            return None if vid is None else AsyncVLAN(self.switch, vid)
+        untagged_vlan = AsyncVLAN(self.switch, int(await self.switch.snmp_get(("dot1qPvid", self.base_port))))
+        # If no untagged VLAN is configured, dot1qPvid is still DEFAULT_VLAN,
+        # so check if the port is really in the VLAN
+        if self in await untagged_vlan.get_untagged_ports():
+            return untagged_vlan
+        else:
+            return None
+
+    async def get_tagged_vlans(self, membership=None):
+        """
+        Get a list of the tagged VLANs configured on this port, see `Port.get_tagged_vlans`.
+        """
+        if membership is not None:
+            return [AsyncVLAN(self.switch, vid) for vid in membership.tagged_vlans(self)]
+        untagged_vlan = await self.get_untagged_vlan()
+        tagged_vlans = []
+        async for oid, port_list in self.switch.snmp_iter_subtree(("dot1qVlanStaticEgressPorts",)):
+            vlan_id = oid[-1]
+            if (self in PortSet.from_port_list(self.switch, port_list)
+                    and (untagged_vlan is None or vlan_id != untagged_vlan.vid)):
+                tagged_vlans.append(AsyncVLAN(self.switch, vlan_id))
+        return tagged_vlans
+
+
+class AsyncVLAN(VLAN):
+    """
+    Represents a 802.1Q VLAN on a switch accessed through an `AsyncSwitch`.
+
+    Use the coroutine methods of this class instead of the properties of `VLAN`, which raise TypeError. AsyncVLANs
+    cannot be created on the switch on construction, use `create_new` instead.
+    """
+    __slots__ = ()
+
+    exists = _get_sync_property("exists", "get_exists()")
+    name = _get_sync_property("name", "get_name() and set_name()")
+    ipv4_addresses = _get_sync_property("ipv4_addresses", "get_ipv4_addresses()")
+    ipv6_addresses = _get_sync_property("ipv6_addresses", "get_ipv6_addresses()")
+    tagged_ports = _get_sync_property("tagged_ports", "get_tagged_ports()")
+    untagged_ports = _get_sync_property("untagged_ports", "get_untagged_ports()")
+
+    def __init__(self, switch, vid, create=False):
+        if create:
+            raise ValueError("AsyncVLANs cannot be created on construction, use await AsyncVLAN.create_new()")
+
+    @classmethod
+    async def create_new(cls, switch, vid):
+        """
+        Get the AsyncVLAN with the VLAN ID `vid` on `switch`, creating it on the switch unless it is already known
+        there.
+        """
+        vlan = cls(switch, vid)
+        await vlan.create()
+        return vlan
+
+    async def get_exists(self):
+        """
+        Whether the VLAN is known on the switch.
+        """
+        return bool(await self.switch.snmp_get(("dot1qVlanStaticRowStatus", self.vid)))
+
+    async def create(self):
+        """
+        Create the VLAN on the switch unless it is already known there.
+        """
+        await self.switch.create_vlans([self.vid])
+
+    async def get_name(self):
+        """
+        The name configured for the VLAN.
+        """
+        return str(await self.switch.snmp_get(("dot1qVlanStaticName", self.vid)))
+
+    async def set_name(self, value):
+        assert(all(map(lambda illegal_char: illegal_char not in value, "\"\'@#$^&*")))
+        await self.switch.snmp_set((("dot1qVlanStaticName", self.vid), rfc1902.OctetString(value)))
+
+    async def _get_ip_addresses(self, address_type):
+        # InetAddressType ipv4 == 1, ipv6 == 2; the last components of the index are the address
+        return [get_ip_interface(tuple(oid)[-4 if address_type == 1 else -16:], prefix_length)
+                async for (oid, prefix_length)
+                in self.switch.snmp_iter_subtree(("hpicfIpAddressPrefixLength", self.ifindex, address_type))]
+
+    async def get_ipv4_addresses(self):
+        """
+        Get the IPv4 addresses configured for this VLAN.
+        """
+        return await self._get_ip_addresses(1)
+
+    async def get_ipv6_addresses(self):
+        """
+        Get the IPv6 addresses configured for this VLAN.
+        """
+        return await self._get_ip_addresses(2)
+
+    async def add_ipv4_address(self, address):
+        """
+        Add the IPv4Interface `address` to the VLAN.
+        """
+        await self.switch.snmp_set(*get_add_ip_address_varbinds(self.ifindex, address))
+
+    async def remove_ipv4_address(self, address):
+        """
+        Remove the IPv4Interface `address` from the VLAN.
+        """
+        await self.switch.snmp_set(*get_remove_ip_address_varbinds(self.ifindex, address))
+
+    async def add_ipv6_address(self, address):
+        """
+        Add the IPv6Interface `address` to the VLAN.
+        """
+        await self.switch.snmp_set(*get_add_ip_address_varbinds(self.ifindex, address))
+
+    async def remove_ipv6_address(self, address):
+        """
+        Remove the IPv6Interface `address` from the VLAN.
+        """
+        await self.switch.snmp_set(*get_remove_ip_address_varbinds(self.ifindex, address))
+
+    def _get_port_list_enabled_ports(self, port_list):
+        return PortSet.from_port_list(self.switch, port_list, port_class=AsyncPort)
+
+    async def get_tagged_ports(self):
+        """
+        Get a PortSet of ports that have this VLAN configured as tagged.
+        """
+        egress_port_list, untagged_port_list = await self.switch.snmp_get_many([
+                ("dot1qVlanStaticEgressPorts", self.vid), ("dot1qVlanStaticUntaggedPorts", self.vid)])
+        return (self._get_port_list_enabled_ports(egress_port_list)
+                - self._get_port_list_enabled_ports(untagged_port_list))
+
+    async def get_untagged_ports(self):
+        """
+        Get a PortSet of ports that have this VLAN configured as untagged.
+        """
+        return self._get_port_list_enabled_ports(
+                await self.switch.snmp_get(("dot1qVlanStaticUntaggedPorts", self.vid)))
+
+    async def _set_port_tagged_status(self, port, status):
+        egress_port_list = await self.switch.snmp_get(("dot1qVlanStaticEgressPorts", self.vid))
+        new_port_list = VLAN._set_port_list_port_status(egress_port_list, port, status)
+        await self.switch.snmp_set((("dot1qVlanStaticEgressPorts", self.vid), rfc1902.OctetString(new_port_list)))
+
+    async def add_tagged_port(self, port):
+        """
+        Configure this VLAN as tagged on the Port `port`.
+        """
+        await self._set_port_tagged_status(port, True)
+
+    async def remove_tagged_port(self, port):
+        """
+        Remove this VLAN as tagged from the Port `port`.
+        """
+        await self._set_port_tagged_status(port, False)
+
+    async def _set_port_untagged_status(self, port, status):
+        async with self.switch.vlan_changes() as changes:
+            if status:
+                # Also removes the port from the VLAN that it belonged to before and sets the PVID
+                changes.untag(port, self)
+            else:
+                changes.remove(port, self)
+
+    async def add_untagged_port(self, port):
+        """
+        Configure this VLAN as untagged on the Port `port`.
+        """
+        await self._set_port_untagged_status(port, True)
+
+    async def remove_untagged_port(self, port):
+        """
+        Remove this VLAN as untagged from the Port `port`.
+        """
+        await self._set_port_untagged_status(port, False)
+
+
+class AsyncVLANChangeSet(VLANChangeSet):
+    """
+    A set of VLAN membership changes on an `AsyncSwitch` that are committed together, see `VLANChangeSet`.
+
+    Use it with `async with`, or call the coroutine method `commit`.
+    """
+    def __enter__(self):
+        raise TypeError("Use async with to apply an AsyncVLANChangeSet")
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            await self.commit()
+
+    async def _read_state(self):
+        if self.membership is not None:
+            return self._read_membership()
+        base_ports = self._get_pvid_base_ports()
+        pvids = dict(zip(base_ports, [int(pvid) for pvid in await self.switch.snmp_get_many([("dot1qPvid", base_port)
+                for base_port in base_ports])]))
+        vids = self._get_port_list_vids(pvids)
+        port_lists = await self.switch.snmp_get_many([("dot1qVlanStaticEgressPorts", vid) for vid in vids]
+                + [("dot1qVlanStaticUntaggedPorts", vid) for vid in vids])
+        egress_ports, untagged_ports = self._get_port_sets(vids, port_lists)
+        return egress_ports, untagged_ports, pvids
+
+    async def get_varbinds(self):
+        return self._get_varbinds(*(await self._read_state()))
+
+    async def commit(self):
+        """
+        Apply the changes in this change set to the switch.
+        """
+        if self._operations:
+            await self.switch.snmp_set_many(await self.get_varbinds())
+            self._operations = []
+
+
+class AsyncTrapListener(TrapProcessor):
+    """
+    Receives SNMP notifications on a local UDP port using the `asyncio` event loop.
+
+    Subscribers are called from the event loop. TrapEvents can also be consumed by iterating over the listener with
+    `async for`; events are queued for iteration only once iteration has started, and the oldest are dropped when
+    more than `max_queued` are waiting.
+    """
+    port_class = AsyncPort
+    vlan_class = AsyncVLAN
+
+    def __init__(self, switches=(), community="public", host="0.0.0.0", port=162, max_queued=10000,
+            accept_unknown_senders=False):
+        TrapProcessor.__init__(self, switches, community, accept_unknown_senders)
+        self.host = host
+        self.port = port
+        self.max_queued = max_queued
+        self.address = None
+        self._transport = None
+        self._queue = None
+
+    async def start(self):
+        """
+        Start receiving notifications.
+        """
+        loop = asyncio.get_running_loop()
+        self._transport, protocol = await loop.create_datagram_endpoint(lambda: _TrapProtocol(self),
+                local_addr=(self.host, self.port))
+        self.address = self._transport.get_extra_info("sockname")
+        return self
+
+    def stop(self):
+        """
+        Stop receiving notifications and close the socket.
+        """
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+        if self._queue is not None:
+            # Ends running iterations
+            self._queue.put_nowait(None)
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def _datagram_received(self, data, sender):
+        event, response = self.process(data, sender)
+        if response is not None and self._transport is not None:
+            self._transport.sendto(response, sender)
+        if event is not None:
+            self.publish(event)
+            if self._queue is not None:
+                if self._queue.qsize() >= self.max_queued:
+                    self._queue.get_nowait()
+                self._queue.put_nowait(event)
+
+    def __aiter__(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        return self
+
+    async def __anext__(self):
+        event = await self._queue.get()
+        if event is None:
+            raise StopAsyncIteration
+        return event
+
+
+class _TrapProtocol(asyncio.DatagramProtocol):
+    def __init__(self, listener):
+        self.listener = listener
+
+    def datagram_received(self, data, address):
+        self.listener._datagram_received(data, address)
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+import bisect
+import threading
+import time
+from collections import OrderedDict
+
+from pysnmp.proto import rfc1905
+
+from hpswitch.mib import mib_registry
+
+
+class ReadCache(object):
+    """
+    A bounded cache of values read from switches.
+
+    Values are cached by the hostname of the switch they were read from and their OID, so that a cache may be shared by
+    several switches. Values expire after `ttl` seconds, or after the TTL configured for the longest matching OID prefix
+    in `prefix_ttls`, which maps MIB object names such as `("ifAlias", )` to TTLs. A TTL of 0 disables caching for the
+    prefix. `host_ttls` maps hostnames to TTLs that replace `ttl` for the values of those switches, e.g. for switches
+    that are slow to answer or rarely reconfigured; prefix TTLs still apply to them. When more than `max_size` values
+    are cached, the least recently used ones are evicted.
+    """
+    def __init__(self, max_size=4096, ttl=5.0, prefix_ttls=None, host_ttls=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.host_ttls = dict(host_ttls or {})
+        # Longest prefixes first, so that the first match is the most specific one
+        self.prefix_ttls = sorted(((mib_registry.get_oid(prefix), prefix_ttl)
+                for (prefix, prefix_ttl) in (prefix_ttls or {}).items()), key=lambda item: -len(item[0]))
+
+        self._lock = threading.Lock()
+        # Maps (hostname, OID) keys to (expiry time, value) pairs in least recently used order
+        self._entries = OrderedDict()
+        # The keys of all entries in sorted order, so that the entries in the subtree of an OID are next to each other
+        self._keys = []
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_ttl(self, oid, hostname=None):
+        """
+        Get the TTL of the cached value of `oid` on the switch `hostname`.
+        """
+        for prefix, prefix_ttl in self.prefix_ttls:
+            if oid[:len(prefix)] == prefix:
+                return prefix_ttl
+        return self.host_ttls.get(hostname, self.ttl)
+
+    def lookup(self, hostname, oid):
+        """
+        Get the cached value of `oid` on the switch `hostname`, or None if it is not cached or has expired.
+        """
+        key = (hostname, tuple(oid))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires > time.time():
+                    # Mark as most recently used
+                    del self._entries[key]
+                    self._entries[key] = entry
+                    self.hits += 1
+                    return value
+                self._remove(key)
+            self.misses += 1
+            return None
+
+    def store(self, hostname, oid, value):
+        """
+        Cache `value` as the value of `oid` on the switch `hostname`.
+
+        Values telling that an object does not exist are not cached, since the object may be created at any time.
+        """
+        if isinstance(value, (rfc1905.NoSuchObject, rfc1905.NoSuchInstance, rfc1905.EndOfMibView)):
+            return
+        oid = tuple(oid)
+        ttl = self.get_ttl(oid, hostname)
+        if ttl <= 0:
+            return
+        key = (hostname, oid)
+        with self._lock:
+            if self._entries.pop(key, None) is None:
+                bisect.insort(self._keys, key)
+            self._entries[key] = (time.time() + ttl, value)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        del self._entries[key]
+        del self._keys[bisect.bisect_left(self._keys, key)]
+
+    def invalidate(self, hostname, oid):
+        """
+        Drop the cached values of `oid` on the switch `hostname` and of all objects overlapping with it, i.e. in the
+        subtree of `oid` or having `oid` in their subtree.
+
+        Takes time proportional to the length of `oid` and the number of values dropped, not to the size of the cache.
+        """
+        oid = tuple(oid)
+        with self._lock:
+            # Objects having `oid` in their subtree have a prefix of `oid` as their OID
+            for length in range(len(oid)):
+                if (hostname, oid[:length]) in self._entries:
+                    self._remove((hostname, oid[:length]))
+            # The subtree of `oid` starts at `oid` itself in sorted order
+            start = end = bisect.bisect_left(self._keys, (hostname, oid))
+            while end < len(self._keys) and self._keys[end][0] == hostname and self._keys[end][1][:len(oid)] == oid:
+                del self._entries[self._keys[end]]
+                end += 1
+            del self._keys[start:end]
+
+    def clear(self, hostname=None):
+        """
+        Drop all cached values, or only those of the switch `hostname`.
+        """
+        with self._lock:
+            if hostname is None:
+                self._entries.clear()
+                del self._keys[:]
+                return
+            start = end = bisect.bisect_left(self._keys, (hostname, ))
+            while end < len(self._keys) and self._keys[end][0] == hostname:
+                del self._entries[self._keys[end]]
+                end += 1
+            del self._keys[start:end]
+
+    def get_statistics(self):
+        """
+        Get the hit and miss counts of this cache as a dict.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": float(self.hits) / lookups if lookups else 0.0,
+            }
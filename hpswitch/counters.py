@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+import operator
+import time
+from array import array
+from itertools import repeat
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Interface counters polled by default and the width of each counter in bits
+INTERFACE_COUNTERS = (
+    ("ifHCInOctets", 64),
+    ("ifHCOutOctets", 64),
+    ("ifHCInUcastPkts", 64),
+    ("ifHCOutUcastPkts", 64),
+    ("ifInErrors", 32),
+    ("ifOutErrors", 32),
+    ("ifInDiscards", 32),
+    ("ifOutDiscards", 32),
+)
+
+# BER encoded size of a Counter64 value including its header
+COUNTER_VALUE_SIZE = 11
+
+NaN = float("nan")
+
+# Array type used for 64 bit counters; platforms without unsigned long long arrays fall back to doubles
+try:
+    array("Q")
+    COUNTER64_TYPECODE = "Q"
+except ValueError:
+    COUNTER64_TYPECODE = "d"
+
+
+class CounterPoller(object):
+    """
+    Polls the interface counters of all ports of a switch and computes per-port rates.
+
+    Samples are kept in preallocated ring buffers holding the last `history` samples of every counter, with one array
+    per counter indexed by sample slot and port position, so that polling does not allocate per-port objects. Every
+    request asks for `sysUpTime` along with the counters of as many ports as fit into a message, and rates are
+    computed from the uptime of the agent when it answered instead of the time the responses arrived. If NumPy is
+    installed, the rates of all ports of a request are computed with vectorized operations on views of the sample
+    arrays; otherwise they are computed one port at a time in Python. Agent restarts are detected through `sysUpTime`;
+    counters that wrap around between two samples are accounted for according to their width. Counters the switch did
+    not return are marked as missing, and rates over intervals starting or ending with a missing value are NaN.
+
+    To poll many switches at once, run the `poll` methods of their pollers through a `SwitchFleet`.
+    """
+    def __init__(self, switch, ifindexes=None, counters=INTERFACE_COUNTERS, history=16):
+        """
+        Construct a new poller for the counters named in `counters` of the interfaces `ifindexes` on `switch`.
+
+        If `ifindexes` is not given, all ports of the switch are polled.
+        """
+        self.switch = switch
+        if ifindexes is None:
+            ifindexes = [port.ifindex for port in switch.get_ports()]
+        self.ifindexes = list(ifindexes)
+        # Maps ifindexes to their position in the sample arrays
+        self.positions = dict((ifindex, position) for (position, ifindex) in enumerate(self.ifindexes))
+        self.counters = tuple(counters)
+        self.history = history
+
+        # The first and last position of the ports of each request and its OIDs
+        self._requests = self._get_requests()
+
+        port_count = len(self.ifindexes)
+        self.samples = dict((name, array(COUNTER64_TYPECODE if width > 32 else "L", [0]) * (history * port_count))
+                for (name, width) in self.counters)
+        # The positions of the ports whose counters were missing in each slot, by counter
+        self.missing = dict((name, [()] * history) for (name, width) in self.counters)
+        self.timestamps = array("d", [0.0]) * history
+        # sysUpTime of the agent when it answered each request of each sample, in hundredths of a second
+        self.uptimes = array("d", [0.0]) * (history * len(self._requests))
+        # Number of samples taken so far; the latest sample is in slot (sample_count - 1) % history
+        self.sample_count = 0
+        # Number of consecutive samples taken since the last agent restart
+        self.valid_sample_count = 0
+
+    def _get_requests(self):
+        """
+        Split the ports into groups whose counters fit into a single request along with `sysUpTime`.
+        """
+        from hpswitch.switch import _get_encoded_oid_length
+        switch = self.switch
+        get_oid = switch._get_oid_for_managed_object_name
+        # Varbind SEQUENCE, OID and value headers are at most 4 bytes each
+        available_size = (switch._get_available_message_size()
+                - (_get_encoded_oid_length(get_oid(("sysUpTime", 0))) + COUNTER_VALUE_SIZE + 12))
+        port_size = max([sum(_get_encoded_oid_length(get_oid((name, ifindex))) + COUNTER_VALUE_SIZE + 12
+                for (name, width) in self.counters) for ifindex in self.ifindexes] or [1])
+        ports_per_request = max(1, available_size // port_size)
+        requests = []
+        for first in range(0, len(self.ifindexes), ports_per_request):
+            last = min(first + ports_per_request, len(self.ifindexes))
+            requests.append((first, last, [("sysUpTime", 0)] + [(name, ifindex)
+                    for ifindex in self.ifindexes[first:last] for (name, width) in self.counters]))
+        return requests
+
+    def poll(self):
+        """
+        Read all counters of all interfaces from the switch and store them as a new sample.
+        """
+        slot = self.sample_count % self.history
+        previous_slot = (self.sample_count - 1) % self.history
+        port_count = len(self.ifindexes)
+        request_count = len(self._requests)
+        missing = dict((name, []) for (name, width) in self.counters)
+        restarted = False
+
+        for request, (first, last, oids) in enumerate(self._requests):
+            # Counters change all the time, so they are never read from the cache of the switch
+            values = self.switch.snmp_get_many(oids, expected_value_size=COUNTER_VALUE_SIZE, use_cache=False)
+            uptime = _get_int(values[0]) or 0
+            if self.sample_count and uptime < self.uptimes[previous_slot * request_count + request]:
+                # The agent restarted and reset its counters, so older samples cannot be compared to the new ones
+                restarted = True
+            self.uptimes[slot * request_count + request] = uptime
+            values = iter(values[1:])
+            for position in range(first, last):
+                for name, width in self.counters:
+                    value = _get_int(next(values))
+                    if value is None:
+                        missing[name].append(position)
+                        value = 0
+                    self.samples[name][slot * port_count + position] = value
+
+        for name, width in self.counters:
+            self.missing[name][slot] = tuple(missing[name])
+        self.timestamps[slot] = time.time()
+        if restarted:
+            self.valid_sample_count = 0
+        self.sample_count += 1
+        self.valid_sample_count += 1
+
+    def get_rates(self, counter, samples_back=1):
+        """
+        Compute the per-second rates of `counter` for all interfaces between the latest sample and the one taken
+        `samples_back` polls before it.
+
+        Returns an `array("d")` of rates in the order of `ifindexes`, whether or not NumPy is installed. All rates are
+        NaN if not enough samples have been taken since the poller was started or the agent was restarted; rates of
+        interfaces whose counter was missing in either sample are NaN.
+        """
+        port_count = len(self.ifindexes)
+        if samples_back >= min(self.valid_sample_count, self.history):
+            return array("d", [NaN]) * port_count
+        latest_slot = (self.sample_count - 1) % self.history
+        earlier_slot = (self.sample_count - 1 - samples_back) % self.history
+        request_count = len(self._requests)
+
+        modulus = 1 << dict(self.counters)[counter]
+        samples = self.samples[counter]
+        if numpy is not None:
+            # A view of the samples without copying them
+            samples = numpy.frombuffer(samples, dtype=samples.typecode)
+            rates = numpy.empty(port_count)
+        else:
+            rates = array("d")
+        for request, (first, last, oids) in enumerate(self._requests):
+            # sysUpTime is in hundredths of a second
+            elapsed = (self.uptimes[latest_slot * request_count + request]
+                    - self.uptimes[earlier_slot * request_count + request]) / 100.0
+            latest = samples[latest_slot * port_count + first:latest_slot * port_count + last]
+            earlier = samples[earlier_slot * port_count + first:earlier_slot * port_count + last]
+            if numpy is not None:
+                rates[first:last] = _get_numpy_rates(latest, earlier, modulus, elapsed)
+            elif elapsed <= 0:
+                rates.extend(array("d", [NaN]) * (last - first))
+            else:
+                # Per-port loop; the modulo accounts for counters that wrapped around since the earlier sample
+                deltas = map(operator.mod, map(operator.sub, latest, earlier), repeat(modulus))
+                rates.extend(map(operator.truediv, deltas, repeat(elapsed)))
+        for position in set(self.missing[counter][latest_slot]).union(self.missing[counter][earlier_slot]):
+            rates[position] = NaN
+        if numpy is not None:
+            # Same memory layout, so this is a single copy
+            return array("d", rates.tobytes())
+        return rates
+
+    def get_rate(self, port, counter, samples_back=1):
+        """
+        Compute the per-second rate of `counter` on `port`, see `get_rates`.
+        """
+        return self.get_rates(counter, samples_back)[self.positions[port.ifindex]]
+
+    def run(self, interval, count=None):
+        """
+        Poll the switch every `interval` seconds, `count` times or forever.
+        """
+        next_poll = time.time()
+        polls = 0
+        while True:
+            self.poll()
+            polls += 1
+            if count is not None and polls >= count:
+                return
+            next_poll += interval
+            time.sleep(max(0, next_poll - time.time()))
+
+
+def _get_numpy_rates(latest, earlier, modulus, elapsed):
+    """
+    Compute the per-second rates between the NumPy arrays of counter samples `latest` and `earlier`, taken `elapsed`
+    seconds apart, of counters that wrap around at `modulus`.
+    """
+    if elapsed <= 0:
+        return NaN
+    if latest.dtype.kind == "u":
+        # Unsigned subtraction wraps around at the width of the array type, a multiple of the counter width
+        deltas = latest - earlier
+        if modulus < 1 << (8 * latest.dtype.itemsize):
+            deltas %= modulus
+    else:
+        deltas = numpy.mod(latest - earlier, float(modulus))
+    return deltas / elapsed
+
+
+def _get_int(value):
+    """
+    Convert a counter value to an integer, or None for objects missing on the switch.
+    """
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent import futures
+
+from hpswitch.switch import Switch
+
+
+class FleetResult(object):
+    """
+    The outcome of running an operation on a single switch of a `SwitchFleet`.
+    """
+    def __init__(self, switch, value=None, error=None, elapsed=0.0):
+        self.switch = switch
+        self.value = value
+        self.error = error
+        # Wall time taken by the operation in seconds, including time spent waiting for the switch to become available
+        self.elapsed = elapsed
+
+    hostname = property(lambda self: self.switch.hostname)
+
+    ok = property(lambda self: self.error is None)
+
+    def __repr__(self):
+        if self.ok:
+            return "<FleetResult {0}: {1!r} in {2:.3f}s>".format(self.hostname, self.value, self.elapsed)
+        return "<FleetResult {0}: error {1!r} in {2:.3f}s>".format(self.hostname, self.error, self.elapsed)
+
+
+class SwitchFleet(object):
+    """
+    A set of switches on which operations are run concurrently.
+
+    At most `max_workers` operations are in flight across the fleet and at most `max_per_switch` on any single switch.
+    Operations on a switch that is busy wait in a queue of that switch and are only handed to a worker thread once the
+    switch has a free slot, so that they do not take up worker threads other switches could use.
+    If `deadline` is given, the SNMP requests of each operation on a switch are given up after `deadline` seconds in
+    total, so that unreachable switches cannot hold up a run for long. Switches that were found unreachable fail fast
+    until they answer again, see `SNMPSession`.
+    """
+    def __init__(self, hostnames, community="public", port=161, max_workers=64, max_per_switch=1, timeout=8,
+            retries=5, switch_class=Switch, communities=None, deadline=None):
+        """
+        Construct a new fleet of the switches in `hostnames`, whose SNMP agents are reachable at the UDP port `port`.
+
+        `communities` maps hostnames to the community of their switch; switches not in it use `community`.
+        """
+        communities = communities or {}
+        self.switches = OrderedDict(
+                (hostname, switch_class(hostname, communities.get(hostname, community), port=port, timeout=timeout,
+                    retries=retries))
+                for hostname in hostnames)
+        self.max_workers = max_workers
+        self.deadline = deadline
+        self.max_per_switch = max_per_switch
+        # Guards the queues and counts below and is notified whenever a switch has no operations left
+        self._condition = threading.Condition()
+        # Operations waiting for a free slot on their switch and the number of operations in flight, by hostname
+        self._queued = dict((hostname, deque()) for hostname in self.switches)
+        self._running = dict((hostname, 0) for hostname in self.switches)
+        self._executor = None
+
+    def _get_executor(self):
+        with self._condition:
+            if self._executor is None:
+                self._executor = futures.ThreadPoolExecutor(max_workers=self.max_workers)
+            return self._executor
+
+    def close(self):
+        """
+        Wait for the operations in flight, then stop the worker threads and close the sessions of all switches.
+        """
+        with self._condition:
+            # Operations that finish hand their slot to the next queued operation, which needs the executor
+            self._condition.wait_for(lambda: not any(self._running.values()))
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        for switch in self.switches.values():
+            switch.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @staticmethod
+    def _call(switch, operation, args, kwargs):
+        if callable(operation):
+            return operation(switch, *args, **kwargs)
+        return getattr(switch, operation)(*args, **kwargs)
+
+    def _schedule(self, switch, operation, args, kwargs):
+        """
+        Run `operation` on `switch` as soon as the switch has a free slot.
+
+        Returns a Future receiving the FleetResult.
+        """
+        job = (futures.Future(), switch, operation, args, kwargs, time.time())
+        with self._condition:
+            if self._running[switch.hostname] >= self.max_per_switch:
+                self._queued[switch.hostname].append(job)
+                return job[0]
+            self._running[switch.hostname] += 1
+        self._get_executor().submit(self._run_job, job)
+        return job[0]
+
+    def _run_job(self, job):
+        future, switch, operation, args, kwargs, start = job
+        if future.set_running_or_notify_cancel():
+            future.set_result(self._run_on_switch(switch, operation, args, kwargs, start))
+        # Hand the slot on to the next operation queued for the switch
+        with self._condition:
+            queue = self._queued[switch.hostname]
+            next_job = queue.popleft() if queue else None
+            if next_job is None:
+                self._running[switch.hostname] -= 1
+                self._condition.notify_all()
+        if next_job is not None:
+            self._executor.submit(self._run_job, next_job)
+
+    def _run_on_switch(self, switch, operation, args, kwargs, start):
+        try:
+            if self.deadline is None:
+                value = self._call(switch, operation, args, kwargs)
+            else:
+                with switch.deadline(self.deadline):
+                    value = self._call(switch, operation, args, kwargs)
+        except Exception as e:
+            return FleetResult(switch, error=e, elapsed=time.time() - start)
+        return FleetResult(switch, value=value, elapsed=time.time() - start)
+
+    def run(self, operation, args=(), kwargs=None, hostnames=None):
+        """
+        Run `operation` on all switches of the fleet, or on those in `hostnames`.
+
+        `operation` is either the name of a `Switch` method, which is called with `args` and `kwargs`, or a callable
+        that is called with the switch followed by `args` and `kwargs`.
+
+        Yields a FleetResult for each switch as soon as the operation has completed on it. Errors raised by the
+        operation are reported in the results instead of being raised.
+        """
+        kwargs = kwargs or {}
+        switches = [self.switches[hostname] for hostname in (hostnames or self.switches)]
+        pending = [self._schedule(switch, operation, args, kwargs) for switch in switches]
+        for future in futures.as_completed(pending):
+            yield future.result()
+
+    def run_all(self, operation, args=(), kwargs=None, hostnames=None):
+        """
+        Run `operation` like `run` and wait for it to complete on all switches.
+
+        Returns a dict mapping hostnames to FleetResults.
+        """
+        return dict((result.hostname, result) for result in self.run(operation, args, kwargs, hostnames))
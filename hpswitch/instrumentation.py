@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+import threading
+
+# Number of bits of precision of the histogram buckets: each power of two is divided into 2 ** SUB_BUCKET_BITS buckets,
+# so recorded values are accurate to about 6%
+SUB_BUCKET_BITS = 4
+SUB_BUCKET_COUNT = 1 << SUB_BUCKET_BITS
+
+# Upper bounds in seconds of the buckets exported in the Prometheus text format
+PROMETHEUS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class LatencyHistogram(object):
+    """
+    A histogram of latencies with logarithmically sized buckets of constant relative precision.
+
+    Latencies are recorded in microseconds. Values below `SUB_BUCKET_COUNT` get a bucket each; above, each power of two
+    is split into `SUB_BUCKET_COUNT` buckets of equal width.
+    """
+    def __init__(self):
+        # Maps bucket indexes to counts
+        self.counts = {}
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    @staticmethod
+    def _get_bucket_index(microseconds):
+        if microseconds < SUB_BUCKET_COUNT:
+            return microseconds
+        exponent = microseconds.bit_length() - SUB_BUCKET_BITS - 1
+        return (exponent + 1) * SUB_BUCKET_COUNT + (microseconds >> exponent) - SUB_BUCKET_COUNT
+
+    @staticmethod
+    def _get_bucket_upper_bound(index):
+        """
+        Get the smallest number of microseconds that is not counted in the bucket with the given `index`.
+        """
+        if index < SUB_BUCKET_COUNT:
+            return index + 1
+        exponent = index // SUB_BUCKET_COUNT - 1
+        return (index % SUB_BUCKET_COUNT + SUB_BUCKET_COUNT + 1) << exponent
+
+    def record(self, seconds):
+        """
+        Record a latency of `seconds`.
+        """
+        index = LatencyHistogram._get_bucket_index(int(seconds * 1000000))
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += seconds
+        self.maximum = max(self.maximum, seconds)
+
+    def get_percentile(self, percentile):
+        """
+        Get the latency in seconds below which `percentile` percent of the recorded latencies are.
+        """
+        if not self.count:
+            return 0.0
+        threshold = self.count * percentile / 100.0
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= threshold:
+                return min(LatencyHistogram._get_bucket_upper_bound(index) / 1000000.0, self.maximum)
+        return self.maximum
+
+    def get_cumulative_counts(self, upper_bounds):
+        """
+        Get the number of recorded latencies up to each of the `upper_bounds` in seconds.
+        """
+        cumulative_counts = []
+        indexes = sorted(self.counts)
+        position = 0
+        seen = 0
+        for upper_bound in upper_bounds:
+            while (position < len(indexes)
+                    and LatencyHistogram._get_bucket_upper_bound(indexes[position]) <= upper_bound * 1000000):
+                seen += self.counts[indexes[position]]
+                position += 1
+            cumulative_counts.append(seen)
+        return cumulative_counts
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "max": self.maximum,
+            "p50": self.get_percentile(50),
+            "p90": self.get_percentile(90),
+            "p99": self.get_percentile(99),
+        }
+
+
+class _Counters(object):
+    def __init__(self):
+        self.requests = 0
+        self.varbinds = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.request_bytes = 0
+        self.response_bytes = 0
+
+    def as_dict(self):
+        return dict(self.__dict__)
+
+
+class RequestStatistics(object):
+    """
+    Counts and latency histograms of the SNMP requests sent to the switches this object observes.
+
+    Add it to any number of switches using `Switch.add_observer`. Requests, retries, timeouts, errors and bytes are
+    counted per switch, operation and MIB object; latencies are recorded in a histogram per switch and operation. Both
+    can be exported as a dict or in the Prometheus text format.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Maps (hostname, operation, object name) to _Counters
+        self.counters = {}
+        # Maps (hostname, operation) to LatencyHistograms
+        self.histograms = {}
+
+    def request_completed(self, event):
+        key = (event.hostname, event.operation)
+        counters_key = key + (event.object_name, )
+        with self._lock:
+            counters = self.counters.get(counters_key)
+            if counters is None:
+                counters = self.counters[counters_key] = _Counters()
+            counters.requests += 1
+            counters.varbinds += event.varbind_count
+            counters.retries += event.retries
+            counters.timeouts += 1 if event.timed_out else 0
+            counters.errors += 1 if (event.error is not None or event.error_status != 0) else 0
+            counters.request_bytes += event.request_size * event.attempts
+            counters.response_bytes += event.response_size
+
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = LatencyHistogram()
+            histogram.record(event.latency)
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}
+            self.histograms = {}
+
+    def as_dict(self):
+        """
+        Export the statistics as a dict mapping hostnames to operations to their counters per MIB object and their
+        latency summary.
+        """
+        statistics = {}
+        with self._lock:
+            for (hostname, operation, object_name), counters in self.counters.items():
+                operation_statistics = statistics.setdefault(hostname, {}).setdefault(operation, {"objects": {}})
+                operation_statistics["objects"][object_name] = counters.as_dict()
+            for (hostname, operation), histogram in self.histograms.items():
+                statistics[hostname][operation]["latency"] = histogram.as_dict()
+        return statistics
+
+    def to_prometheus(self, prefix="hpswitch_snmp"):
+        """
+        Export the statistics in the Prometheus text exposition format.
+        """
+        lines = []
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items())
+        for field in ("requests", "varbinds", "retries", "timeouts", "errors", "request_bytes", "response_bytes"):
+            name = "{0}_{1}_total".format(prefix, field)
+            lines.append("# TYPE {0} counter".format(name))
+            for (hostname, operation, object_name), values in counters:
+                lines.append('{0}{{switch="{1}",operation="{2}",object="{3}"}} {4}'.format(
+                        name, _escape(hostname), operation, _escape(object_name), getattr(values, field)))
+
+        name = "{0}_request_duration_seconds".format(prefix)
+        lines.append("# TYPE {0} histogram".format(name))
+        for (hostname, operation), histogram in histograms:
+            labels = 'switch="{0}",operation="{1}"'.format(_escape(hostname), operation)
+            for upper_bound, cumulative_count in zip(PROMETHEUS_BUCKETS,
+                    histogram.get_cumulative_counts(PROMETHEUS_BUCKETS)):
+                lines.append('{0}_bucket{{{1},le="{2}"}} {3}'.format(name, labels, upper_bound, cumulative_count))
+            lines.append('{0}_bucket{{{1},le="+Inf"}} {2}'.format(name, labels, histogram.count))
+            lines.append("{0}_sum{{{1}}} {2}".format(name, labels, histogram.total))
+            lines.append("{0}_count{{{1}}} {2}".format(name, labels, histogram.count))
+        return "\n".join(lines) + "\n"
+
+
+def _escape(label_value):
+    return str(label_value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+import binascii
+import bisect
+from array import array
+from collections import namedtuple
+from itertools import compress
+
+from pysnmp.proto import rfc1902
+
+# dot1qTpFdbStatus values
+FDB_STATUS_OTHER = 1
+FDB_STATUS_INVALID = 2
+FDB_STATUS_LEARNED = 3
+FDB_STATUS_SELF = 4
+FDB_STATUS_MGMT = 5
+
+# Array type holding 48 bit MAC addresses; platforms without unsigned long long arrays fall back to doubles, which
+# represent all 48 bit integers exactly
+try:
+    array("Q")
+    MAC_TYPECODE = "Q"
+except ValueError:
+    MAC_TYPECODE = "d"
+
+MACEntry = namedtuple("MACEntry", ("mac", "vid", "base_port", "status"))
+
+
+def parse_mac(mac):
+    """
+    Convert a MAC address given as an integer, 6 octets or a string such as `"00:11:22:aa:bb:cc"`,
+    `"0011.22aa.bbcc"` or `"00-11-22-AA-BB-CC"` to an integer.
+    """
+    if isinstance(mac, int):
+        return mac
+    if isinstance(mac, (bytes, bytearray)) and len(mac) == 6:
+        return int(binascii.hexlify(mac), 16)
+    digits = "".join(character for character in mac if character not in ":-.")
+    if len(digits) != 12:
+        raise ValueError("Invalid MAC address {0!r}".format(mac))
+    return int(digits, 16)
+
+
+def format_mac(mac):
+    """
+    Format the integer `mac` as a MAC address such as `"00:11:22:aa:bb:cc"`.
+    """
+    digits = "{0:012x}".format(int(mac))
+    return ":".join(digits[position:position + 2] for position in range(0, 12, 2))
+
+
+class MACTable(object):
+    """
+    The forwarding database of a switch, built from `dot1qTpFdbTable`.
+
+    Use `Switch.mac_table` to read the table. Entries are stored in parallel arrays sorted by MAC address instead of
+    per-entry objects: a 48 bit integer for the MAC address, the VLAN ID, the base port and the status of each entry.
+    Lookups by MAC address use binary search; the entries of a port or VLAN are found through arrays of positions that
+    are built on first use.
+
+    With shared VLAN learning, several VLANs use the same filtering database, so an address learned there is reachable
+    in all of them. The table then holds an entry for each of these VLANs.
+    """
+    def __init__(self, switch, fid_vids=None):
+        """
+        Construct an empty table for `switch`. `fid_vids` maps filtering database IDs to tuples of the IDs of the VLANs
+        using them; FIDs that are not mapped are taken to be VLAN IDs, as is the case with independent VLAN learning.
+        """
+        self.switch = switch
+        self.fid_vids = fid_vids or {}
+        self.macs = array(MAC_TYPECODE)
+        self.vids = array("H")
+        self.base_ports = array("H")
+        self.statuses = array("B")
+        # Maps FIDs to their dot1qFdbDynamicCount when the entries of the FID were last read
+        self.dynamic_counts = {}
+        self._port_positions = None
+        self._vid_positions = None
+
+    @classmethod
+    def read(cls, switch, fids=None):
+        """
+        Read the forwarding database of `switch`, or only the entries of the filtering databases `fids`.
+        """
+        table = cls(switch, _read_fid_vids(switch))
+        table.dynamic_counts = _read_dynamic_counts(switch)
+        table._replace(fids, switch.iter_mac_table(fids))
+        return table
+
+    def __len__(self):
+        return len(self.macs)
+
+    def _get_entry(self, position):
+        return MACEntry(format_mac(self.macs[position]), self.vids[position], self.base_ports[position],
+                self.statuses[position])
+
+    def __iter__(self):
+        """
+        Iterate over MACEntries ordered by MAC address.
+        """
+        for position in range(len(self.macs)):
+            yield self._get_entry(position)
+
+    def _get_fid_vids(self, fid):
+        return self.fid_vids.get(fid, (fid, ))
+
+    def _replace(self, fids, entries):
+        """
+        Replace all entries, or those in the filtering databases `fids`, by the (FID, MAC, base port, status) tuples
+        in `entries`.
+        """
+        columns = (self.macs, self.vids, self.base_ports, self.statuses)
+        if fids is None:
+            columns = [array(column.typecode) for column in columns]
+        else:
+            vids = set(vid for fid in fids for vid in self._get_fid_vids(fid))
+            kept = [vid not in vids for vid in self.vids]
+            columns = [array(column.typecode, compress(column, kept)) for column in columns]
+        macs, entry_vids, base_ports, statuses = columns
+        for fid, mac, base_port, status in entries:
+            for vid in self._get_fid_vids(fid):
+                macs.append(mac)
+                entry_vids.append(vid)
+                base_ports.append(base_port)
+                statuses.append(status)
+
+        # Sort a permutation of the positions by VLAN ID and then, as the sort is stable, by MAC address, so that the
+        # parallel arrays are reordered without building a tuple per entry
+        order = list(range(len(macs)))
+        order.sort(key=entry_vids.__getitem__)
+        order.sort(key=macs.__getitem__)
+        self.macs, self.vids, self.base_ports, self.statuses = [array(column.typecode, map(column.__getitem__, order))
+                for column in columns]
+        self._port_positions = None
+        self._vid_positions = None
+
+    def refresh(self, vids=None):
+        """
+        Read the entries of the VLANs `vids` again, or of all filtering databases whose number of dynamic entries has
+        changed since they were last read.
+
+        Entries moving between ports without changing the number of entries in their filtering database are not
+        noticed by the latter kind of refresh; read the table again with `Switch.mac_table` to catch those.
+
+        Returns the FIDs that were read again.
+        """
+        if vids is not None:
+            vid_fids = dict((vid, fid) for (fid, fid_vids) in self.fid_vids.items() for vid in fid_vids)
+            fids = sorted(set(vid_fids.get(vid, vid) for vid in vids))
+            # The counts are read before the entries, so that a later refresh notices entries changed in between
+            for fid in fids:
+                self.dynamic_counts.pop(fid, None)
+            self.dynamic_counts.update(_read_dynamic_counts(self.switch, fids))
+        else:
+            dynamic_counts = _read_dynamic_counts(self.switch)
+            fids = sorted(fid for fid in set(dynamic_counts) | set(self.dynamic_counts)
+                    if dynamic_counts.get(fid) != self.dynamic_counts.get(fid))
+            self.dynamic_counts = dynamic_counts
+        if fids:
+            # Walk the FIDs one by one, so that unchanged filtering databases are skipped
+            self._replace(fids, (entry for fid in fids for entry in self.switch.iter_mac_table([fid])))
+        return fids
+
+    def find(self, mac):
+        """
+        Get the MACEntries of the MAC address `mac` in all VLANs.
+        """
+        value = parse_mac(mac)
+        position = bisect.bisect_left(self.macs, value)
+        entries = []
+        while position < len(self.macs) and self.macs[position] == value:
+            entries.append(self._get_entry(position))
+            position += 1
+        return entries
+
+    def __contains__(self, mac):
+        value = parse_mac(mac)
+        position = bisect.bisect_left(self.macs, value)
+        return position < len(self.macs) and self.macs[position] == value
+
+    @staticmethod
+    def _build_positions(values):
+        positions = {}
+        for position, value in enumerate(values):
+            value_positions = positions.get(value)
+            if value_positions is None:
+                value_positions = positions[value] = array("L")
+            value_positions.append(position)
+        return positions
+
+    def get_entries(self, port=None, vlan=None):
+        """
+        Get the MACEntries learned on `port`, given as Port object or base port, in `vlan`, given as VLAN object or
+        VLAN ID, or both.
+        """
+        positions = None
+        if port is not None:
+            if self._port_positions is None:
+                self._port_positions = MACTable._build_positions(self.base_ports)
+            base_port = port if isinstance(port, int) else port.base_port
+            positions = self._port_positions.get(base_port, ())
+        if vlan is not None:
+            if self._vid_positions is None:
+                self._vid_positions = MACTable._build_positions(self.vids)
+            vid = vlan if isinstance(vlan, int) else vlan.vid
+            vid_positions = self._vid_positions.get(vid, ())
+            positions = vid_positions if positions is None else sorted(set(positions) & set(vid_positions))
+        if positions is None:
+            positions = range(len(self.macs))
+        return [self._get_entry(position) for position in positions]
+
+    def get_port(self, mac, vlan=None):
+        """
+        Get the Port on which `mac` was learned, in `vlan` if given, or None if it is not in the table.
+        """
+        from hpswitch.port import Port
+        vid = vlan if vlan is None or isinstance(vlan, int) else vlan.vid
+        for entry in self.find(mac):
+            if entry.base_port and (vid is None or entry.vid == vid):
+                return Port(self.switch, base_port=entry.base_port)
+        return None
+
+
+def _read_fid_vids(switch):
+    """
+    Map the filtering database IDs of `switch` to tuples of the IDs of the VLANs using them, from `dot1qVlanFdbId`.
+
+    FIDs only used by the VLAN with the same ID are left out.
+    """
+    fid_vids = {}
+    # Indexed by dot1qVlanTimeMark and dot1qVlanIndex
+    for oid, fid in switch.snmp_iter_subtree(("dot1qVlanFdbId", )):
+        fid_vids.setdefault(int(fid), []).append(int(oid[-1]))
+    return dict((fid, tuple(sorted(vids))) for (fid, vids) in fid_vids.items() if vids != [fid])
+
+
+def _read_dynamic_counts(switch, fids=None):
+    """
+    Map the filtering database IDs of `switch`, or only `fids`, to their `dot1qFdbDynamicCount`.
+
+    FIDs that do not exist on the switch are left out.
+    """
+    if fids is None:
+        return dict((int(oid[-1]), int(count))
+                for (oid, count) in switch.snmp_iter_subtree(("dot1qFdbDynamicCount", )))
+    if not fids:
+        return {}
+    # The counts change all the time, so they are never read from the cache of the switch
+    counts = switch.snmp_get_many([("dot1qFdbDynamicCount", fid) for fid in fids], use_cache=False)
+    return dict((fid, int(count)) for (fid, count) in zip(fids, counts) if isinstance(count, rfc1902.Counter32))
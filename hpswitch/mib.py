@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+import sys
+import threading
+
+from pysnmp.smi import builder, view, error
+
+# MIB modules that define the managed objects used by `hpswitch`, in the order in which they are tried when a name is
+# not known yet. Modules are only loaded when a name is looked up that is not defined in any module loaded so far.
+MIB_MODULES = ('IF-MIB', 'BRIDGE-MIB', 'Q-BRIDGE-MIB', 'RFC1213-MIB', 'IP-MIB', 'IP-FORWARD-MIB', 'LLDP-MIB',
+        'HP-ICF-IPCONFIG')
+
+# OIDs of managed objects whose MIB module may not be installed, used when none of the modules defines the name
+FALLBACK_OIDS = {
+    # IP-FORWARD-MIB ipCidrRouteTable and inetCidrRouteTable
+    'ipCidrRouteProto': (1, 3, 6, 1, 2, 1, 4, 24, 4, 1, 7),
+    'ipCidrRouteStatus': (1, 3, 6, 1, 2, 1, 4, 24, 4, 1, 16),
+    'inetCidrRouteProto': (1, 3, 6, 1, 2, 1, 4, 24, 7, 1, 9),
+    'inetCidrRouteStatus': (1, 3, 6, 1, 2, 1, 4, 24, 7, 1, 17),
+    # LLDP-MIB lldpLocalSystemData, lldpLocPortTable, lldpRemTable and lldpRemManAddrTable
+    'lldpLocChassisIdSubtype': (1, 0, 8802, 1, 1, 2, 1, 3, 1),
+    'lldpLocChassisId': (1, 0, 8802, 1, 1, 2, 1, 3, 2),
+    'lldpLocSysName': (1, 0, 8802, 1, 1, 2, 1, 3, 3),
+    'lldpLocPortIdSubtype': (1, 0, 8802, 1, 1, 2, 1, 3, 7, 1, 2),
+    'lldpLocPortId': (1, 0, 8802, 1, 1, 2, 1, 3, 7, 1, 3),
+    'lldpRemChassisIdSubtype': (1, 0, 8802, 1, 1, 2, 1, 4, 1, 1, 4),
+    'lldpRemChassisId': (1, 0, 8802, 1, 1, 2, 1, 4, 1, 1, 5),
+    'lldpRemPortIdSubtype': (1, 0, 8802, 1, 1, 2, 1, 4, 1, 1, 6),
+    'lldpRemPortId': (1, 0, 8802, 1, 1, 2, 1, 4, 1, 1, 7),
+    'lldpRemPortDesc': (1, 0, 8802, 1, 1, 2, 1, 4, 1, 1, 8),
+    'lldpRemSysName': (1, 0, 8802, 1, 1, 2, 1, 4, 1, 1, 9),
+    'lldpRemManAddrIfSubtype': (1, 0, 8802, 1, 1, 2, 1, 4, 2, 1, 3),
+}
+
+
+class MibRegistry(object):
+    """
+    A process-wide registry translating MIB object names to OIDs.
+
+    MIB modules are parsed lazily and at most once, no matter how many `Switch` objects use the registry. Resolved
+    names are memoized, so translating a name such as `("dot1qPvid", 12)` into an OID is a dictionary lookup and a
+    tuple concatenation once the name has been seen.
+    """
+    def __init__(self, modules=MIB_MODULES, fallback_oids=FALLBACK_OIDS):
+        self.modules = tuple(modules)
+        self.fallback_oids = dict(fallback_oids)
+        self._lock = threading.RLock()
+        self._mib_builder = None
+        self._mib_view_controller = None
+        self._loaded_modules = set()
+        # Maps a managed object name to the OID of the object
+        self._oids = {}
+        # Maps OIDs to managed object names, built from `_oids` on demand
+        self._names = {}
+
+    def _get_mib_builder(self):
+        with self._lock:
+            if self._mib_builder is None:
+                mib_builder = builder.MibBuilder()
+                mib_builder.setMibPath(*(mib_builder.getMibPath() + (sys.path[0],)))
+                self._mib_builder = mib_builder
+            return self._mib_builder
+
+    mib_builder = property(_get_mib_builder)
+
+    def _get_mib_view_controller(self):
+        with self._lock:
+            if self._mib_view_controller is None:
+                self._mib_view_controller = view.MibViewController(self.mib_builder)
+            return self._mib_view_controller
+
+    mib_view_controller = property(_get_mib_view_controller)
+
+    def load_modules(self, *modules):
+        """
+        Load the MIB modules `modules` unless they have been loaded before.
+        """
+        with self._lock:
+            missing_modules = [module for module in modules if module not in self._loaded_modules]
+            if missing_modules:
+                self.mib_builder.loadModules(*missing_modules)
+                self._loaded_modules.update(missing_modules)
+
+    def _resolve_name(self, name):
+        """
+        Look up the OID of the managed object `name`, loading further MIB modules until one of them defines it.
+
+        Names that no module defines are looked up in `fallback_oids`.
+        """
+        with self._lock:
+            if name in self._oids:
+                return self._oids[name]
+            modules_to_try = [None] + [module for module in self.modules if module not in self._loaded_modules]
+            for module in modules_to_try:
+                if module is not None:
+                    self.load_modules(module)
+                try:
+                    oid, label, suffix = self.mib_view_controller.getNodeName((name, ))
+                except error.SmiError:
+                    continue
+                self._oids[name] = tuple(oid) + tuple(suffix)
+                return self._oids[name]
+            if name in self.fallback_oids:
+                self._oids[name] = self.fallback_oids[name]
+                return self._oids[name]
+            raise error.SmiError('No MIB object named {0} in {1}'.format(name, self.modules))
+
+    def get_oid(self, name):
+        """
+        Translate a MIB object name such as `("ifAlias", 5)` to an OID tuple.
+
+        Names consisting only of numeric components are returned unchanged.
+        """
+        if not name or not isinstance(name[0], str):
+            return tuple(name)
+        oid = self._oids.get(name[0])
+        if oid is None:
+            oid = self._resolve_name(name[0])
+        return oid + tuple(name[1:])
+
+    def get_name(self, oid):
+        """
+        Get the name of the managed object that `oid` belongs to among the names resolved so far.
+
+        Returns the numeric OID as a dotted string if no resolved name matches.
+        """
+        if len(self._names) != len(self._oids):
+            with self._lock:
+                self._names = dict((object_oid, name) for (name, object_oid) in self._oids.items())
+        for length in range(len(oid), 0, -1):
+            name = self._names.get(tuple(oid[:length]))
+            if name is not None:
+                return name
+        return ".".join(str(arc) for arc in oid)
+
+
+# The registry shared by all switches in this process
+mib_registry = MibRegistry()
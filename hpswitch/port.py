@@ -1,5 +1,8 @@
 # -*- coding: utf-8 -*-
+import binascii
 import string
+import threading
+import time
 
 from pysnmp.proto import rfc1902
 
@@ -7,73 +10,240 @@ def get_port_list_enabled_ports(switch, port_list):
     """
     Return a list of Ports corresponding to the ports marked as enabled in the given `port_list`.
     """
+    return list(PortSet.from_port_list(switch, port_list))
 
-    enabled_ports = []
-    byte_count = 0
-    for byte in port_list:
-        for bit in range(0, 8):
-            # Mask the byte with a bit field with only the bit we are interested in set
-            if (ord(byte) & (1 << (7 - bit))) != 0:
-                enabled_ports.append(Port(switch, base_port=byte_count * 8 + (bit + 1)))
-        byte_count += 1
-    return enabled_ports
+
+# Translation table reversing the order of the bits in a byte. In a PortList, the most significant bit of the first
+# byte stands for the first port, while in a PortSet bitmap the least significant bit does.
+_REVERSED_BITS = bytes(bytearray(int("{0:08b}".format(byte)[::-1], 2) for byte in range(256)))
+
+
+# Guards the interned_objects of all switches, whose WeakValueDictionaries do not insert atomically
+_intern_lock = threading.Lock()
+
+
+def intern_object(cls, switch, key, **attributes):
+    """
+    Get the object of class `cls` identified by `key` on `switch`, creating it with the given `attributes` if it does
+    not exist yet.
+
+    Switches keep the Port and VLAN objects created for them in their `interned_objects` WeakValueDictionary, so that
+    there is only one object per base port or VLAN ID and class as long as the object is in use. Objects nobody refers
+    to any more, such as those of deleted VLANs, are dropped from the dictionary.
+    """
+    interned_objects = getattr(switch, "interned_objects", None)
+    if interned_objects is not None:
+        interned_object = interned_objects.get((cls, key))
+        if interned_object is not None:
+            return interned_object
+    interned_object = object.__new__(cls)
+    # Interned objects refuse to rebind their identifying attributes, so these are set past their __setattr__
+    object.__setattr__(interned_object, "switch", switch)
+    for name, value in attributes.items():
+        object.__setattr__(interned_object, name, value)
+    if interned_objects is None:
+        return interned_object
+    with _intern_lock:
+        # Another thread may have created the object in the meantime
+        return interned_objects.setdefault((cls, key), interned_object)
+
+
+class PortSet(object):
+    """
+    A set of ports on a switch, stored as a bitmap in an integer.
+
+    Bit n of the bitmap is set if the port with base port n + 1 is in the set. Membership tests are a single bit test
+    and set operations as well as the conversion from and to the `PortList` octet strings of the Q-BRIDGE-MIB work on
+    the whole bitmap at once, so no Port object is created unless the set is iterated.
+    """
+    def __init__(self, switch, base_ports=(), size=0, port_class=None):
+        """
+        Construct a new PortSet on `switch` containing the ports with the given `base_ports`.
+
+        `size` is the minimum length in bytes of the port list generated from this set. Iterating the set yields
+        instances of `port_class`, which defaults to `Port`.
+        """
+        self.switch = switch
+        self.size = size
+        self.port_class = port_class or Port
+        self.bits = 0
+        for base_port in base_ports:
+            self.bits |= 1 << (base_port - 1)
+
+    @classmethod
+    def from_port_list(cls, switch, port_list, port_class=None):
+        """
+        Construct a new PortSet on `switch` containing the ports marked as enabled in the given `port_list`.
+        """
+        if hasattr(port_list, "asOctets"):
+            port_list = port_list.asOctets()
+        port_set = cls(switch, size=len(port_list), port_class=port_class)
+        if port_list:
+            port_set.bits = int(binascii.hexlify(port_list.translate(_REVERSED_BITS)[::-1]), 16)
+        return port_set
+
+    def to_port_list(self, size=None):
+        """
+        Return the port list octet string marking the ports in this set as enabled.
+
+        The port list is at least `size` bytes long, which defaults to the size this set was constructed with.
+        """
+        size = max(size or self.size, (self.bits.bit_length() + 7) // 8)
+        if size == 0:
+            return b""
+        return binascii.unhexlify("{0:0{1}x}".format(self.bits, size * 2))[::-1].translate(_REVERSED_BITS)
+
+    def _copy_with_bits(self, bits, other=None):
+        port_set = PortSet(self.switch, size=max(self.size, other.size if other is not None else 0),
+                port_class=self.port_class)
+        port_set.bits = bits
+        return port_set
+
+    def copy(self):
+        return self._copy_with_bits(self.bits)
+
+    @staticmethod
+    def _get_base_port(port):
+        return port if isinstance(port, int) else port.base_port
+
+    def add(self, port):
+        """
+        Add `port`, which is either a Port or a base port number, to this set.
+        """
+        self.bits |= 1 << (PortSet._get_base_port(port) - 1)
+
+    def discard(self, port):
+        """
+        Remove `port`, which is either a Port or a base port number, from this set if it is a member.
+        """
+        self.bits &= ~(1 << (PortSet._get_base_port(port) - 1))
+
+    def __contains__(self, port):
+        return (self.bits >> (PortSet._get_base_port(port) - 1)) & 1 == 1
+
+    def __len__(self):
+        return bin(self.bits).count("1")
+
+    def __nonzero__(self):
+        return self.bits != 0
+
+    __bool__ = __nonzero__
+
+    def base_ports(self):
+        """
+        Iterate over the base port numbers of the ports in this set in ascending order.
+        """
+        bits = self.bits
+        while bits:
+            # Isolate the lowest set bit
+            lowest_bit = bits & -bits
+            yield lowest_bit.bit_length()
+            bits ^= lowest_bit
+
+    def __iter__(self):
+        for base_port in self.base_ports():
+            yield self.port_class(self.switch, base_port=base_port)
+
+    def __or__(self, other):
+        return self._copy_with_bits(self.bits | other.bits, other)
+
+    def __and__(self, other):
+        return self._copy_with_bits(self.bits & other.bits, other)
+
+    def __sub__(self, other):
+        return self._copy_with_bits(self.bits & ~other.bits, other)
+
+    def __xor__(self, other):
+        return self._copy_with_bits(self.bits ^ other.bits, other)
+
+    def __eq__(self, other):
+        return isinstance(other, PortSet) and self.switch == other.switch and self.bits == other.bits
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __repr__(self):
+        return "PortSet({0})".format(list(self.base_ports()))
+
+
+# Port attributes that can be read in bulk using `Switch.get_port_attributes`, mapping the attribute name to the
+# MIB object holding it and a function converting the value of that object.
+PORT_ATTRIBUTES = {
+    "alias": ("ifAlias", lambda ifAlias: str(ifAlias)),
+    "description": ("ifDescr", lambda ifDescr: str(ifDescr)),
+    # ifAdminStatus 1 means up
+    "enabled": ("ifAdminStatus", lambda ifAdminStatus: int(ifAdminStatus) == 1),
+    "operational": ("ifOperStatus", lambda ifOperStatus: int(ifOperStatus) == 1),
+}
 
 
 class Port(object):
     """
     Represents a physical port on a switch.
+
+    Ports are immutable value objects that are interned per switch, so constructing a Port for a base port that an
+    object already exists for returns that object.
     """
-    def __init__(self, switch, identifier=None, base_port=None, alias=None):
+    __slots__ = ("switch", "base_port", "__weakref__")
+
+    def __new__(cls, switch, identifier=None, base_port=None, alias=None):
         """
         Construct a new Port with the given `identifier`, `base_port` or current `alias` located on the given `switch`.
         """
-        self.switch = switch
         # If an indentifier was given, infer the port index
         if identifier != None:
             unit = string.ascii_uppercase.index(identifier[0].upper())
             port = int(identifier[1:])
-            self.base_port = unit * 24 + port
-        elif base_port != None:
-            self.base_port = base_port
-        elif alias != None:
-            # Get all aliases and look for the interface with the given alias
-            ifAliases = self.switch.snmp_get_subtree(("ifAlias", ))
-            # ifAliases is index by ifIndex, which is the same as dot1dBasePort for Ports
-            matching_ifindexes = map(lambda oid: oid[0][-1],
-                    filter(
-                        lambda result: unicode(result[1]) == alias,
-                        ifAliases)
-                    )
+            base_port = unit * 24 + port
+        elif base_port == None and alias != None:
+            # Look up the interface with the given alias in the alias index of the switch
+            # ifAlias is indexed by ifIndex, which is the same as dot1dBasePort for Ports
+            matching_ifindexes = switch.alias_index.get_ifindexes(alias)
             if len(matching_ifindexes) > 1:
                 raise PortInstantiationError("Multiple ports with matching alias exist")
             elif len(matching_ifindexes) == 1:
-                self.base_port = matching_ifindexes[0]
+                base_port = matching_ifindexes[0]
             elif len(matching_ifindexes) == 0:
                 raise PortInstantiationError("No port with matching alias exists")
-        else:
+        elif base_port == None:
             raise PortInstantiationError("Port insufficiently specified")
+        return intern_object(cls, switch, base_port, base_port=base_port)
+
+    def __init__(self, switch, identifier=None, base_port=None, alias=None):
+        # All attributes are set by __new__
+        pass
 
     def __unicode__(self):
         return u"{0} on {1}".format(self.identifier, self.switch.hostname)
 
     def __eq__(self, other):
-        return self.switch == other.switch and self.base_port == other.base_port
+        return (isinstance(other, Port) and self.switch == other.switch
+                and self.base_port == other.base_port)
 
     def __ne__(self, other):
         return not self.__eq__(other)
 
+    def __hash__(self):
+        return hash((self.switch, self.base_port))
+
+    def __setattr__(self, name, value):
+        # Rebinding the attributes that identify an interned Port would change its hash and alias other users
+        if name in ("switch", "base_port"):
+            raise AttributeError("Cannot change the {0} of a Port".format(name))
+        object.__setattr__(self, name, value)
+
     # Index of the interface that this port is a member of.
     ifindex = property(lambda self: self.base_port)
 
     # Port identifier corresponding to chassis labeling on the switch
-    identifier = property(lambda self: string.ascii_uppercase[self.base_port / 24] + unicode(self.base_port % 24))
+    identifier = property(lambda self: string.ascii_uppercase[self.base_port // 24] + str(self.base_port % 24))
 
     def _get_alias(self):
         """
         Get the friendly name configured for this port.
         """
         ifAlias = self.switch.snmp_get(("ifAlias", self.ifindex))
-        return unicode(ifAlias)
+        return str(ifAlias)
 
     def _set_alias(self, value):
         """
@@ -84,6 +254,7 @@ class Port(object):
         assert(all(map(lambda letter: letter in (string.ascii_letters + string.digits), value)))
         # Set the new alias on the switch
         self.switch.snmp_set((("ifAlias", self.ifindex), rfc1902.OctetString(value)))
+        self.switch.alias_index.update(self.ifindex, value)
 
 
     alias = property(_get_alias, _set_alias)
@@ -93,7 +264,7 @@ class Port(object):
         Get descriptive name for this port.
         """
         ifDescr = self.switch.snmp_get(("ifDescr", self.ifindex))
-        return unicode(ifDescr)
+        return str(ifDescr)
 
     description = property(_get_description)
 
@@ -122,12 +293,18 @@ class Port(object):
 
     operational = property(_get_operational)
 
-    def _get_untagged_vlan(self):
+    def get_untagged_vlan(self, membership=None):
         """
         Get the untagged VLAN configured on this port.
+
+        If a VLANMembership snapshot taken with `Switch.vlan_membership` is given, the VLAN is looked up in the
+        snapshot instead of being read from the switch.
         """
         # Import vlan.VLAN here to avoid circular import
-        from vlan import VLAN
+        from hpswitch.vlan import VLAN
+        if membership is not None:
+            vid = membership.untagged_vlan(self)
+            return None if vid is None else VLAN(self.switch, vid)
         untagged_vlan = VLAN(self.switch, int(self.switch.snmp_get(("dot1qPvid", self.base_port))))
         # If no untagged VLAN is configured, dot1qPvid is still DEFAULT_VLAN,
         # so check if the port is really in the VLAN
@@ -136,14 +313,19 @@ class Port(object):
         else:
             return None
 
-    untagged_vlan = property(_get_untagged_vlan)
+    untagged_vlan = property(get_untagged_vlan)
 
-    def _get_tagged_vlans(self):
+    def get_tagged_vlans(self, membership=None):
         """
         Get a list of the tagged VLANs configured on this port.
+
+        Without a VLANMembership snapshot, this walks the egress port lists of all VLANs. To get the VLANs of many
+        ports, take a snapshot with `Switch.vlan_membership` once and pass it as `membership` for each port.
         """
-        from vlan import VLAN
-        egress_ports = self.switch.snmp_get_subtree(("dot1qVlanStaticEgressPorts",))
+        from hpswitch.vlan import VLAN
+        if membership is not None:
+            return [VLAN(self.switch, vid) for vid in membership.tagged_vlans(self)]
+        egress_ports = self.switch.snmp_iter_subtree(("dot1qVlanStaticEgressPorts",))
         tagged_vlans = []
         untagged_vlan = self.untagged_vlan
 
@@ -151,13 +333,116 @@ class Port(object):
             oid, port_list = egress_port
             vlan_id = oid[-1]
 
-            for port in get_port_list_enabled_ports(self.switch, port_list):
-                if self == port and (untagged_vlan is None or vlan_id != untagged_vlan.vid):
-                    tagged_vlans.append(VLAN(self.switch, vlan_id))
+            if (self in PortSet.from_port_list(self.switch, port_list)
+                    and (untagged_vlan is None or vlan_id != untagged_vlan.vid)):
+                tagged_vlans.append(VLAN(self.switch, vlan_id))
 
         return tagged_vlans
 
-    tagged_vlans = property(_get_tagged_vlans)
+    tagged_vlans = property(get_tagged_vlans)
+
+
+class PortAliasIndex(object):
+    """
+    An index of the friendly names of all ports on a switch.
+
+    The index is built from a single walk of `ifAlias` and rebuilt once it is older than `ttl` seconds. Looking up an
+    alias that is not indexed rebuilds the index as well, unless it is younger than `miss_refresh_interval` seconds,
+    so that aliases configured since are found while lookups of unknown aliases cannot cause a walk each. Ports without
+    an alias are not indexed. The index may be used from several threads at once; only one of them rebuilds it.
+    """
+    def __init__(self, switch, ttl=300, miss_refresh_interval=10):
+        self.switch = switch
+        self.ttl = ttl
+        self.miss_refresh_interval = miss_refresh_interval
+        self.built_at = None
+        self._lock = threading.RLock()
+        # Maps aliases to the ifindexes of the ports having them
+        self._ifindexes = {}
+        # Maps ifindexes to aliases
+        self._aliases = {}
+
+    def refresh(self):
+        """
+        Rebuild the index from the aliases currently configured on the switch.
+
+        Returns the duplicates found, see `duplicates`.
+        """
+        with self._lock:
+            ifindexes = {}
+            aliases = {}
+            for oid, ifAlias in self.switch.snmp_iter_subtree(("ifAlias", )):
+                alias = str(ifAlias)
+                if alias:
+                    ifindexes.setdefault(alias, []).append(oid[-1])
+                    aliases[oid[-1]] = alias
+            self._ifindexes = ifindexes
+            self._aliases = aliases
+            self.built_at = time.time()
+            return self.duplicates
+
+    def _refresh_if_stale(self):
+        if self.built_at is None or time.time() - self.built_at > self.ttl:
+            self.refresh()
+
+    def _refresh_on_miss(self, aliases):
+        if (any(alias not in self._ifindexes for alias in aliases)
+                and time.time() - self.built_at > self.miss_refresh_interval):
+            self.refresh()
+
+    def _get_duplicates(self):
+        with self._lock:
+            return dict((alias, list(ifindexes)) for (alias, ifindexes) in self._ifindexes.items()
+                    if len(ifindexes) > 1)
+
+    duplicates = property(_get_duplicates,
+            doc="A dict mapping aliases used by more than one port to the ifindexes of these ports.")
+
+    def get_ifindexes(self, alias):
+        """
+        Get a list of the ifindexes of all ports with the friendly name `alias`.
+        """
+        with self._lock:
+            self._refresh_if_stale()
+            self._refresh_on_miss([alias])
+            return list(self._ifindexes.get(alias, ()))
+
+    def get_alias(self, ifindex):
+        """
+        Get the friendly name of the port with the given `ifindex`, or None if it has none.
+        """
+        with self._lock:
+            self._refresh_if_stale()
+            return self._aliases.get(ifindex)
+
+    def resolve(self, aliases):
+        """
+        Look up the ports with the friendly names `aliases` at once.
+
+        Returns a dict mapping each alias to its Port, or to None if no port or more than one port has the alias.
+        """
+        with self._lock:
+            self._refresh_if_stale()
+            self._refresh_on_miss(aliases)
+            ifindexes = dict((alias, list(self._ifindexes.get(alias, ()))) for alias in aliases)
+        return dict((alias, Port(self.switch, base_port=alias_ifindexes[0]) if len(alias_ifindexes) == 1 else None)
+                for (alias, alias_ifindexes) in ifindexes.items())
+
+    def update(self, ifindex, alias):
+        """
+        Record that the port with the given `ifindex` now has the friendly name `alias`.
+        """
+        with self._lock:
+            if self.built_at is None:
+                return
+            previous_alias = self._aliases.pop(ifindex, None)
+            if previous_alias is not None:
+                self._ifindexes[previous_alias].remove(ifindex)
+                if not self._ifindexes[previous_alias]:
+                    del self._ifindexes[previous_alias]
+            if alias:
+                self._aliases[ifindex] = alias
+                self._ifindexes.setdefault(alias, []).append(ifindex)
 
 
 class PortInstantiationError(Exception):
@@ -15,6 +15,19 @@ class Route(object):
     def __str__(self):
         return str(self.destination) + " via " + str(self.gateway)
 
+    def __repr__(self):
+        return "<{0} {1}>".format(type(self).__name__, self)
+
+    def __eq__(self, other):
+        return (isinstance(other, Route) and self.destination == other.destination
+                and self.gateway == other.gateway)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash((self.destination, self.gateway))
+
 
 class IPv4Route(Route):
     pass
@@ -22,3 +35,152 @@ class IPv4Route(Route):
 
 class IPv6Route(Route):
     pass
+
+
+class _RouteTableNode(object):
+    __slots__ = ("children", "routes")
+
+    def __init__(self):
+        # The subtrees for a 0 and a 1 as the next bit of the destination network
+        self.children = [None, None]
+        # Routes whose destination network ends at this node
+        self.routes = []
+
+
+class RouteTable(object):
+    """
+    A set of routes indexed by a binary trie over the bits of their destination networks.
+
+    Finding the routes to a network, the route serving an address and the routes overlapping a network takes time
+    proportional to the prefix length instead of the number of routes. All routes must be of the same IP version.
+    """
+    def __init__(self, routes=()):
+        self._root = _RouteTableNode()
+        self._length = 0
+        for route in routes:
+            self.add(route)
+
+    @staticmethod
+    def _get_bits(network):
+        """
+        Yield the bits of the network address of `network` up to its prefix length.
+        """
+        address = int(network.network_address)
+        for position in range(network.max_prefixlen - 1, network.max_prefixlen - 1 - network.prefixlen, -1):
+            yield (address >> position) & 1
+
+    def _find_node(self, network, create=False):
+        node = self._root
+        for bit in RouteTable._get_bits(network):
+            child = node.children[bit]
+            if child is None:
+                if not create:
+                    return None
+                child = node.children[bit] = _RouteTableNode()
+            node = child
+        return node
+
+    def add(self, route):
+        """
+        Add `route` unless an identical route is already in the table.
+
+        Returns whether the route was added.
+        """
+        node = self._find_node(route.destination, create=True)
+        if route in node.routes:
+            return False
+        node.routes.append(route)
+        self._length += 1
+        return True
+
+    def remove(self, route):
+        """
+        Remove `route` from the table, raising KeyError if it is not in the table.
+
+        Nodes left without routes and children are pruned, so that the trie does not keep growing as routes come and
+        go.
+        """
+        # The nodes on the path to the destination network and the bits leading to them
+        path = []
+        node = self._root
+        for bit in RouteTable._get_bits(route.destination):
+            path.append((node, bit))
+            node = node.children[bit]
+            if node is None:
+                raise KeyError(route)
+        if route not in node.routes:
+            raise KeyError(route)
+        node.routes.remove(route)
+        self._length -= 1
+        while path and not node.routes and node.children == [None, None]:
+            node, bit = path.pop()
+            node.children[bit] = None
+
+    def discard(self, route):
+        """
+        Remove `route` from the table if it is in the table.
+        """
+        try:
+            self.remove(route)
+        except KeyError:
+            pass
+
+    def __contains__(self, route):
+        node = self._find_node(route.destination)
+        return node is not None and route in node.routes
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        return self._iter_subtree(self._root)
+
+    def _iter_subtree(self, node):
+        # Iterate depth-first without recursion, so that routes are yielded in order of their destination networks
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            for route in node.routes:
+                yield route
+            for child in reversed(node.children):
+                if child is not None:
+                    stack.append(child)
+
+    def get_routes(self, destination):
+        """
+        Get the routes to exactly the network `destination`.
+        """
+        node = self._find_node(destination)
+        return list(node.routes) if node is not None else []
+
+    def lookup(self, address):
+        """
+        Get the routes with the longest destination network containing `address`, or an empty list if there is none.
+        """
+        network = ipaddress.ip_network(address)
+        node = self._root
+        routes = node.routes
+        for bit in RouteTable._get_bits(network):
+            node = node.children[bit]
+            if node is None:
+                break
+            if node.routes:
+                routes = node.routes
+        return list(routes)
+
+    def get_overlapping_routes(self, network):
+        """
+        Get the routes whose destination network contains `network` or is contained in it.
+        """
+        routes = list(self._root.routes)
+        node = self._root
+        for bit in RouteTable._get_bits(network):
+            node = node.children[bit]
+            if node is None:
+                return routes
+            routes.extend(node.routes)
+        # Routes to networks within `network` as well; those to `network` itself have been added already
+        for child in node.children:
+            if child is not None:
+                routes.extend(self._iter_subtree(child))
+        return routes
@@ -0,0 +1,554 @@
+# -*- coding: utf-8 -*-
+import random
+import socket
+import threading
+import time
+
+from pyasn1.codec.ber import encoder, decoder
+from pysnmp.proto import api
+
+# All requests are sent using SNMPv2c
+pMod = api.protoModules[api.protoVersion2c]
+
+# sysUpTime.0, requested to probe whether a switch answers
+SYS_UP_TIME_OID = (1, 3, 6, 1, 2, 1, 1, 3, 0)
+
+
+class SNMPSession(object):
+    """
+    A persistent SNMPv2c session with the agent of a single switch.
+
+    The address of the switch is resolved and the UDP socket is created once when the session is opened, so that
+    subsequent requests only need to encode, send and receive their messages.
+
+    Requests are retransmitted after an adaptive timeout derived from the round trip times measured on this session,
+    bounded by `timeout`, and at most `retries` times as long as the retry budget of the session allows. Once the
+    switch has failed to answer several requests in a row, the circuit breaker of the session makes further requests
+    fail immediately while the switch is probed in the background until it answers again.
+
+    Sessions may be shared by threads, which may have any number of requests in flight at the same time. One thread at
+    a time reads responses from the socket and hands them over to the threads waiting for them by their request ID.
+    """
+    def __init__(self, hostname, community="public", port=161, timeout=8, retries=5):
+        self.hostname = hostname
+        self.community = community
+        self.port = port
+        self.timeout = timeout
+        self.retries = retries
+
+        self.address = None
+        # Objects whose request_completed method is called with a RequestEvent after each request
+        self.observers = []
+        self.timer = RetransmissionTimer(maximum=timeout)
+        self.retry_budget = RetryBudget()
+        self.circuit_breaker = CircuitBreaker()
+        self._socket = None
+        self._lock = threading.Lock()
+        # Notified whenever a thread has stopped reading from the socket
+        self._received = threading.Condition(self._lock)
+        # Whether a thread is reading from the socket
+        self._receiving = False
+        # Maps the IDs of requests awaiting a response to the response PDU and size, or None until it arrives
+        self._responses = {}
+        self._request_id = random.randrange(1, 0x7fffffff)
+        # Holds the deadline of the operation running in each thread
+        self._local = threading.local()
+
+    def open(self):
+        """
+        Resolve the address of the switch and create the socket used for all requests.
+        """
+        with self._lock:
+            if self._socket is None:
+                family, socktype, proto, canonname, address = socket.getaddrinfo(
+                        self.hostname, self.port, 0, socket.SOCK_DGRAM)[0]
+                self._socket = socket.socket(family, socket.SOCK_DGRAM)
+                # Connecting the socket makes the kernel drop datagrams from anyone but the switch
+                self._socket.connect(address)
+                self.address = address
+
+    def close(self):
+        """
+        Close the socket of this session. The session is opened again by the next request.
+        """
+        with self._lock:
+            if self._socket is not None:
+                self._socket.close()
+                self._socket = None
+
+    is_open = property(lambda self: self._socket is not None)
+
+    def _next_request_id(self):
+        # Request IDs are signed 32 bit integers
+        self._request_id = self._request_id % 0x7fffffff + 1
+        return self._request_id
+
+    def _get_deadline(self):
+        return getattr(self._local, "deadline", None)
+
+    def _set_deadline(self, deadline):
+        self._local.deadline = deadline
+
+    def deadline(self, seconds):
+        """
+        Limit the time taken by all requests made within a `with` block to `seconds` in total.
+
+        Requests that would run past the deadline are given up early with an SNMPTimeoutError. Nested deadlines never
+        extend the deadline of the enclosing block.
+        """
+        return OperationDeadline(self, seconds)
+
+    def _get_attempt_timeout(self, attempt):
+        """
+        Get the time to wait for a response to attempt number `attempt` of a request and whether the deadline of the
+        current operation cut that time short, or (None, False) if the retry budget does not allow another attempt.
+
+        Raises SNMPDeadlineError if the deadline has passed.
+        """
+        timeout = self.timer.rto
+        deadline = self._get_deadline()
+        remaining = None if deadline is None else deadline - time.time()
+        if remaining is not None and remaining <= 0:
+            raise SNMPDeadlineError("Deadline passed before sending a request to {0}".format(self.hostname))
+        # Retransmissions cut short by the deadline are still retransmissions, so they are paid for like any other
+        if attempt > 0 and not self.retry_budget.withdraw():
+            return None, False
+        if remaining is not None and remaining < timeout:
+            return remaining, True
+        return timeout, False
+
+    def request(self, pdu):
+        """
+        Send the request `pdu` to the switch and wait for the matching response, retransmitting the request on timeout.
+
+        Returns the response PDU.
+        """
+        if self._socket is None:
+            self.open()
+        if self.circuit_breaker.is_open:
+            raise SNMPUnavailableError("{0} did not answer recently and is not sent requests until it answers a probe"
+                    .format(self.hostname))
+        event = RequestEvent(self.hostname, pdu) if self.observers else None
+        start = time.time()
+        try:
+            response_pdu = self._request(pdu, event)
+        except SNMPDeadlineError:
+            if event is not None:
+                event.timed_out = True
+            raise
+        except SNMPTimeoutError:
+            if self.circuit_breaker.record_failure():
+                self._start_probe()
+            if event is not None:
+                event.timed_out = True
+            raise
+        except SNMPError as e:
+            if event is not None:
+                event.error = e
+            raise
+        else:
+            self.circuit_breaker.record_success()
+            if event is not None:
+                event.error_status = int(pMod.apiPDU.getErrorStatus(response_pdu))
+            return response_pdu
+        finally:
+            if event is not None:
+                event.latency = time.time() - start
+                notify_observers(self.observers, event)
+
+    def _request(self, pdu, event, max_attempts=None):
+        with self._lock:
+            if self._socket is None:
+                raise SNMPError("The session with {0} has been closed".format(self.hostname))
+            request_id = self._next_request_id()
+            self._responses[request_id] = None
+            self.retry_budget.deposit()
+        request_data = encode_request(self.community, pdu, request_id)
+        try:
+            attempts = 0
+            for attempt in range(max_attempts or self.retries + 1):
+                with self._lock:
+                    timeout, truncated = self._get_attempt_timeout(attempt)
+                    sock = self._socket
+                if timeout is None:
+                    break
+                if sock is None:
+                    raise SNMPError("The session with {0} has been closed".format(self.hostname))
+                sent = time.time()
+                try:
+                    sock.send(request_data)
+                except socket.error as e:
+                    raise SNMPError("Error communicating with {0}: {1}".format(self.hostname, e))
+                attempts += 1
+                response_pdu, response_size = self._receive(request_id, sent + timeout)
+                if event is not None:
+                    event.attempts = attempts
+                    event.request_size = len(request_data)
+                    event.response_size = response_size
+                if response_pdu is not None:
+                    # Responses to retransmitted requests cannot be matched to a transmission, so only responses to
+                    # the first one are used to measure the round trip time
+                    if attempt == 0:
+                        with self._lock:
+                            self.timer.update(time.time() - sent)
+                    return response_pdu
+                if truncated:
+                    # Not waiting the full timeout says nothing about the switch, so neither back off nor count the
+                    # request against the circuit breaker
+                    raise SNMPDeadlineError("Deadline passed waiting for a response from {0}".format(self.hostname))
+                with self._lock:
+                    self.timer.backoff()
+            raise SNMPTimeoutError("No response from {0} after {1} attempts".format(self.hostname, attempts))
+        finally:
+            with self._lock:
+                del self._responses[request_id]
+
+    def _start_probe(self):
+        thread = threading.Thread(target=self._probe, name="SNMP probe {0}".format(self.hostname))
+        thread.daemon = True
+        thread.start()
+
+    def _probe(self):
+        """
+        Send a GET request for `sysUpTime` to the switch every `probe_interval` seconds until it answers, then close
+        the circuit breaker.
+        """
+        while self.circuit_breaker.is_open:
+            time.sleep(self.circuit_breaker.probe_interval)
+            if self._socket is None:
+                # The session was closed, so the next request starts over
+                self.circuit_breaker.record_success()
+                return
+            try:
+                self._request(build_get_pdu([SYS_UP_TIME_OID]), None, max_attempts=1)
+            except SNMPError:
+                continue
+            self.circuit_breaker.record_success()
+
+    def _receive(self, request_id, deadline):
+        """
+        Wait until `deadline` for the response to the request with the ID `request_id`.
+
+        Returns the response PDU and the size of the response message, or (None, 0) if no response arrived in time.
+        Unless another thread is reading from the socket already, responses are read from the socket and handed over
+        to the threads waiting for them. Responses to requests that are no longer waited for are discarded.
+        """
+        with self._received:
+            while True:
+                response = self._responses[request_id]
+                if response is not None:
+                    return response
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None, 0
+                if self._receiving:
+                    self._received.wait(remaining)
+                    continue
+                sock = self._socket
+                if sock is None:
+                    raise SNMPError("The session with {0} has been closed".format(self.hostname))
+                self._receiving = True
+                self._lock.release()
+                try:
+                    response_pdu, response_size = self._read_response(sock, remaining)
+                finally:
+                    self._lock.acquire()
+                    self._receiving = False
+                    self._received.notify_all()
+                if response_pdu is not None:
+                    response_id = int(pMod.apiPDU.getRequestID(response_pdu))
+                    if self._responses.get(response_id, False) is None:
+                        self._responses[response_id] = (response_pdu, response_size)
+
+    def _read_response(self, sock, timeout):
+        """
+        Read a message from `sock` for up to `timeout` seconds.
+
+        Returns the response PDU and the size of the message, or (None, 0) if no valid message arrived in time.
+        """
+        sock.settimeout(timeout)
+        try:
+            response_data = sock.recv(65535)
+        except socket.timeout:
+            return None, 0
+        except socket.error as e:
+            raise SNMPError("Error communicating with {0}: {1}".format(self.hostname, e))
+        response_pdu = decode_response(response_data)
+        if response_pdu is None:
+            return None, 0
+        return response_pdu, len(response_data)
+
+    def get(self, oids):
+        """
+        Perform an SNMP GET request for all `oids`.
+
+        Returns the error status, error index and (oid, value) pairs of the response.
+        """
+        return get_response_varbinds(self.request(build_get_pdu(oids)))
+
+    def get_bulk(self, non_repeaters, max_repetitions, oids):
+        """
+        Perform an SNMP GETBULK request for all `oids`.
+
+        Returns the error status, error index and a table of (oid, value) pairs with one row per repetition.
+        """
+        pdu = build_get_bulk_pdu(non_repeaters, max_repetitions, oids)
+        return get_response_varbind_table(pdu, self.request(pdu))
+
+    def set(self, varbinds):
+        """
+        Perform an SNMP SET request setting all (oid, value) pairs in `varbinds`.
+
+        Returns the error status, error index and (oid, value) pairs of the response.
+        """
+        return get_response_varbinds(self.request(build_set_pdu(varbinds)))
+
+
+def build_get_pdu(oids):
+    pdu = pMod.GetRequestPDU()
+    pMod.apiPDU.setDefaults(pdu)
+    pMod.apiPDU.setVarBinds(pdu, [(oid, pMod.Null('')) for oid in oids])
+    return pdu
+
+
+def build_get_bulk_pdu(non_repeaters, max_repetitions, oids):
+    pdu = pMod.GetBulkRequestPDU()
+    pMod.apiBulkPDU.setDefaults(pdu)
+    pMod.apiBulkPDU.setNonRepeaters(pdu, non_repeaters)
+    pMod.apiBulkPDU.setMaxRepetitions(pdu, max_repetitions)
+    pMod.apiBulkPDU.setVarBinds(pdu, [(oid, pMod.Null('')) for oid in oids])
+    return pdu
+
+
+def build_set_pdu(varbinds):
+    pdu = pMod.SetRequestPDU()
+    pMod.apiPDU.setDefaults(pdu)
+    pMod.apiPDU.setVarBinds(pdu, varbinds)
+    return pdu
+
+
+def encode_request(community, pdu, request_id):
+    """
+    Encode the request `pdu` with the ID `request_id` into an SNMPv2c message using `community`.
+    """
+    pMod.apiPDU.setRequestID(pdu, request_id)
+    message = pMod.Message()
+    pMod.apiMessage.setDefaults(message)
+    pMod.apiMessage.setCommunity(message, community)
+    pMod.apiMessage.setPDU(message, pdu)
+    return encoder.encode(message)
+
+
+def decode_response(data):
+    """
+    Decode the SNMPv2c message `data`.
+
+    Returns the PDU of the message or None if `data` is not a valid message.
+    """
+    try:
+        message, rest = decoder.decode(data, asn1Spec=pMod.Message())
+    except Exception:
+        return None
+    return pMod.apiMessage.getPDU(message)
+
+
+def get_response_varbinds(response_pdu):
+    return (pMod.apiPDU.getErrorStatus(response_pdu), pMod.apiPDU.getErrorIndex(response_pdu),
+            pMod.apiPDU.getVarBinds(response_pdu))
+
+
+def get_response_varbind_table(request_pdu, response_pdu):
+    return (pMod.apiBulkPDU.getErrorStatus(response_pdu), pMod.apiBulkPDU.getErrorIndex(response_pdu),
+            pMod.apiBulkPDU.getVarBindTable(request_pdu, response_pdu))
+
+
+# Names of the request PDU types
+OPERATIONS = {
+    pMod.GetRequestPDU.tagSet: "get",
+    pMod.GetNextRequestPDU.tagSet: "getnext",
+    pMod.GetBulkRequestPDU.tagSet: "getbulk",
+    pMod.SetRequestPDU.tagSet: "set",
+}
+
+
+class RequestEvent(object):
+    """
+    Describes a completed SNMP request for the observers of a session.
+    """
+    def __init__(self, hostname, pdu):
+        self.hostname = hostname
+        self.operation = OPERATIONS.get(pdu.tagSet, "unknown")
+        varbinds = pMod.apiPDU.getVarBinds(pdu)
+        self.varbind_count = len(varbinds)
+        # OID of the first object in the request
+        self.oid = tuple(varbinds[0][0]) if varbinds else ()
+        self.attempts = 0
+        self.request_size = 0
+        self.response_size = 0
+        # Time from sending the request until the response arrived or the request failed, in seconds
+        self.latency = 0.0
+        self.timed_out = False
+        self.error_status = 0
+        self.error = None
+
+    retries = property(lambda self: max(0, self.attempts - 1))
+
+    failed = property(lambda self: self.timed_out or self.error is not None or self.error_status != 0)
+
+    def _get_object_name(self):
+        """
+        The name of the MIB object that the first object in the request belongs to.
+        """
+        from hpswitch.mib import mib_registry
+        return mib_registry.get_name(self.oid)
+
+    object_name = property(_get_object_name)
+
+
+def notify_observers(observers, event):
+    for observer in observers:
+        try:
+            observer.request_completed(event)
+        except Exception:
+            # Instrumentation must never break requests
+            pass
+
+
+class RetransmissionTimer(object):
+    """
+    Computes the retransmission timeout of a session from the measured round trip times in the manner of RFC 6298.
+    """
+    # Gains of the smoothed round trip time and its variation
+    alpha = 1 / 8.0
+    beta = 1 / 4.0
+
+    def __init__(self, initial=1.0, minimum=0.2, maximum=8):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.srtt = None
+        self.rttvar = None
+        self.rto = max(minimum, min(initial, maximum))
+
+    def update(self, rtt):
+        """
+        Update the timeout with the round trip time `rtt` of a request that was answered without retransmission.
+        """
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2.0
+        else:
+            self.rttvar = (1 - self.beta) * self.rttvar + self.beta * abs(self.srtt - rtt)
+            self.srtt = (1 - self.alpha) * self.srtt + self.alpha * rtt
+        self.rto = max(self.minimum, min(self.srtt + 4 * self.rttvar, self.maximum))
+
+    def backoff(self):
+        """
+        Double the timeout after a request has not been answered in time.
+        """
+        self.rto = min(self.rto * 2, self.maximum)
+
+
+class RetryBudget(object):
+    """
+    Limits retransmissions to a fraction of the requests of a session.
+
+    Every request adds `ratio` tokens to the budget, up to `max_tokens`, and every retransmission takes one token.
+    Without tokens, requests are not retransmitted, so that an unresponsive switch does not multiply the load.
+    """
+    def __init__(self, ratio=0.2, max_tokens=10.0):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+
+    def deposit(self):
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self):
+        """
+        Take a token for a retransmission, returning whether one was available.
+        """
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class CircuitBreaker(object):
+    """
+    Tracks whether a switch is considered unreachable.
+
+    The breaker opens after `failure_threshold` consecutive requests have timed out. While it is open, the session
+    probes the switch every `probe_interval` seconds and closes the breaker as soon as the switch answers.
+    """
+    def __init__(self, failure_threshold=5, probe_interval=10.0):
+        self.failure_threshold = failure_threshold
+        self.probe_interval = probe_interval
+        self.failures = 0
+        # Time at which the breaker opened, or None while it is closed
+        self.opened = None
+        self._lock = threading.Lock()
+
+    is_open = property(lambda self: self.opened is not None)
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened = None
+
+    def record_failure(self):
+        """
+        Record a timed out request, returning True if this opened the breaker.
+        """
+        with self._lock:
+            self.failures += 1
+            if self.opened is None and self.failures >= self.failure_threshold:
+                self.opened = time.time()
+                return True
+            return False
+
+
+class OperationDeadline(object):
+    """
+    A context manager limiting the time taken by the requests of a session within its block, see
+    `SNMPSession.deadline`.
+    """
+    def __init__(self, session, seconds):
+        self.session = session
+        self.seconds = seconds
+        self._previous_deadline = None
+
+    def __enter__(self):
+        self._previous_deadline = self.session._get_deadline()
+        deadline = time.time() + self.seconds
+        if self._previous_deadline is not None:
+            deadline = min(deadline, self._previous_deadline)
+        self.session._set_deadline(deadline)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.session._set_deadline(self._previous_deadline)
+
+
+class SNMPError(Exception):
+    pass
+
+
+class SNMPTimeoutError(SNMPError):
+    pass
+
+
+class SNMPDeadlineError(SNMPTimeoutError):
+    """
+    Raised when the deadline of an operation has passed before a request could be sent or before its last attempt
+    could wait the full retransmission timeout.
+
+    These requests do not count towards the circuit breaker, since the switch was not given the time to answer.
+    """
+    pass
+
+
+class SNMPUnavailableError(SNMPError):
+    """
+    Raised without contacting a switch whose circuit breaker is open.
+    """
+    pass
@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+import gzip
+import json
+import time
+
+from pysnmp.proto import rfc1902
+import ipaddress
+
+from hpswitch.port import PortSet
+from hpswitch.vlan import (VLAN_IFINDEX_OFFSET, VLANChangeSet, VLANMembership, get_add_ip_address_varbinds,
+        get_remove_ip_address_varbinds)
+
+# Version of the format written by SwitchSnapshot.to_dict
+SNAPSHOT_FORMAT_VERSION = 1
+
+
+class SwitchSnapshot(object):
+    """
+    The configuration of the ports, VLANs and IP addresses of a switch at one point in time.
+
+    Use `Switch.snapshot` to take a snapshot of a switch, or `from_dict` to declare a desired state. `ports` maps base
+    ports to dicts with the keys `alias`, `enabled` and `pvid`, `vlans` maps VLAN IDs to dicts with the keys `name`,
+    `egress` and `untagged`, the latter two being PortSets, and `addresses` maps VLAN IDs to sets of IPv4Interfaces
+    and IPv6Interfaces. Keys left out of a declared state are not changed by `diff`.
+    """
+    def __init__(self, ports=None, vlans=None, addresses=None, port_list_size=0, hostname=None, taken=None):
+        self.ports = ports or {}
+        self.vlans = vlans or {}
+        self.addresses = addresses or {}
+        # Length of the port lists of the switch in bytes
+        self.port_list_size = port_list_size
+        self.hostname = hostname
+        self.taken = taken
+
+    @classmethod
+    def take(cls, switch):
+        """
+        Read the configuration of `switch` with one walk per table.
+        """
+        from hpswitch.port import PORT_ATTRIBUTES
+        taken = time.time()
+        pvids = dict((int(oid[-1]), int(pvid)) for (oid, pvid) in switch.snmp_iter_subtree(("dot1qPvid", )))
+        aliases = dict((int(oid[-1]), PORT_ATTRIBUTES["alias"][1](alias))
+                for (oid, alias) in switch.snmp_iter_subtree(("ifAlias", )))
+        enabled = dict((int(oid[-1]), PORT_ATTRIBUTES["enabled"][1](admin_status))
+                for (oid, admin_status) in switch.snmp_iter_subtree(("ifAdminStatus", )))
+        # The ifindex of a port is its base port
+        ports = dict((base_port, {"alias": aliases.get(base_port, u""), "enabled": enabled.get(base_port, False),
+                "pvid": pvid}) for (base_port, pvid) in pvids.items())
+
+        vlans = dict((int(oid[-1]), {"name": str(name)})
+                for (oid, name) in switch.snmp_iter_subtree(("dot1qVlanStaticName", )))
+        port_list_size = 0
+        for key, name in (("egress", "dot1qVlanStaticEgressPorts"), ("untagged", "dot1qVlanStaticUntaggedPorts")):
+            for oid, port_list in switch.snmp_iter_subtree((name, )):
+                port_list_size = max(port_list_size, len(port_list))
+                vlans.setdefault(int(oid[-1]), {})[key] = PortSet.from_port_list(None, port_list)
+
+        addresses = {}
+        for ifindex, address in switch.ip_addresses():
+            vid = ifindex - VLAN_IFINDEX_OFFSET
+            if vid in vlans:
+                addresses.setdefault(vid, set()).add(address)
+        return cls(ports, vlans, addresses, port_list_size, switch.hostname, taken)
+
+    def to_dict(self):
+        """
+        Convert this snapshot into a dict of JSON compatible values.
+
+        Sets of ports are written as ranges of base ports such as `"1-24,49"`.
+        """
+        return {
+            "version": SNAPSHOT_FORMAT_VERSION,
+            "hostname": self.hostname,
+            "taken": self.taken,
+            "port_list_size": self.port_list_size,
+            "ports": dict((str(base_port), attributes) for (base_port, attributes) in self.ports.items()),
+            "vlans": dict((str(vid), dict((key, _format_port_ranges(value) if isinstance(value, PortSet) else value)
+                for (key, value) in attributes.items())) for (vid, attributes) in self.vlans.items()),
+            "addresses": dict((str(vid), sorted(str(address) for address in addresses))
+                for (vid, addresses) in self.addresses.items()),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Construct a snapshot from a dict in the format written by `to_dict`.
+
+        Any key may be left out to declare a partial desired state.
+        """
+        if data.get("version", SNAPSHOT_FORMAT_VERSION) != SNAPSHOT_FORMAT_VERSION:
+            raise ValueError("Unsupported snapshot format version {0}".format(data["version"]))
+        ports = dict((int(base_port), dict(attributes)) for (base_port, attributes) in data.get("ports", {}).items())
+        vlans = {}
+        for vid, attributes in data.get("vlans", {}).items():
+            vlans[int(vid)] = dict(attributes)
+            for key in ("egress", "untagged"):
+                if key in attributes:
+                    vlans[int(vid)][key] = PortSet(None, _parse_port_ranges(attributes[key]))
+        addresses = dict((int(vid), set(ipaddress.ip_interface(str(address)) for address in vid_addresses))
+                for (vid, vid_addresses) in data.get("addresses", {}).items())
+        return cls(ports, vlans, addresses, data.get("port_list_size", 0), data.get("hostname"), data.get("taken"))
+
+    def save(self, path):
+        """
+        Write this snapshot to the file at `path` as JSON, compressed with gzip if `path` ends with `.gz`.
+        """
+        data = json.dumps(self.to_dict(), sort_keys=True, separators=(",", ":")).encode("utf-8")
+        with (gzip.open if path.endswith(".gz") else open)(path, "wb") as snapshot_file:
+            snapshot_file.write(data)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Read a snapshot written by `save` from the file at `path`.
+        """
+        with (gzip.open if path.endswith(".gz") else open)(path, "rb") as snapshot_file:
+            return cls.from_dict(json.loads(snapshot_file.read().decode("utf-8")))
+
+    def diff(self, desired, prune=False):
+        """
+        Compute the changes needed to get from this snapshot to the `desired` snapshot or declared state.
+
+        Only the ports, VLANs and attributes present in `desired` are compared. If `prune` is set, VLANs and the IP
+        addresses of VLANs missing from `desired` are removed, except for the default VLAN 1.
+
+        Returns a SnapshotDiff.
+        """
+        created_vids = sorted(vid for vid in desired.vlans if vid not in self.vlans)
+        removed_vids = sorted(vid for vid in self.vlans if vid not in desired.vlans and vid != 1) if prune else []
+
+        # dot1qVlanStaticRowStatus createAndGo == 4
+        create_varbinds = [(("dot1qVlanStaticRowStatus", vid), rfc1902.Integer(4)) for vid in created_vids]
+        name_varbinds = [(("dot1qVlanStaticName", vid), rfc1902.OctetString(attributes["name"].encode("utf-8")))
+                for (vid, attributes) in sorted(desired.vlans.items())
+                if "name" in attributes and attributes["name"] != self.vlans.get(vid, {}).get("name")]
+
+        membership_varbinds = [(oid, value) for (oid, value) in self._get_membership_changes(desired, removed_vids)
+                .get_varbinds() if oid[0] == "dot1qPvid" or oid[1] not in removed_vids]
+        # PVIDs declared explicitly take precedence over those following from the untagged VLANs
+        declared_pvid_oids = set(("dot1qPvid", base_port) for (base_port, attributes) in desired.ports.items()
+                if "pvid" in attributes)
+        membership_varbinds = [(oid, value) for (oid, value) in membership_varbinds if oid not in declared_pvid_oids]
+
+        port_varbinds = []
+        aliases = {}
+        for base_port, attributes in sorted(desired.ports.items()):
+            current = self.ports.get(base_port, {})
+            if "pvid" in attributes and attributes["pvid"] != current.get("pvid"):
+                port_varbinds.append((("dot1qPvid", base_port), rfc1902.Gauge32(attributes["pvid"])))
+            if "alias" in attributes and attributes["alias"] != current.get("alias"):
+                port_varbinds.append((("ifAlias", base_port), rfc1902.OctetString(attributes["alias"].encode("utf-8"))))
+                # The ifindex of a port is its base port
+                aliases[base_port] = attributes["alias"]
+            if "enabled" in attributes and attributes["enabled"] != current.get("enabled"):
+                # ifAdminStatus up == 1, down == 2
+                port_varbinds.append((("ifAdminStatus", base_port), rfc1902.Integer(1 if attributes["enabled"] else 2)))
+
+        remove_address_varbinds = []
+        add_address_varbinds = []
+        for vid in sorted(set(desired.addresses) | (set(self.addresses) if prune else set())):
+            current_addresses = self.addresses.get(vid, set())
+            desired_addresses = desired.addresses.get(vid, set())
+            for address in sorted(current_addresses - desired_addresses, key=_get_address_sort_key):
+                remove_address_varbinds.extend(get_remove_ip_address_varbinds(vid + VLAN_IFINDEX_OFFSET, address))
+            # The interface of each IP version only needs to be enabled once, as a SET must not contain an object twice
+            enabled_versions = set()
+            for address in sorted(desired_addresses - current_addresses, key=_get_address_sort_key):
+                add_address_varbinds.extend(get_add_ip_address_varbinds(vid + VLAN_IFINDEX_OFFSET, address,
+                        enable_interface=address.version not in enabled_versions))
+                enabled_versions.add(address.version)
+
+        # dot1qVlanStaticRowStatus destroy == 6
+        remove_varbinds = [(("dot1qVlanStaticRowStatus", vid), rfc1902.Integer(6)) for vid in removed_vids]
+
+        return SnapshotDiff([
+                create_varbinds,
+                name_varbinds,
+                membership_varbinds + port_varbinds,
+                remove_address_varbinds + add_address_varbinds,
+                remove_varbinds,
+                ], aliases)
+
+    def _get_membership_changes(self, desired, removed_vids=()):
+        """
+        Build a VLANChangeSet turning the VLAN membership in this snapshot into that of all VLANs in `desired` whose
+        membership is declared.
+
+        A port declared untagged in one VLAN is removed from the VLAN it was untagged in before and gets the VLAN as its
+        PVID, just like with VLANChangeSet.untag. If only the untagged ports of a VLAN are declared, ports that are no
+        longer untagged stay in the VLAN as tagged ports. Ports no longer untagged in their PVID, including those whose
+        PVID is in `removed_vids`, get their remaining untagged VLAN or the default VLAN 1 as their PVID.
+        """
+        size = self.port_list_size or desired.port_list_size
+        membership = VLANMembership(None,
+                dict((vid, attributes.get("egress", PortSet(None)).to_port_list(size))
+                    for (vid, attributes) in self.vlans.items()),
+                dict((vid, attributes.get("untagged", PortSet(None)).to_port_list(size))
+                    for (vid, attributes) in self.vlans.items()),
+                dict((base_port, attributes["pvid"]) for (base_port, attributes) in self.ports.items()
+                    if "pvid" in attributes))
+        changes = VLANChangeSet(None, membership)
+        for vid, attributes in sorted(desired.vlans.items()):
+            if "egress" not in attributes and "untagged" not in attributes:
+                continue
+            current_egress = self.vlans.get(vid, {}).get("egress", PortSet(None))
+            current_untagged = self.vlans.get(vid, {}).get("untagged", PortSet(None))
+            untagged = attributes.get("untagged", current_untagged)
+            egress = attributes.get("egress", current_egress) | untagged
+            for base_port in (current_egress - egress).base_ports():
+                changes.remove(base_port, vid)
+            for base_port in (current_untagged & egress - untagged).base_ports():
+                # Ports that are no longer untagged but stay in the VLAN become tagged
+                changes.remove(base_port, vid)
+                changes.tag(base_port, vid)
+            for base_port in (egress - untagged - current_egress).base_ports():
+                changes.tag(base_port, vid)
+            for base_port in (untagged - current_untagged).base_ports():
+                changes.untag(base_port, vid)
+        for vid in removed_vids:
+            # The port lists of the VLANs are not written, as the VLANs are destroyed after the PVIDs have been changed
+            for base_port, attributes in sorted(self.ports.items()):
+                if attributes.get("pvid") == vid:
+                    changes.remove(base_port, vid)
+        return changes
+
+
+class SnapshotDiff(object):
+    """
+    The SETs needed to bring a switch from one SwitchSnapshot to another.
+
+    The (oid, value) pairs are grouped into phases that are applied in order: VLAN creation, VLAN names, VLAN
+    membership and port attributes, IP addresses and VLAN removal. Within a phase, pairs are packed into as few SET
+    requests as possible.
+    """
+    def __init__(self, phases, aliases=None):
+        self.phases = [phase for phase in phases if phase]
+        # Maps the ifindexes of the ports whose alias is changed to their new alias
+        self.aliases = aliases or {}
+
+    varbinds = property(lambda self: [varbind for phase in self.phases for varbind in phase])
+
+    def __len__(self):
+        return sum(len(phase) for phase in self.phases)
+
+    def __bool__(self):
+        return bool(self.phases)
+
+    __nonzero__ = __bool__
+
+    def __repr__(self):
+        return "<SnapshotDiff of {0} objects in {1} phases>".format(len(self), len(self.phases))
+
+    def apply(self, switch):
+        """
+        Send the SETs of this diff to `switch`.
+        """
+        for phase in self.phases:
+            switch.snmp_set_many(phase)
+        # Keep Port(switch, alias=...) in line with the new aliases, just like Port.alias does
+        for ifindex, alias in sorted(self.aliases.items()):
+            switch.alias_index.update(ifindex, alias)
+
+
+def _get_address_sort_key(address):
+    return address.version, address
+
+
+def _format_port_ranges(port_set):
+    """
+    Format the base ports in `port_set` as a compact string of ranges such as `"1-24,49"`.
+    """
+    ranges = []
+    for base_port in port_set.base_ports():
+        if ranges and ranges[-1][1] == base_port - 1:
+            ranges[-1][1] = base_port
+        else:
+            ranges.append([base_port, base_port])
+    return ",".join(str(first) if first == last else "{0}-{1}".format(first, last) for (first, last) in ranges)
+
+
+def _parse_port_ranges(ranges):
+    """
+    Parse a string of base port ranges written by `_format_port_ranges`.
+    """
+    base_ports = []
+    for port_range in ranges.split(","):
+        if port_range:
+            first, _, last = port_range.partition("-")
+            base_ports.extend(range(int(first), int(last or first) + 1))
+    return base_ports
@@ -1,85 +1,426 @@
 # -*- coding: utf-8 -*-
 
-import string
-import sys
+import struct
+import time
+import weakref
 
-from pysnmp.entity.rfc3413.oneliner import cmdgen
-from pysnmp.smi import builder, view
+from pyasn1.codec.ber import encoder
+from pysnmp.proto import rfc1902, rfc1905
 
 import ipaddress
 
+from hpswitch.mib import mib_registry
+from hpswitch.session import SNMPSession, SNMPError, SNMPTimeoutError, SNMPDeadlineError, SNMPUnavailableError
+
 class Switch(object):
     """
     Represents a generic HP Networking switch.
     """
-    def __init__(self, hostname, community="public"):
+    # Number of rows requested by the first GETBULK when walking a subtree and the upper bound for any GETBULK
+    max_repetitions = 16
+    max_repetitions_limit = 128
+
+    # Largest SNMP message assumed to be accepted and sent by the switch and the space assumed for a value in a
+    # response when packing several objects into one request
+    max_message_size = 1472
+    expected_value_size = 32
+
+    # Time in seconds for which the static routes read from the switch are used to skip routes that exist already when
+    # adding routes
+    static_routes_max_age = 10
+
+    def __init__(self, hostname, community="public", port=161, timeout=8, retries=5, cache=None):
+        """
+        Construct a new Switch whose SNMP agent is reachable at `hostname` and the UDP port `port`.
+
+        Requests are retransmitted after an adaptive timeout of at most `timeout` seconds, at most `retries` times.
+
+        If a ReadCache is given as `cache`, values read from the switch are cached in it. The cache may be shared by
+        several switches, each with its own TTL through the `host_ttls` of the cache.
+        """
         self.hostname = hostname
         self.community = community
+        self.cache = cache
+
+        # MIBs are loaded once per process and shared between all switches
+        self.mib_registry = mib_registry
+        self.mib_view_controller = self.mib_registry.mib_view_controller
+
+        # The session is opened by the first request unless it is opened explicitly
+        self.session = SNMPSession(hostname, community, port=port, timeout=timeout, retries=retries)
+
+        self._alias_index = None
+        # The Port and VLAN objects of this switch, see intern_object
+        self.interned_objects = weakref.WeakValueDictionary()
+        # Whether static routes are found in the deprecated ipCidrRouteTable instead of inetCidrRouteTable, or None
+        # until it is known
+        self._uses_ip_cidr_route_table = None
+        # The time the static routes were last read and RouteTables of the IPv4 and IPv6 routes, kept up to date with
+        # the routes added and removed since
+        self._static_routes = None
 
-        mib_builder = builder.MibBuilder()
-        mib_builder.setMibPath(*(mib_builder.getMibPath() + (sys.path[0],)))
-        mib_builder.loadModules('RFC1213-MIB', 'BRIDGE-MIB', 'IF-MIB', 'Q-BRIDGE-MIB', 'IP-MIB', 'HP-ICF-IPCONFIG')
+    def open(self):
+        """
+        Resolve the address of the switch and set up the SNMP session used for all requests to it.
+        """
+        self.session.open()
+        return self
+
+    def close(self):
+        """
+        Release the resources held by the SNMP session of this switch.
+        """
+        self.session.close()
 
-        self.mib_view_controller = view.MibViewController(mib_builder)
+    def __enter__(self):
+        return self.open()
 
-        self.command_generator = cmdgen.CommandGenerator()
-        self.command_generator.mibViewController = view.MibViewController(mib_builder)
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
     def _get_oid_for_managed_object_name(self, name):
         """
         Translate a MIB object name to an OID
         """
-        oid, label, suffix = self.mib_view_controller.getNodeName(name)
-        return oid + suffix
+        return self.mib_registry.get_oid(name)
+
+    def add_observer(self, observer):
+        """
+        Call the `request_completed` method of `observer` with a RequestEvent after every SNMP request to this switch.
+        """
+        self.session.observers.append(observer)
+
+    def remove_observer(self, observer):
+        self.session.observers.remove(observer)
+
+    def deadline(self, seconds):
+        """
+        Limit the time taken by all SNMP requests to this switch made within a `with` block to `seconds` in total.
+
+        This bounds high-level operations that need several requests, such as reading the VLANs of a port.
+        """
+        return self.session.deadline(seconds)
+
+    def _get_alias_index(self):
+        """
+        Get the index of the friendly names of the ports of this switch.
+        """
+        from hpswitch.port import PortAliasIndex
+        if self._alias_index is None:
+            self._alias_index = PortAliasIndex(self)
+        return self._alias_index
+
+    alias_index = property(_get_alias_index)
 
     def snmp_get(self, oid):
         """
         Perform an SNMP GET request on the switch.
 
-        Returns the value returned by the switch.
+        Returns the value returned by the switch, which is a NoSuchInstance or NoSuchObject value if the object does
+        not exist. Raises SNMPError if the switch reports an error.
+        """
+        resolved_oid = self._get_oid_for_managed_object_name(oid)
+        if self.cache is not None:
+            value = self.cache.lookup(self.hostname, resolved_oid)
+            if value is not None:
+                return value
+        value = self._snmp_get_varbinds([resolved_oid])[0]
+        if self.cache is not None:
+            self.cache.store(self.hostname, resolved_oid, value)
+        return value
+
+    def snmp_get_many(self, oids, expected_value_size=None, use_cache=True):
+        """
+        Perform as few SNMP GET requests as possible to get the values of all objects in `oids`.
+
+        The objects are packed into GET requests whose responses are expected to fit into `max_message_size`, assuming
+        that each value takes `expected_value_size` bytes, which defaults to the attribute of the same name. Requests
+        that the switch nevertheless considers too big are split in half. Unless `use_cache` is False, values are looked
+        up in and stored in the cache of the switch, if any.
+
+        Returns the values in the order of `oids`.
+        """
+        resolved_oids = [self._get_oid_for_managed_object_name(oid) for oid in oids]
+        if self.cache is None or not use_cache:
+            values = []
+            for request_oids in self._split_oids_for_message_size(resolved_oids, expected_value_size):
+                values.extend(self._snmp_get_varbinds(request_oids))
+            return values
+
+        values = dict((oid, self.cache.lookup(self.hostname, oid)) for oid in resolved_oids)
+        missing_oids = [oid for (oid, value) in values.items() if value is None]
+        for request_oids in self._split_oids_for_message_size(missing_oids, expected_value_size):
+            for oid, value in zip(request_oids, self._snmp_get_varbinds(request_oids)):
+                self.cache.store(self.hostname, oid, value)
+                values[oid] = value
+        return [values[oid] for oid in resolved_oids]
+
+    def _split_oids_for_message_size(self, oids, expected_value_size=None):
+        """
+        Split `oids` into lists of OIDs whose GET responses are expected to fit into `max_message_size`.
+        """
+        expected_value_size = expected_value_size or self.expected_value_size
+        return self._split_for_message_size(oids, lambda oid: (oid, expected_value_size))
+
+    def _split_varbinds_for_message_size(self, varbinds):
+        """
+        Split (oid, value) pairs into lists of pairs whose SET requests are expected to fit into `max_message_size`.
+        """
+        return self._split_for_message_size(varbinds, lambda varbind: (varbind[0], len(encoder.encode(varbind[1]))))
+
+    def _get_available_message_size(self):
+        """
+        Get the space for varbinds in a message of `max_message_size`.
+        """
+        # Space taken by the version, community and the PDU header of a message
+        return self.max_message_size - (len(self.community) + 32)
+
+    def _split_for_message_size(self, items, get_oid_and_value_size):
+        """
+        Split `items` into lists of items whose varbinds fit into a message of `max_message_size`.
+        """
+        available_size = self._get_available_message_size()
+        request_items = []
+        request_size = 0
+        for item in items:
+            oid, value_size = get_oid_and_value_size(item)
+            # Varbind SEQUENCE, OID and value headers are at most 4 bytes each
+            varbind_size = _get_encoded_oid_length(oid) + value_size + 12
+            if request_items and request_size + varbind_size > available_size:
+                yield request_items
+                request_items = []
+                request_size = 0
+            request_items.append(item)
+            request_size += varbind_size
+        if request_items:
+            yield request_items
+
+    def _snmp_get_varbinds(self, oids):
+        """
+        Get the values of `oids` in a single SNMP GET request, or in several if the response would be too big.
         """
-        errorIndication, errorStatus, errorIndex, varBinds = self.command_generator.getCmd(
-                cmdgen.CommunityData('hpswitch', self.community, 1),
-                cmdgen.UdpTransportTarget((self.hostname, 161), timeout=8, retries=5),
-                self._get_oid_for_managed_object_name(oid)
-                )
-        return varBinds[0][1]
+        errorStatus, errorIndex, varBinds = self.session.get(oids)
+        if errorStatus:
+            # tooBig == 1
+            if int(errorStatus) == 1 and len(oids) > 1:
+                half = len(oids) // 2
+                return self._snmp_get_varbinds(oids[:half]) + self._snmp_get_varbinds(oids[half:])
+            raise SNMPError(errorStatus.prettyPrint())
+        return [value for oid, value in varBinds]
 
     def snmp_set(self, *variables_to_set):
         """
         Perform an SNMP SET request on the switch.
 
-        Takes an arbitrary number of (oid, value) pairs as arguments.
+        Takes an arbitrary number of (oid, value) pairs as arguments. Raises SNMPError if the switch rejects the
+        request.
+        """
+        resolved_variables = [(self._get_oid_for_managed_object_name(oid), value) for (oid, value) in variables_to_set]
+        try:
+            errorStatus, errorIndex, varBinds = self.session.set(resolved_variables)
+        finally:
+            # Values read while the request was in flight may be outdated, and a failed request may have set some
+            self._invalidate_cached_values(resolved_variables)
+        if errorStatus:
+            raise SNMPError(errorStatus.prettyPrint())
+
+    def snmp_set_many(self, variables_to_set):
+        """
+        Perform as few SNMP SET requests as possible to set all (oid, value) pairs in `variables_to_set`.
+
+        The pairs are packed into SET requests that are expected to fit into `max_message_size` and sent in the given
+        order. Only the pairs within a single request are set atomically by the switch.
+        """
+        resolved_variables = [(self._get_oid_for_managed_object_name(oid), value) for (oid, value) in variables_to_set]
+        for request_variables in self._split_varbinds_for_message_size(resolved_variables):
+            try:
+                errorStatus, errorIndex, varBinds = self.session.set(request_variables)
+            finally:
+                # See snmp_set
+                self._invalidate_cached_values(request_variables)
+            if errorStatus:
+                raise SNMPError(errorStatus.prettyPrint())
+
+    def _invalidate_cached_values(self, variables_to_set):
         """
-        errorIndication, errorStatus, errorIndex, varBinds = self.command_generator.setCmd(
-                cmdgen.CommunityData('hpswitch', self.community, 1),
-                cmdgen.UdpTransportTarget((self.hostname, 161), timeout=8, retries=5),
-                *[(self._get_oid_for_managed_object_name(oid), value) for (oid, value) in variables_to_set]
-                )
+        Drop all cached values overlapping with the objects that have been set.
+        """
+        if self.cache is not None:
+            for oid, value in variables_to_set:
+                self.cache.invalidate(self.hostname, oid)
 
-    def snmp_get_subtree(self, oid):
+    def snmp_get_subtree(self, oid, max_repetitions=None):
         """
-        Recursively get all objects that have `oid` as a parent using SNMP GETNEXT.
+        Recursively get all objects that have `oid` as a parent using SNMP GETBULK.
 
         Returns a list of (oid, value) pairs.
         """
-        errorIndication, errorStatus, errorIndex, varBinds = self.command_generator.nextCmd(
-                cmdgen.CommunityData('hpswitch', self.community, 1),
-                cmdgen.UdpTransportTarget((self.hostname, 161), timeout=8, retries=5),
-                self._get_oid_for_managed_object_name(oid)
-                )
-        return [tuple(x[0]) for x in varBinds]
+        return list(self.snmp_iter_subtree(oid, max_repetitions))
+
+    def snmp_iter_subtree(self, oid, max_repetitions=None):
+        """
+        Recursively walk all objects that have `oid` as a parent using SNMP GETBULK.
 
+        Yields (oid, value) pairs as soon as the response containing them arrives, so callers that stop early never
+        fetch the rest of the subtree. The first request asks for `max_repetitions` rows; every further request asks
+        for as many rows as are expected to fit into `max_message_size` judging by the size of the rows received so
+        far, up to `max_repetitions_limit`. The number of rows is halved when the switch reports that a response would
+        be too big anyway. Timeouts are not retried with fewer rows, since every such attempt would wait out the full
+        retransmission timeouts and count against the circuit breaker of the session.
+        """
+        for column, row_oid, value in self.snmp_iter_columns([oid], max_repetitions):
+            yield row_oid, value
+
+    def snmp_iter_columns(self, oids, max_repetitions=None):
+        """
+        Walk the subtrees of all `oids` side by side, such as several columns of a table, using SNMP GETBULK requests
+        that ask for the next objects of every subtree that has not been walked completely yet.
+
+        Yields (position, oid, value) triples, where position is the index in `oids` of the subtree the object belongs
+        to. The number of rows per request is chosen like in `snmp_iter_subtree`, where a row holds the next object of
+        each of the remaining subtrees.
+        """
+        walk = SubtreeWalk(self, oids, max_repetitions)
+        while True:
+            request = walk.get_request()
+            if request is None:
+                return
+            errorStatus, errorIndex, varBindTable = self.session.get_bulk(0, *request)
+            for column, row_oid, value in walk.process_response(errorStatus, varBindTable):
+                if self.cache is not None:
+                    self.cache.store(self.hostname, tuple(row_oid), value)
+                yield column, row_oid, value
+
+    def _get_walk_repetitions(self, varBindTable):
+        """
+        Get the number of rows to ask for in the next GETBULK request of a walk, so that its response is expected to
+        fit into `max_message_size` if its rows are as big as the biggest of a sample of the rows in `varBindTable`.
+        """
+        sample = varBindTable[::max(1, len(varBindTable) // 8)]
+        # Varbind SEQUENCE, OID and value headers are at most 4 bytes each
+        row_size = max(sum(_get_encoded_oid_length(tuple(oid)) + len(encoder.encode(value)) + 12
+                for (oid, value) in varBinds) for varBinds in sample)
+        return max(1, min(self._get_available_message_size() // row_size, self.max_repetitions_limit))
 
     # == Static route management ==
 
+    def get_static_routes(self):
+        """
+        Get all static routes configured on this switch with a single walk of `inetCidrRouteTable`.
+
+        Switches that only implement the deprecated `ipCidrRouteTable` are walked there instead, for IPv4 routes only.
+
+        Returns a pair of RouteTables containing the IPv4Routes and the IPv6Routes.
+        """
+        from hpswitch.route import IPv4Route, IPv6Route, RouteTable
+        ipv4_routes = RouteTable()
+        ipv6_routes = RouteTable()
+        rows = 0
+        root_oid = self._get_oid_for_managed_object_name(("inetCidrRouteProto", ))
+        for oid, proto in self.snmp_iter_subtree(("inetCidrRouteProto", )):
+            rows += 1
+            # netmgmt == 3 are static routes
+            if int(proto) != 3:
+                continue
+            route = _parse_inet_cidr_route_index(tuple(oid)[len(root_oid):])
+            if route is not None:
+                destination, gateway = route
+                if destination.version == 4:
+                    ipv4_routes.add(IPv4Route(destination, gateway))
+                else:
+                    ipv6_routes.add(IPv6Route(destination, gateway))
+        self._uses_ip_cidr_route_table = False
+        if not rows:
+            root_oid = self._get_oid_for_managed_object_name(("ipCidrRouteProto", ))
+            for oid, proto in self.snmp_iter_subtree(("ipCidrRouteProto", )):
+                self._uses_ip_cidr_route_table = True
+                if int(proto) == 3:
+                    ipv4_routes.add(IPv4Route(*_parse_ip_cidr_route_index(tuple(oid)[len(root_oid):])))
+        # Copies, so that callers may change the returned tables
+        self._static_routes = (time.time(), RouteTable(ipv4_routes), RouteTable(ipv6_routes))
+        return ipv4_routes, ipv6_routes
+
+    def _get_known_static_routes(self):
+        """
+        Get the RouteTables of the IPv4 and IPv6 static routes last read from the switch, reading them again if they
+        are older than `static_routes_max_age`.
+        """
+        if self._static_routes is None or time.time() - self._static_routes[0] > self.static_routes_max_age:
+            self.get_static_routes()
+        return self._static_routes[1:]
+
+    def add_static_routes(self, routes):
+        """
+        Add the static IPv4Routes and IPv6Routes in `routes` to the switch configuration with as few SETs as possible.
+
+        Routes that are already configured are skipped. The configured routes are read from the switch unless they
+        have been read within `static_routes_max_age` seconds.
+
+        Returns a list of the routes that were added.
+        """
+        ipv4_routes, ipv6_routes = self._get_known_static_routes()
+        # Adding the routes to the tables also skips duplicates within `routes`
+        added_routes = [route for route in routes
+                if (ipv4_routes if route.destination.version == 4 else ipv6_routes).add(route)]
+        try:
+            # RowStatus createAndGo == 4; all other columns have default values
+            self.snmp_set_many([(self._get_route_status_oid(route), rfc1902.Integer(4)) for route in added_routes])
+        except Exception:
+            # Some of the routes may have been added anyway, so read them again next time
+            self._static_routes = None
+            raise
+        return added_routes
+
+    def remove_static_routes(self, routes):
+        """
+        Remove the static IPv4Routes and IPv6Routes in `routes` from the switch configuration with as few SETs as
+        possible.
+        """
+        routes = set(routes)
+        try:
+            # RowStatus destroy == 6
+            self.snmp_set_many([(self._get_route_status_oid(route), rfc1902.Integer(6)) for route in routes])
+        finally:
+            if self._static_routes is not None:
+                for route in routes:
+                    self._static_routes[1 if route.destination.version == 4 else 2].discard(route)
+
+    def _get_uses_ip_cidr_route_table(self):
+        """
+        Whether static routes are found in the deprecated `ipCidrRouteTable` instead of `inetCidrRouteTable`.
+
+        Unless the route tables have been walked already, this is found out by asking for the first row of both.
+        """
+        if self._uses_ip_cidr_route_table is None:
+            self._uses_ip_cidr_route_table = (not self._has_subtree_objects(("inetCidrRouteProto", ))
+                    and self._has_subtree_objects(("ipCidrRouteProto", )))
+        return self._uses_ip_cidr_route_table
+
+    def _has_subtree_objects(self, oid):
+        """
+        Whether there are any objects that have `oid` as a parent, found out with a single GETBULK.
+        """
+        root_oid = self._get_oid_for_managed_object_name(oid)
+        errorStatus, errorIndex, varBindTable = self.session.get_bulk(0, 1, [root_oid])
+        if errorStatus:
+            raise SNMPError(errorStatus.prettyPrint())
+        return bool(varBindTable) and tuple(varBindTable[0][0][0])[:len(root_oid)] == root_oid
+
+    def _get_route_status_oid(self, route):
+        """
+        Get the name of the row status of `route` in the route table used by this switch.
+        """
+        if route.destination.version == 4 and self._get_uses_ip_cidr_route_table():
+            return ("ipCidrRouteStatus", ) + _get_ip_cidr_route_index(route)
+        return ("inetCidrRouteStatus", ) + _get_inet_cidr_route_index(route)
+
     # === IPv4 static route management ===
 
     def _get_static_ipv4_routes(self):
         """
         Get all static IPv4 routes configured on this switch.
         """
-        pass
+        return self.get_static_routes()[0]
 
     static_ipv4_routes = property(_get_static_ipv4_routes)
 
@@ -87,13 +428,13 @@ class Switch(object):
         """
         Add the static IPv4 route `add_route` to the switch configuration.
         """
-        pass
+        self.add_static_routes([add_route])
 
     def remove_static_ipv4_route(self, remove_route):
         """
         Remove the static route `remove_route` from the switch configuration.
         """
-        pass
+        self.remove_static_routes([remove_route])
 
     # === IPv6 static route management ===
 
@@ -101,7 +442,7 @@ class Switch(object):
         """
         Get all static IPv6 routes configured on this switch.
         """
-        pass
+        return self.get_static_routes()[1]
 
     static_ipv6_routes = property(_get_static_ipv6_routes)
 
@@ -109,13 +450,13 @@ class Switch(object):
         """
         Add the static IPv6 route `add_route` to the switch configuration.
         """
-        pass
+        self.add_static_routes([add_route])
 
     def remove_static_ipv6_route(self, remove_route):
         """
         Remove the static IPv6 route `remove_route` from the switch configuration.
         """
-        pass
+        self.remove_static_routes([remove_route])
 
     def get_ports(self):
         """
@@ -124,15 +465,316 @@ class Switch(object):
         Returns Port objects.
         """
         from hpswitch.port import Port
-        base_ports = self.snmp_get_subtree(("dot1dBasePort",))
+        base_ports = self.snmp_iter_subtree(("dot1dBasePort",))
         return [Port(self, base_port=int(p[1])) for p in base_ports]
 
+    def create_vlans(self, vids):
+        """
+        Create the VLANs with the VLAN IDs `vids` on the switch unless they are already known there.
+
+        The existence of all VLANs is checked with a single GET and the missing ones are created together.
+
+        Returns VLAN objects.
+        """
+        from hpswitch.vlan import VLAN
+        row_statuses = self.snmp_get_many([("dot1qVlanStaticRowStatus", vid) for vid in vids])
+        # createAndGo == 4
+        self.snmp_set_many([(("dot1qVlanStaticRowStatus", vid), rfc1902.Integer(4))
+            for (vid, row_status) in zip(vids, row_statuses) if not bool(row_status)])
+        return [VLAN(self, vid) for vid in vids]
+
+    def get_port_attributes(self, ports, fields=("alias", "description", "enabled", "operational")):
+        """
+        Get the attributes named in `fields` for all `ports` with as few requests as possible.
+
+        Returns a list containing a dict mapping field names to values for each port, in the order of `ports`.
+        """
+        from hpswitch.port import PORT_ATTRIBUTES
+        attributes = [PORT_ATTRIBUTES[field] for field in fields]
+        values = iter(self.snmp_get_many([(name, port.ifindex) for port in ports for (name, convert) in attributes]))
+        return [dict((field, convert(next(values))) for (field, (name, convert)) in zip(fields, attributes))
+                for port in ports]
+
     def get_vlans(self):
         """
         Get all VLANs currently configured on this switch.
 
+        The VLANs are listed with a single walk and no further requests.
+
         Returns VLAN objects.
         """
         from hpswitch.vlan import VLAN
-        vlans = self.snmp_get_subtree(("dot1qVlanStaticRowStatus",))
+        vlans = self.snmp_iter_subtree(("dot1qVlanStaticRowStatus",))
         return [VLAN(self, int(v[0][-1])) for v in vlans]
+
+    def ip_addresses(self):
+        """
+        Get the IP addresses configured on all VLANs of this switch with a single walk of `hpicfIpAddressTable`.
+
+        Returns an IPAddressIndex.
+        """
+        from hpswitch.vlan import IPAddressIndex, get_ip_interface
+        root_oid = self._get_oid_for_managed_object_name(("hpicfIpAddressPrefixLength", ))
+        addresses = []
+        for oid, prefix_length in self.snmp_iter_subtree(("hpicfIpAddressPrefixLength", )):
+            # Indexed by ifindex, address type, address length and the address octets
+            index = tuple(oid)[len(root_oid):]
+            # InetAddressType ipv4 == 1, ipv6 == 2
+            if index[1] in (1, 2):
+                addresses.append((index[0], get_ip_interface(index[3:3 + index[2]], prefix_length)))
+        return IPAddressIndex(self, addresses)
+
+    def iter_mac_table(self, fids=None):
+        """
+        Stream the entries of the forwarding database of this switch from `dot1qTpFdbTable`, or only those of the
+        filtering databases `fids`.
+
+        The port and status columns are walked side by side, so entries are yielded as soon as the responses containing
+        them arrive. Yields (FID, MAC address as an integer, base port, status) tuples ordered by FID and MAC address;
+        invalid entries are skipped.
+        """
+        root_length = len(self._get_oid_for_managed_object_name(("dot1qTpFdbPort", )))
+        for suffix in ([()] if fids is None else [(fid, ) for fid in fids]):
+            statuses = self.snmp_iter_subtree(("dot1qTpFdbStatus", ) + suffix)
+            status_row = next(statuses, None)
+            for oid, base_port in self.snmp_iter_subtree(("dot1qTpFdbPort", ) + suffix):
+                # Indexed by dot1qFdbId and the 6 octets of dot1qTpFdbAddress
+                index = tuple(oid)[root_length:]
+                # Entries may come and go between the requests for both columns
+                while status_row is not None and tuple(status_row[0])[root_length:] < index:
+                    status_row = next(statuses, None)
+                # dot1qTpFdbStatus other == 1, invalid == 2
+                entry_status = 1
+                if status_row is not None and tuple(status_row[0])[root_length:] == index:
+                    entry_status = int(status_row[1])
+                if entry_status != 2:
+                    mac = 0
+                    for octet in index[1:7]:
+                        mac = mac << 8 | octet
+                    yield index[0], mac, int(base_port), entry_status
+
+    def mac_table(self):
+        """
+        Read the forwarding database of this switch.
+
+        Returns a MACTable.
+        """
+        from hpswitch.mac import MACTable
+        return MACTable.read(self)
+
+    def lldp_neighbors(self):
+        """
+        Get the devices this switch has discovered by LLDP with a single walk of the `lldpRemTable` columns used and of
+        `lldpRemManAddrTable` side by side.
+
+        Returns a list of LLDPNeighbors ordered by local port.
+        """
+        from hpswitch.port import Port
+        from hpswitch.topology import LLDPNeighbor, format_lldp_id
+        names = ("lldpRemChassisIdSubtype", "lldpRemChassisId", "lldpRemPortIdSubtype", "lldpRemPortId",
+                "lldpRemPortDesc", "lldpRemSysName", "lldpRemManAddrIfSubtype")
+        root_lengths = [len(self._get_oid_for_managed_object_name((name, ))) for name in names]
+        columns = dict((name, {}) for name in names[:-1])
+        management_addresses = {}
+        for column, oid, value in self.snmp_iter_columns([(name, ) for name in names]):
+            index = tuple(oid)[root_lengths[column]:]
+            name = names[column]
+            if name == "lldpRemManAddrIfSubtype":
+                # Indexed like lldpRemTable, followed by the address family, the address length and the address octets
+                # AddressFamilyNumbers ipV4 == 1, ipV6 == 2
+                if (index[3], index[4]) in ((1, 4), (2, 16)):
+                    management_addresses.setdefault(index[1:3], []).append(_get_ip_address(index[5:5 + index[4]]))
+            else:
+                # Indexed by lldpRemTimeMark, lldpRemLocalPortNum and lldpRemIndex; the time mark is dropped
+                columns[name][index[1:]] = value
+
+        neighbors = []
+        for index, chassis_id in sorted(columns["lldpRemChassisId"].items()):
+            # lldpRemLocalPortNum is the same as dot1dBasePort for Ports
+            neighbors.append(LLDPNeighbor(Port(self, base_port=index[0]),
+                    # LldpChassisIdSubtype macAddress == 4, LldpPortIdSubtype macAddress == 3
+                    format_lldp_id(columns["lldpRemChassisIdSubtype"].get(index), chassis_id, 4),
+                    format_lldp_id(columns["lldpRemPortIdSubtype"].get(index), columns["lldpRemPortId"].get(index), 3),
+                    str(columns["lldpRemSysName"][index]) if index in columns["lldpRemSysName"] else None,
+                    str(columns["lldpRemPortDesc"][index]) if index in columns["lldpRemPortDesc"] else None,
+                    management_addresses.get(index, [])))
+        return neighbors
+
+    def vlan_changes(self, membership=None):
+        """
+        Start a set of VLAN membership changes that are applied together.
+
+        Use the returned VLANChangeSet as a context manager; the changes are committed when the block is left without
+        an exception. If a VLANMembership snapshot `membership` is given, it is used instead of reading the current
+        membership from the switch.
+        """
+        from hpswitch.vlan import VLANChangeSet
+        return VLANChangeSet(self, membership)
+
+    def vlan_membership(self):
+        """
+        Take a snapshot of the VLAN membership of all ports of this switch.
+
+        The egress, untagged and PVID tables are each fetched with a single walk, so that questions about the VLANs of
+        any number of ports can be answered without further requests.
+
+        Returns a VLANMembership object.
+        """
+        from hpswitch.vlan import VLANMembership
+        egress_ports = dict((int(oid[-1]), port_list)
+                for (oid, port_list) in self.snmp_iter_subtree(("dot1qVlanStaticEgressPorts",)))
+        untagged_ports = dict((int(oid[-1]), port_list)
+                for (oid, port_list) in self.snmp_iter_subtree(("dot1qVlanStaticUntaggedPorts",)))
+        pvids = dict((int(oid[-1]), int(pvid)) for (oid, pvid) in self.snmp_iter_subtree(("dot1qPvid",)))
+        return VLANMembership(self, egress_ports, untagged_ports, pvids)
+
+    def snapshot(self):
+        """
+        Take a snapshot of the configuration of the ports, VLANs and IP addresses of this switch.
+
+        Returns a SwitchSnapshot.
+        """
+        from hpswitch.snapshot import SwitchSnapshot
+        return SwitchSnapshot.take(self)
+
+    def reconcile(self, desired, prune=False):
+        """
+        Change the configuration of this switch to the SwitchSnapshot `desired` with as few SETs as possible.
+
+        See `SwitchSnapshot.diff` for the meaning of `prune`.
+
+        Returns the applied SnapshotDiff.
+        """
+        diff = self.snapshot().diff(desired, prune)
+        diff.apply(self)
+        return diff
+
+
+class SubtreeWalk(object):
+    """
+    The state of a walk of one or more subtrees side by side with SNMP GETBULK requests.
+
+    The walk decides which objects to ask for next, how many rows to ask for and when it is finished, but does not
+    send any requests itself, so that `Switch` and `AsyncSwitch` walk subtrees the same way.
+    """
+    def __init__(self, switch, oids, max_repetitions=None):
+        self.switch = switch
+        self.root_oids = [switch._get_oid_for_managed_object_name(oid) for oid in oids]
+        self.last_oids = list(self.root_oids)
+        # Positions of the subtrees that have not been walked completely yet
+        self.columns = list(range(len(self.root_oids)))
+        self.repetitions = max_repetitions or switch.max_repetitions
+
+    def get_request(self):
+        """
+        Get the max_repetitions and the OIDs of the next GETBULK request, or None if the walk is finished.
+        """
+        if not self.columns:
+            return None
+        return self.repetitions, [self.last_oids[column] for column in self.columns]
+
+    def process_response(self, errorStatus, varBindTable):
+        """
+        Take in the response to the request returned by `get_request` last.
+
+        Returns the (position, oid, value) triples of the objects in the response that belong to the walked subtrees.
+        Raises SNMPError if the switch reported an error other than a response that would be too big, in which case the
+        next request asks for half as many rows, or if the switch returned an OID that does not follow the previous one,
+        which would make the walk loop forever.
+        """
+        if errorStatus:
+            # tooBig == 1
+            if int(errorStatus) == 1 and self.repetitions > 1:
+                self.repetitions = max(1, self.repetitions // 2)
+                return []
+            raise SNMPError(errorStatus.prettyPrint())
+
+        if not varBindTable:
+            self.columns = []
+            return []
+        rows = []
+        finished = set()
+        for varBinds in varBindTable:
+            for column, (row_oid, value) in zip(self.columns, varBinds):
+                if column in finished:
+                    continue
+                root_oid = self.root_oids[column]
+                if isinstance(value, rfc1905.EndOfMibView) or tuple(row_oid)[:len(root_oid)] != root_oid:
+                    finished.add(column)
+                    continue
+                if tuple(row_oid) <= self.last_oids[column]:
+                    raise SNMPError("OID not increasing: {0} after {1}".format(
+                        ".".join(str(arc) for arc in row_oid), ".".join(str(arc) for arc in self.last_oids[column])))
+                self.last_oids[column] = tuple(row_oid)
+                rows.append((column, row_oid, value))
+
+        self.columns = [column for column in self.columns if column not in finished]
+        self.repetitions = self.switch._get_walk_repetitions(varBindTable)
+        return rows
+
+
+def _get_encoded_oid_length(oid):
+    """
+    Return the number of bytes taken by the BER encoding of the value of `oid`.
+    """
+    # The first two arcs are encoded in one byte, all others in base 128
+    length = 1
+    for arc in oid[2:]:
+        length += 1
+        while arc >= 0x80:
+            arc >>= 7
+            length += 1
+    return length
+
+
+def _get_ip_address(octets):
+    """
+    Build an IPv4Address or IPv6Address from the 4 or 16 octets of an address in an OID.
+    """
+    packed_address = struct.pack("{0}B".format(len(octets)), *octets)
+    return ipaddress.IPv4Address(packed_address) if len(octets) == 4 else ipaddress.IPv6Address(packed_address)
+
+def _get_inet_cidr_route_index(route):
+    """
+    Get the `inetCidrRouteTable` index of `route`.
+    """
+    # InetAddressType ipv4 == 1, ipv6 == 2
+    address_type = 1 if route.destination.version == 4 else 2
+    destination = tuple(bytearray(route.destination.network_address.packed))
+    gateway = tuple(bytearray(route.gateway.packed))
+    # The route policy 0.0 means no policy
+    return ((address_type, len(destination)) + destination + (route.destination.prefixlen, 2, 0, 0)
+            + (address_type, len(gateway)) + gateway)
+
+def _parse_inet_cidr_route_index(index):
+    """
+    Get the destination network and the gateway of the `inetCidrRouteTable` row with the given `index`.
+
+    Returns None for rows with addresses that are neither plain IPv4 nor IPv6 addresses.
+    """
+    address_type, destination_length = index[:2]
+    position = 2 + destination_length
+    destination = index[2:position]
+    prefix_length = index[position]
+    # Skip the route policy
+    position += 2 + index[position + 1]
+    gateway_type, gateway_length = index[position:position + 2]
+    gateway = index[position + 2:position + 2 + gateway_length]
+    if address_type not in (1, 2) or gateway_type != address_type:
+        return None
+    network = ipaddress.ip_network(u"{0}/{1}".format(_get_ip_address(destination), prefix_length))
+    return network, _get_ip_address(gateway)
+
+def _get_ip_cidr_route_index(route):
+    """
+    Get the `ipCidrRouteTable` index of the IPv4 `route`.
+    """
+    return (tuple(bytearray(route.destination.network_address.packed))
+            + tuple(bytearray(route.destination.netmask.packed)) + (0, ) + tuple(bytearray(route.gateway.packed)))
+
+def _parse_ip_cidr_route_index(index):
+    """
+    Get the destination network and the gateway of the `ipCidrRouteTable` row with the given `index`.
+    """
+    network = ipaddress.ip_network(u"{0}/{1}".format(_get_ip_address(index[:4]), _get_ip_address(index[4:8])))
+    return network, _get_ip_address(index[9:13])
@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+from collections import OrderedDict
+from concurrent import futures
+
+from hpswitch.mac import format_mac, parse_mac
+from hpswitch.switch import Switch
+
+
+def format_lldp_id(subtype, value, mac_subtype):
+    """
+    Format the LLDP chassis or port ID `value` of the given `subtype` as a string.
+
+    IDs of the subtype `mac_subtype` are formatted as MAC addresses such as `"00:11:22:aa:bb:cc"`, other printable IDs
+    are returned as they are and anything else as colon separated hex octets.
+    """
+    if value is None:
+        return None
+    octets = bytearray(value.asOctets())
+    if subtype is not None and int(subtype) == mac_subtype and len(octets) == 6:
+        return format_mac(parse_mac(octets))
+    if octets and all(32 <= octet < 127 for octet in octets):
+        return octets.decode("ascii")
+    return ":".join("{0:02x}".format(octet) for octet in octets)
+
+
+class LLDPNeighbor(object):
+    """
+    A device that a switch has discovered on one of its ports by LLDP.
+
+    Use `Switch.lldp_neighbors` to read the neighbors of a switch.
+    """
+    def __init__(self, local_port, chassis_id, port_id, system_name=None, port_description=None,
+            management_addresses=()):
+        # The Port of the switch the neighbor was discovered on
+        self.local_port = local_port
+        self.chassis_id = chassis_id
+        # The ID of the port of the neighbor facing the switch
+        self.port_id = port_id
+        self.system_name = system_name
+        self.port_description = port_description
+        # The IPv4Addresses and IPv6Addresses the neighbor can be managed at
+        self.management_addresses = list(management_addresses)
+
+    def __repr__(self):
+        return "<LLDPNeighbor {0} port {1} on base port {2}>".format(self.system_name or self.chassis_id, self.port_id,
+                self.local_port.base_port)
+
+
+def read_lldp_local_system(switch):
+    """
+    Read the chassis ID and system name that `switch` advertises by LLDP and the port IDs it advertises for its ports.
+
+    Returns the chassis ID, the system name and a dict mapping port IDs to Ports.
+    """
+    from hpswitch.port import Port
+    chassis_id_subtype, chassis_id, system_name = switch.snmp_get_many([("lldpLocChassisIdSubtype", 0),
+            ("lldpLocChassisId", 0), ("lldpLocSysName", 0)])
+    # Indexed by lldpLocPortNum, which is the same as dot1dBasePort for Ports
+    port_id_subtypes = dict((int(oid[-1]), subtype)
+            for (oid, subtype) in switch.snmp_iter_subtree(("lldpLocPortIdSubtype", )))
+    ports = dict((format_lldp_id(port_id_subtypes.get(int(oid[-1])), port_id, 3), Port(switch, base_port=int(oid[-1])))
+            for (oid, port_id) in switch.snmp_iter_subtree(("lldpLocPortId", )))
+    return format_lldp_id(chassis_id_subtype, chassis_id, 4), str(system_name), ports
+
+
+class TopologyNode(object):
+    """
+    A device in a Topology, identified by its LLDP chassis ID.
+
+    Nodes of switches that were crawled have a `switch`, the IDs of their ports and their LLDP neighbors. Other devices
+    are only known from the LLDP neighbor information of the switches next to them.
+
+    The session of the `switch` is closed once the switch has been read, but any further request through the switch or
+    its Ports opens it again; call `Topology.close` when done with the topology.
+    """
+    def __init__(self, chassis_id, system_name=None, switch=None, depth=None):
+        self.chassis_id = chassis_id
+        self.system_name = system_name
+        self.switch = switch
+        # Number of hops from the nearest seed switch
+        self.depth = depth
+        # Maps the advertised port IDs of a crawled switch to its Ports
+        self.ports = {}
+        self.neighbors = []
+
+    crawled = property(lambda self: self.switch is not None)
+
+    hostname = property(lambda self: self.switch.hostname if self.switch is not None else None)
+
+    def __repr__(self):
+        return "<TopologyNode {0}>".format(self.system_name or self.chassis_id)
+
+
+class Link(object):
+    """
+    A link between two devices of a Topology.
+
+    The ports on both ends are given as a Port if the device on that end was crawled and as the advertised port ID in
+    any case.
+    """
+    def __init__(self, node, port_id, remote_node, remote_port_id, port=None, remote_port=None):
+        self.node = node
+        self.port_id = port_id
+        self.port = port
+        self.remote_node = remote_node
+        self.remote_port_id = remote_port_id
+        self.remote_port = remote_port
+
+    def get_end(self, node):
+        """
+        Get the port ID and the Port, if known, at the end of this link that is on `node`.
+        """
+        if node is self.node:
+            return self.port_id, self.port
+        return self.remote_port_id, self.remote_port
+
+    def __repr__(self):
+        return "<Link {0} port {1} - {2} port {3}>".format(self.node, self.port_id, self.remote_node,
+                self.remote_port_id)
+
+
+class Topology(object):
+    """
+    The adjacency graph of the devices found by a TopologyCrawler.
+
+    Every link is recorded once, even if the devices on both of its ends report each other.
+
+    Use the topology as a context manager or call `close` to release the sessions of the crawled switches that have
+    been used since the crawl.
+    """
+    def __init__(self):
+        # Maps chassis IDs to TopologyNodes in the order they were found
+        self.nodes = OrderedDict()
+        self.links = []
+        # Maps the hostnames of switches that could not be crawled to the errors raised
+        self.errors = {}
+        # Maps chassis IDs to the links of their nodes
+        self._adjacency = {}
+        self._link_keys = set()
+
+    def close(self):
+        """
+        Close the sessions of all crawled switches.
+        """
+        for node in self.nodes.values():
+            if node.switch is not None:
+                node.switch.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get_node(self, chassis_id):
+        return self.nodes.get(chassis_id)
+
+    def find_node(self, system_name):
+        """
+        Get the first node with the given `system_name`, or None.
+        """
+        for node in self.nodes.values():
+            if node.system_name == system_name:
+                return node
+        return None
+
+    def add_link(self, node, port_id, remote_node, remote_port_id, port=None):
+        """
+        Add the link between the port `port_id` of `node` and the port `remote_port_id` of `remote_node` unless it is
+        already known from either end.
+
+        Returns the Link, or None if it was known already.
+        """
+        key = frozenset([(node.chassis_id, port_id), (remote_node.chassis_id, remote_port_id)])
+        if key in self._link_keys:
+            return None
+        self._link_keys.add(key)
+        link = Link(node, port_id, remote_node, remote_port_id, port or node.ports.get(port_id),
+                remote_node.ports.get(remote_port_id))
+        self.links.append(link)
+        self._adjacency.setdefault(node.chassis_id, []).append(link)
+        if remote_node is not node:
+            self._adjacency.setdefault(remote_node.chassis_id, []).append(link)
+        return link
+
+    def get_links(self, node, remote_node=None):
+        """
+        Get the links of `node`, or only those to `remote_node`.
+        """
+        links = self._adjacency.get(node.chassis_id, [])
+        if remote_node is None:
+            return list(links)
+        return [link for link in links if (link.remote_node if link.node is node else link.node) is remote_node]
+
+    def get_neighbors(self, node):
+        """
+        Get the nodes linked to `node`.
+        """
+        neighbors = OrderedDict()
+        for link in self._adjacency.get(node.chassis_id, []):
+            neighbor = link.remote_node if link.node is node else link.node
+            neighbors[neighbor.chassis_id] = neighbor
+        return list(neighbors.values())
+
+    def as_dict(self):
+        """
+        Export the topology as a dict mapping the name of each node to the names of its neighbors to the pairs of port
+        IDs of the links between them.
+        """
+        adjacency = OrderedDict()
+        for node in self.nodes.values():
+            node_name = node.system_name or node.chassis_id
+            node_links = adjacency.setdefault(node_name, OrderedDict())
+            for link in self._adjacency.get(node.chassis_id, []):
+                neighbor = link.remote_node if link.node is node else link.node
+                port_ids = (link.get_end(node)[0], link.get_end(neighbor)[0])
+                node_links.setdefault(neighbor.system_name or neighbor.chassis_id, []).append(port_ids)
+        return adjacency
+
+
+class TopologyCrawler(object):
+    """
+    Maps the layer 2 topology of a network by crawling the LLDP neighbors of switches breadth-first.
+
+    Starting from the seed switches, the neighbors of every crawled switch are crawled in turn. At most `max_workers`
+    switches are read at the same time; switches waiting to be read are queued in the order they were found, so that
+    switches closer to the seeds are read first. Neighbors are reached at their first IPv4 or IPv6 management address,
+    or at their system name if they advertise none. Neighbors are identified by their chassis ID, so every switch is
+    read once, no matter how many of its neighbors report it or at how many addresses. Switches further than
+    `max_depth` hops from the nearest seed are not read.
+
+    The switches are `switch_class` objects with the given `community`, `timeout` and `retries`, whose SNMP agents are
+    reached at the UDP port `port`. If `deadline` is given, reading a switch is given up after `deadline` seconds.
+    """
+    def __init__(self, community="public", port=161, max_workers=32, timeout=8, retries=5, switch_class=Switch,
+            deadline=None, max_depth=None):
+        self.community = community
+        self.port = port
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.retries = retries
+        self.switch_class = switch_class
+        self.deadline = deadline
+        self.max_depth = max_depth
+
+    def get_hostname(self, neighbor):
+        """
+        Get the hostname at which the switch `neighbor` is reached, or None if it cannot be reached.
+        """
+        if neighbor.management_addresses:
+            # Prefer IPv4 addresses
+            return str(sorted(neighbor.management_addresses, key=lambda address: address.version)[0])
+        return neighbor.system_name or None
+
+    def _read_switch(self, hostname):
+        switch = self.switch_class(hostname, self.community, port=self.port, timeout=self.timeout,
+                retries=self.retries)
+        try:
+            if self.deadline is None:
+                return switch, read_lldp_local_system(switch), switch.lldp_neighbors()
+            with switch.deadline(self.deadline):
+                return switch, read_lldp_local_system(switch), switch.lldp_neighbors()
+        finally:
+            # The session is opened again by any further request, e.g. through the Ports of the switch, and closed by
+            # Topology.close
+            switch.close()
+
+    def crawl(self, hostnames):
+        """
+        Crawl the network starting from the switches with the given `hostnames`.
+
+        Returns a Topology, which needs to be closed when the crawled switches have been used after the crawl.
+        """
+        topology = Topology()
+        # Chassis IDs of the switches that have been queued or read, and the hostnames they are queued at
+        queued_chassis_ids = set()
+        queued_hostnames = set(hostnames)
+        executor = futures.ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            pending = dict((executor.submit(self._read_switch, hostname), (hostname, 0)) for hostname in hostnames)
+            while pending:
+                done, not_done = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+                for future in done:
+                    hostname, depth = pending.pop(future)
+                    try:
+                        switch, (chassis_id, system_name, ports), neighbors = future.result()
+                    except Exception as e:
+                        topology.errors[hostname] = e
+                        continue
+                    node = topology.get_node(chassis_id)
+                    if node is not None and node.crawled:
+                        # Reached at another address as well
+                        continue
+                    if node is None:
+                        node = topology.nodes[chassis_id] = TopologyNode(chassis_id)
+                    node.system_name = system_name
+                    node.switch = switch
+                    node.depth = depth
+                    node.ports = ports
+                    node.neighbors = neighbors
+                    queued_chassis_ids.add(chassis_id)
+
+                    for neighbor in neighbors:
+                        if topology.get_node(neighbor.chassis_id) is None:
+                            topology.nodes[neighbor.chassis_id] = TopologyNode(neighbor.chassis_id,
+                                    neighbor.system_name)
+                        if neighbor.chassis_id in queued_chassis_ids:
+                            continue
+                        if self.max_depth is not None and depth + 1 > self.max_depth:
+                            continue
+                        neighbor_hostname = self.get_hostname(neighbor)
+                        if neighbor_hostname is None or neighbor_hostname in queued_hostnames:
+                            continue
+                        queued_chassis_ids.add(neighbor.chassis_id)
+                        queued_hostnames.add(neighbor_hostname)
+                        pending[executor.submit(self._read_switch, neighbor_hostname)] = (neighbor_hostname,
+                                depth + 1)
+        finally:
+            executor.shutdown(wait=True)
+
+        # Links are added once all switches are known, so that the Ports on both ends can be filled in
+        for node in list(topology.nodes.values()):
+            local_port_ids = dict((port.base_port, port_id) for (port_id, port) in node.ports.items())
+            for neighbor in node.neighbors:
+                port_id = local_port_ids.get(neighbor.local_port.base_port, str(neighbor.local_port.base_port))
+                topology.add_link(node, port_id, topology.nodes[neighbor.chassis_id], neighbor.port_id,
+                        neighbor.local_port)
+        return topology
@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+import socket
+import threading
+import time
+
+from pyasn1.codec.ber import encoder, decoder
+from pysnmp.proto import api
+
+from hpswitch.port import Port
+from hpswitch.vlan import VLAN, VLAN_IFINDEX_OFFSET
+
+# Standard notifications of SNMPv2-MIB and IF-MIB below snmpTraps
+SNMP_TRAPS_OID = (1, 3, 6, 1, 6, 3, 1, 1, 5)
+COLD_START_OID = SNMP_TRAPS_OID + (1, )
+WARM_START_OID = SNMP_TRAPS_OID + (2, )
+LINK_DOWN_OID = SNMP_TRAPS_OID + (3, )
+LINK_UP_OID = SNMP_TRAPS_OID + (4, )
+
+# Notifications of hpSwitchConfig in the HP ICF switch MIBs, sent when the running configuration is changed or when a
+# configuration is saved as startup configuration
+HP_SWITCH_CONFIG_NOTIFICATIONS_OID = (1, 3, 6, 1, 4, 1, 11, 2, 14, 11, 5, 1, 7, 0)
+HP_SWITCH_RUNNING_CONFIG_CHANGE_OID = HP_SWITCH_CONFIG_NOTIFICATIONS_OID + (1, )
+HP_SWITCH_STARTUP_CONFIG_CHANGE_OID = HP_SWITCH_CONFIG_NOTIFICATIONS_OID + (2, )
+
+# sysUpTime.0 and snmpTrapOID.0, the first two varbinds of every SNMPv2 notification
+SYS_UP_TIME_OID = (1, 3, 6, 1, 2, 1, 1, 3, 0)
+SNMP_TRAP_OID_OID = (1, 3, 6, 1, 6, 3, 1, 1, 4, 1, 0)
+
+# Columns of ifTable, whose instances in link notifications identify the interface
+IF_ENTRY_OID = (1, 3, 6, 1, 2, 1, 2, 2, 1)
+
+# Kinds of TrapEvents
+LINK_UP = "linkUp"
+LINK_DOWN = "linkDown"
+COLD_START = "coldStart"
+WARM_START = "warmStart"
+CONFIG_CHANGE = "configChange"
+OTHER = "other"
+
+NOTIFICATION_KINDS = {
+    LINK_UP_OID: LINK_UP,
+    LINK_DOWN_OID: LINK_DOWN,
+    COLD_START_OID: COLD_START,
+    WARM_START_OID: WARM_START,
+    HP_SWITCH_RUNNING_CONFIG_CHANGE_OID: CONFIG_CHANGE,
+    HP_SWITCH_STARTUP_CONFIG_CHANGE_OID: CONFIG_CHANGE,
+}
+
+
+class Notification(object):
+    """
+    A decoded SNMPv1 trap, SNMPv2c trap or SNMPv2c inform.
+
+    SNMPv1 traps are translated to SNMPv2 notification OIDs as described in RFC 3584.
+    """
+    def __init__(self, community, notification_oid, uptime, varbinds, agent_address=None, inform_request_id=None):
+        self.community = community
+        self.notification_oid = notification_oid
+        # sysUpTime of the agent when the notification was sent, in hundredths of a second
+        self.uptime = uptime
+        # The (oid, value) pairs of the notification other than sysUpTime.0 and snmpTrapOID.0
+        self.varbinds = varbinds
+        # The agent address of SNMPv1 traps
+        self.agent_address = agent_address
+        # The request ID of informs, which need to be acknowledged
+        self.inform_request_id = inform_request_id
+
+
+def decode_notification(data):
+    """
+    Decode the SNMP notification message `data`.
+
+    Returns a Notification, or None if `data` is not an SNMPv1 or SNMPv2c trap or inform.
+    """
+    try:
+        version = int(api.decodeMessageVersion(data))
+        pMod = api.protoModules[version]
+        message, rest = decoder.decode(data, asn1Spec=pMod.Message())
+    except Exception:
+        return None
+    community = str(pMod.apiMessage.getCommunity(message))
+    pdu = pMod.apiMessage.getPDU(message)
+
+    if version == api.protoVersion1:
+        if pdu.tagSet != pMod.TrapPDU.tagSet:
+            return None
+        generic_trap = int(pMod.apiTrapPDU.getGenericTrap(pdu))
+        # enterpriseSpecific == 6
+        if generic_trap == 6:
+            specific_trap = int(pMod.apiTrapPDU.getSpecificTrap(pdu))
+            notification_oid = tuple(pMod.apiTrapPDU.getEnterprise(pdu)) + (0, specific_trap)
+        else:
+            notification_oid = SNMP_TRAPS_OID + (generic_trap + 1, )
+        varbinds = [(tuple(oid), value) for (oid, value) in pMod.apiTrapPDU.getVarBinds(pdu)]
+        return Notification(community, notification_oid, int(pMod.apiTrapPDU.getTimeStamp(pdu)), varbinds,
+                agent_address=str(pMod.apiTrapPDU.getAgentAddr(pdu).prettyPrint()))
+
+    if pdu.tagSet not in (pMod.SNMPv2TrapPDU.tagSet, pMod.InformRequestPDU.tagSet):
+        return None
+    uptime = 0
+    notification_oid = None
+    varbinds = []
+    for oid, value in pMod.apiPDU.getVarBinds(pdu):
+        oid = tuple(oid)
+        if oid == SYS_UP_TIME_OID:
+            uptime = int(value)
+        elif oid == SNMP_TRAP_OID_OID:
+            notification_oid = tuple(value)
+        else:
+            varbinds.append((oid, value))
+    if notification_oid is None:
+        return None
+    inform_request_id = None
+    if pdu.tagSet == pMod.InformRequestPDU.tagSet:
+        inform_request_id = int(pMod.apiPDU.getRequestID(pdu))
+    return Notification(community, notification_oid, uptime, varbinds, inform_request_id=inform_request_id)
+
+
+def encode_inform_response(data):
+    """
+    Encode the acknowledgement of the SNMPv2c inform message `data`.
+    """
+    pMod = api.protoModules[api.protoVersion2c]
+    message, rest = decoder.decode(data, asn1Spec=pMod.Message())
+    response_message = pMod.apiMessage.getResponse(message)
+    response_pdu = pMod.apiMessage.getPDU(response_message)
+    pMod.apiPDU.setVarBinds(response_pdu, pMod.apiPDU.getVarBinds(pMod.apiMessage.getPDU(message)))
+    return encoder.encode(response_message)
+
+
+class TrapEvent(object):
+    """
+    A notification received from a switch, mapped to the objects it concerns.
+    """
+    def __init__(self, switch, kind, notification, sender, port=None, vlan=None):
+        self.switch = switch
+        # One of LINK_UP, LINK_DOWN, COLD_START, WARM_START, CONFIG_CHANGE and OTHER
+        self.kind = kind
+        self.notification = notification
+        # The address the notification was received from
+        self.sender = sender
+        # The Port or VLAN whose interface changed its state, for link notifications
+        self.port = port
+        self.vlan = vlan
+        self.received = time.time()
+
+    notification_oid = property(lambda self: self.notification.notification_oid)
+
+    varbinds = property(lambda self: self.notification.varbinds)
+
+    def __repr__(self):
+        subject = self.port.base_port if self.port is not None else self.vlan.vid if self.vlan is not None else ""
+        return "<TrapEvent {0} {1} from {2}>".format(self.kind, subject, self.sender[0])
+
+
+class TrapProcessor(object):
+    """
+    Maps notifications to the switches that sent them, invalidates cached values of the switches and publishes
+    TrapEvents to subscribers.
+
+    Link notifications invalidate the cached values of the interface they concern; coldStart, warmStart and
+    configuration change notifications drop all cached values of the switch and mark its port alias index as stale.
+    Notifications are only accepted from the `community`, unless it is None, and from the switches added to the
+    processor. If `accept_unknown_senders` is set, notifications from other senders are published as well, as
+    TrapEvents without a switch. Further notification OIDs to be treated as configuration changes, for instance those of
+    other vendors, can be added to `config_change_oids`.
+    """
+    port_class = Port
+    vlan_class = VLAN
+
+    def __init__(self, switches=(), community="public", accept_unknown_senders=False):
+        self.community = community
+        self.accept_unknown_senders = accept_unknown_senders
+        self.config_change_oids = set()
+        # Maps IP addresses to the switches having them
+        self.switches = {}
+        self.subscribers = []
+        self.received = 0
+        self.rejected = 0
+        for switch in switches:
+            self.add_switch(switch)
+
+    def add_switch(self, switch):
+        """
+        Accept notifications from all addresses that the hostname of `switch` resolves to.
+        """
+        for family, socktype, proto, canonname, address in socket.getaddrinfo(switch.hostname, None, 0,
+                socket.SOCK_DGRAM):
+            self.switches[address[0]] = switch
+
+    def subscribe(self, callback):
+        """
+        Call `callback` with each TrapEvent.
+        """
+        self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        self.subscribers.remove(callback)
+
+    def _get_kind(self, notification_oid):
+        if notification_oid in self.config_change_oids:
+            return CONFIG_CHANGE
+        return NOTIFICATION_KINDS.get(notification_oid, OTHER)
+
+    def process(self, data, sender):
+        """
+        Process the notification message `data` received from the address `sender`.
+
+        Returns the TrapEvent and the response message to send back, if any; the event is None if the message is not
+        an acceptable notification.
+        """
+        notification = decode_notification(data)
+        if notification is None or (self.community is not None and notification.community != self.community):
+            self.rejected += 1
+            return None, None
+        switch = self.switches.get(sender[0])
+        if switch is None and notification.agent_address is not None:
+            switch = self.switches.get(notification.agent_address)
+        if switch is None and not self.accept_unknown_senders:
+            self.rejected += 1
+            return None, None
+        self.received += 1
+
+        event = TrapEvent(switch, self._get_kind(notification.notification_oid), notification, sender)
+        if switch is not None:
+            if event.kind in (LINK_UP, LINK_DOWN):
+                self._map_interface(event)
+            self._invalidate(event)
+        response = encode_inform_response(data) if notification.inform_request_id is not None else None
+        return event, response
+
+    def _map_interface(self, event):
+        for oid, value in event.varbinds:
+            if oid[:len(IF_ENTRY_OID)] == IF_ENTRY_OID:
+                ifindex = oid[-1]
+                if ifindex > VLAN_IFINDEX_OFFSET:
+                    event.vlan = self.vlan_class(event.switch, ifindex - VLAN_IFINDEX_OFFSET)
+                else:
+                    # The ifindex of a port is its base port
+                    event.port = self.port_class(event.switch, base_port=ifindex)
+                return
+
+    def _invalidate(self, event):
+        switch = event.switch
+        # Switches accessed through asyncio have no read cache
+        cache = getattr(switch, "cache", None)
+        if event.kind in (COLD_START, WARM_START, CONFIG_CHANGE):
+            if cache is not None:
+                cache.clear(switch.hostname)
+            alias_index = getattr(switch, "_alias_index", None)
+            if alias_index is not None:
+                # Rebuilt on next use
+                alias_index.built_at = None
+        elif cache is not None:
+            for oid, value in event.varbinds:
+                cache.invalidate(switch.hostname, oid)
+            interface = event.port or event.vlan
+            if interface is not None:
+                for name in ("ifOperStatus", "ifAdminStatus"):
+                    cache.invalidate(switch.hostname, switch.mib_registry.get_oid((name, interface.ifindex)))
+
+    def publish(self, event):
+        for callback in self.subscribers:
+            try:
+                callback(event)
+            except Exception:
+                # A failing subscriber must not stop the others or the listener
+                pass
+
+
+class TrapListener(TrapProcessor):
+    """
+    Receives SNMP notifications on a local UDP port in a background thread.
+
+    Subscribers are called from the listener thread.
+    """
+    def __init__(self, switches=(), community="public", host="0.0.0.0", port=162, accept_unknown_senders=False):
+        TrapProcessor.__init__(self, switches, community, accept_unknown_senders)
+        self.host = host
+        self.port = port
+        self.address = None
+        self._socket = None
+        self._thread = None
+        self._running = False
+
+    def _bind(self):
+        """
+        Open the socket and bind it to the local address of the listener.
+        """
+        sock = socket.socket(socket.AF_INET6 if ":" in self.host else socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            sock.bind((self.host, self.port))
+        except socket.error:
+            sock.close()
+            raise
+        self._socket = sock
+        self.address = sock.getsockname()
+
+    def start(self):
+        """
+        Bind the socket and start receiving notifications in a background thread.
+        """
+        if self._socket is None:
+            self._bind()
+        self._running = True
+        self._thread = threading.Thread(target=self._serve, name="SNMP trap listener")
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stop receiving notifications and close the socket.
+        """
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def serve_forever(self):
+        """
+        Receive and process notifications until `stop` is called, binding the socket first if necessary.
+        """
+        if self._socket is None:
+            self._bind()
+        self._running = True
+        self._serve()
+
+    def _serve(self):
+        sock = self._socket
+        # Wake up regularly to notice when the listener is stopped
+        sock.settimeout(0.5)
+        while self._running:
+            try:
+                data, sender = sock.recvfrom(65535)
+            except socket.timeout:
+                continue
+            except socket.error:
+                if not self._running:
+                    return
+                raise
+            event, response = self.process(data, sender)
+            if response is not None:
+                sock.sendto(response, sender)
+            if event is not None:
+                self.publish(event)
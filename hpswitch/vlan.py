@@ -4,41 +4,72 @@ import struct
 from pysnmp.proto import rfc1902
 import ipaddress
 
-from port import Port
+from hpswitch.port import Port, PortSet, intern_object
+
+# The ifindex of a VLAN interface is its VLAN ID plus this offset
+VLAN_IFINDEX_OFFSET = 577
 
 class VLAN(object):
     """
     Represents a 802.1Q VLAN.
+
+    VLANs are immutable value objects that are interned per switch like Ports.
     """
-    def __init__(self, switch, vid):
+    __slots__ = ("switch", "vid", "__weakref__")
+
+    def __new__(cls, switch, vid, create=False):
+        return intern_object(cls, switch, vid, vid=vid)
+
+    def __init__(self, switch, vid, create=False):
         """
         Constructs a new VLAN with the given VLAN ID `vid` on the given `switch`.
+
+        The switch is not contacted unless `create` is set, in which case the VLAN is created on the switch if it is
+        not known there yet.
         """
-        self.vid = vid
-        self.switch = switch
+        if create:
+            self.create()
+
+    def _get_exists(self):
+        """
+        Whether the VLAN is known on the switch.
+        """
+        return bool(self.switch.snmp_get(("dot1qVlanStaticRowStatus", self.vid)))
 
-        # Make sure that the VLAN is known on the switch
-        if not bool(self.switch.snmp_get(("dot1qVlanStaticRowStatus", self.vid))):
-            # create the VLAN on the switch: createAndGo == 4
-            self.switch.snmp_set((("dot1qVlanStaticRowStatus", self.vid), rfc1902.Integer(4)))
+    exists = property(_get_exists)
+
+    def create(self):
+        """
+        Create the VLAN on the switch unless it is already known there.
+        """
+        self.switch.create_vlans([self.vid])
 
     def _get_ifindex(self):
         # TODO: is this correct?
-        return self.vid + 577
+        return self.vid + VLAN_IFINDEX_OFFSET
 
     ifindex = property(_get_ifindex)
 
     def __eq__(self, other):
-        return self.vid == other.vid and self.switch == other.switch
+        return isinstance(other, VLAN) and self.vid == other.vid and self.switch == other.switch
 
     def __ne__(self, other):
         return not self.__eq__(other)
 
+    def __hash__(self):
+        return hash((self.switch, self.vid))
+
+    def __setattr__(self, name, value):
+        # Rebinding the attributes that identify an interned VLAN would change its hash and alias other users
+        if name in ("switch", "vid"):
+            raise AttributeError("Cannot change the {0} of a VLAN".format(name))
+        object.__setattr__(self, name, value)
+
     def _get_name(self):
         """
         The name configured for the VLAN.
         """
-        return unicode(self.switch.snmp_get(("dot1qVlanStaticName", self.vid)))
+        return str(self.switch.snmp_get(("dot1qVlanStaticName", self.vid)))
 
     def _set_name(self, value):
         # Make sure that the name is legal according to the allowed VLAN names detailed in section 1-40 of the HP
@@ -52,16 +83,8 @@ class VLAN(object):
         """
         Get the IPv4 addresses configured configured for this VLAN.
         """
-        # Get all address Entries in hpicfIpAddressTable
-        vlan_ipv4_address_prefix_length_entries = self.switch.snmp_get_subtree(("hpicfIpAddressPrefixLength", self.ifindex, 1))
-
-        ipv4_addresses = []
-        for result in vlan_ipv4_address_prefix_length_entries:
-            # Build an IPv4 address from the last 4 components of the oid
-            ipv4_address_string = reduce(lambda a, b: a + "." + b, map(unicode, tuple(result[0][-4:])))
-            ipv4_prefix_length_string = unicode(result[1])
-            ipv4_addresses.append(ipaddress.IPv4Interface(ipv4_address_string + "/" + ipv4_prefix_length_string))
-        return ipv4_addresses
+        return [get_ip_interface(tuple(oid)[-4:], prefix_length) for (oid, prefix_length)
+                in self.switch.snmp_iter_subtree(("hpicfIpAddressPrefixLength", self.ifindex, 1))]
 
     ipv4_addresses = property(_get_ipv4_addresses)
 
@@ -71,18 +94,7 @@ class VLAN(object):
 
         `address` should be of type ipaddress.IPv4Interface.
         """
-        ipv4_address_tuple = struct.unpack("4B", address.ip.packed)
-        self.switch.snmp_set(
-                (("ipv4InterfaceEnableStatus", self.ifindex), rfc1902.Integer(1)),
-                # hpicfIpv4InterfaceDhcpEnable off
-                (("hpicfIpv4InterfaceDhcpEnable", self.ifindex), rfc1902.Integer(2)),
-                (("hpicfIpAddressPrefixLength", self.ifindex, 1, 4) + ipv4_address_tuple,
-                    rfc1902.Gauge32(address.prefixlen)),
-                # hpicfIpAddressType unicast
-                (("hpicfIpAddressType", self.ifindex, 1, 4) + ipv4_address_tuple, rfc1902.Integer(1)),
-                # hpicfIpAddressRowStatus createAndGo 4
-                (("hpicfIpAddressRowStatus", self.ifindex, 1, 4) + ipv4_address_tuple, rfc1902.Integer(4))
-                )
+        self.switch.snmp_set(*get_add_ip_address_varbinds(self.ifindex, address))
 
     def remove_ipv4_address(self, address):
         """
@@ -90,38 +102,14 @@ class VLAN(object):
 
         `address` should be of type ipaddress.IPv4Interface.
         """
-        ipv4_address_tuple = struct.unpack("4B", address.ip.packed)
-        self.switch.snmp_set(
-                # hpicfIpAddressRowStatus destroy 6
-                (("hpicfIpAddressRowStatus", self.ifindex, 1, 4) + ipv4_address_tuple, rfc1902.Integer(6))
-                )
+        self.switch.snmp_set(*get_remove_ip_address_varbinds(self.ifindex, address))
 
     def _get_ipv6_addresses(self):
         """
         Get the IPv6 addresses configured for this VLAN.
         """
-        # Get all address Entries in hpicfIpAddressTable
-        vlan_ipv6_address_prefix_length_entries = self.switch.snmp_get_subtree(("hpicfIpAddressPrefixLength", self.ifindex, 2))
-
-        ipv6_addresses = []
-        for result in vlan_ipv6_address_prefix_length_entries:
-            # Build an IPv6 address from the last 16 components of the oid
-            ipv6_address_string_without_colons = reduce(
-                    lambda a, b: a + b, 
-                    map(lambda x: unicode("%02x" % x), tuple(result[0][-16:]))
-                    )
-            ipv6_address_string = ""
-            while True:
-                ipv6_address_string += ipv6_address_string_without_colons[:4]
-                ipv6_address_string_without_colons = ipv6_address_string_without_colons[4:]
-                if len(ipv6_address_string_without_colons) != 0:
-                    ipv6_address_string += ":"
-                else:
-                    break
-
-            ipv6_prefix_length_string = unicode(result[1])
-            ipv6_addresses.append(ipaddress.IPv6Interface(ipv6_address_string + "/" + ipv6_prefix_length_string))
-        return ipv6_addresses
+        return [get_ip_interface(tuple(oid)[-16:], prefix_length) for (oid, prefix_length)
+                in self.switch.snmp_iter_subtree(("hpicfIpAddressPrefixLength", self.ifindex, 2))]
 
     ipv6_addresses = property(_get_ipv6_addresses)
 
@@ -131,24 +119,7 @@ class VLAN(object):
 
         `address` should be of type ipaddress.IPv6Interface.
         """
-        # TODO: Convert a HP-ICF-IPCONFIG with this OID to pysnmp format
-        hpicfIpv6InterfaceCfgEnableStatus = (1, 3, 6, 1, 4, 1, 11, 2, 14, 11, 1, 10, 3, 2, 1, 1, 6)
-        hpicfIpv6InterfaceManual = (1, 3, 6, 1, 4, 1, 11, 2, 14, 11, 1, 10, 3, 2, 1, 1, 2)
-
-        ipv6_address_tuple = struct.unpack("16B", address.ip.packed)
-        self.switch.snmp_set(
-                # Set enabled and configure a link-local address
-                (hpicfIpv6InterfaceCfgEnableStatus + (self.ifindex, ), rfc1902.Integer(1)),
-                # Enable manual address configuration
-                (hpicfIpv6InterfaceManual + (self.ifindex, ), rfc1902.Integer(1)),
-                (("ipv6InterfaceEnableStatus", self.ifindex), rfc1902.Integer(1)),
-                (("hpicfIpAddressPrefixLength", self.ifindex, 2, 16) + ipv6_address_tuple,
-                    rfc1902.Gauge32(address.prefixlen)),
-                # hpicfIpAddressType unicast
-                (("hpicfIpAddressType", self.ifindex, 2, 16) + ipv6_address_tuple, rfc1902.Integer(1)),
-                # hpicfIpAddressRowStatus createAndGo 4
-                (("hpicfIpAddressRowStatus", self.ifindex, 2, 16) + ipv6_address_tuple, rfc1902.Integer(4))
-                )
+        self.switch.snmp_set(*get_add_ip_address_varbinds(self.ifindex, address))
 
     def remove_ipv6_address(self, address):
         """
@@ -156,11 +127,7 @@ class VLAN(object):
 
         `address` should be of type ipaddress.IPv6Interface.
         """
-        ipv6_address_tuple = struct.unpack("16B", address.ip.packed)
-        self.switch.snmp_set(
-                # hpicfIpAddressRowStatus destroy 6
-                (("hpicfIpAddressRowStatus", self.ifindex, 2, 16) + ipv6_address_tuple, rfc1902.Integer(6))
-                )
+        self.switch.snmp_set(*get_remove_ip_address_varbinds(self.ifindex, address))
 
     @staticmethod
     def _set_port_list_port_status(port_list, port, status):
@@ -168,35 +135,28 @@ class VLAN(object):
         Return a new port list that is identical to the given `port_list` except that the bit corresponding to `port` is
         set to the binary value of `status`.
         """
-        # Calculate the byte in `port_list` that needs to be modified as well as the bit within that byte.
-        byte_position = (port.base_port - 1) / 8
-        bit_position = 7 - ((port.base_port - 1) % 8)
-
+        port_set = PortSet.from_port_list(None, port_list)
         if status:
-            newbyte = chr(ord(port_list[byte_position]) | (1 << bit_position))
+            port_set.add(port)
         else:
-            newbyte = chr(ord(port_list[byte_position]) & (~(1 << bit_position)))
-
-        new_port_list = port_list[:byte_position] + newbyte + port_list[(byte_position + 1):]
-        return new_port_list
+            port_set.discard(port)
+        return port_set.to_port_list()
 
     def _get_port_list_enabled_ports(self, port_list):
         """
-        Return a list of Ports corresponding to the ports marked as enabled in the given `port_list`.
+        Return a PortSet of the ports marked as enabled in the given `port_list`.
         """
-        from port import get_port_list_enabled_ports
-        return get_port_list_enabled_ports(self.switch, port_list)
+        return PortSet.from_port_list(self.switch, port_list)
 
     def _get_tagged_ports(self):
         """
-        Get a list of ports that have this VLAN configured as tagged.
+        Get a PortSet of ports that have this VLAN configured as tagged.
         """
-        dot1qVlanStaticEgressPorts = self.switch.snmp_get(("dot1qVlanStaticEgressPorts", self.vid))
-        egress_ports = self._get_port_list_enabled_ports(dot1qVlanStaticEgressPorts)
+        dot1qVlanStaticEgressPorts, dot1qVlanStaticUntaggedPorts = self.switch.snmp_get_many(
+                [("dot1qVlanStaticEgressPorts", self.vid), ("dot1qVlanStaticUntaggedPorts", self.vid)])
         # Filter out all untagged ports
-        untagged_ports = self.untagged_ports
-        tagged_ports = filter(lambda port: port not in untagged_ports, egress_ports)
-        return tagged_ports
+        return (self._get_port_list_enabled_ports(dot1qVlanStaticEgressPorts)
+                - self._get_port_list_enabled_ports(dot1qVlanStaticUntaggedPorts))
 
     tagged_ports = property(_get_tagged_ports)
 
@@ -219,7 +179,7 @@ class VLAN(object):
 
     def _get_untagged_ports(self):
         """
-        Get a list of ports that have this VLAN configured as untagged.
+        Get a PortSet of ports that have this VLAN configured as untagged.
         """
         dot1qVlanStaticUntaggedPorts = self.switch.snmp_get(("dot1qVlanStaticUntaggedPorts", self.vid))
         return self._get_port_list_enabled_ports(dot1qVlanStaticUntaggedPorts)
@@ -227,25 +187,14 @@ class VLAN(object):
     untagged_ports = property(_get_untagged_ports)
 
     def _set_port_untagged_status(self, port, status):
-        previous_untagged_vlan = port.untagged_vlan
-        if status == True:
-            # To add a port to a VLAN untagged, it first needs to be added as tagged
-            self.add_tagged_port(port)
-        # Add the port to the list of untagged ports for this VLAN
-        dot1qVlanStaticUntaggedPorts = self.switch.snmp_get(("dot1qVlanStaticUntaggedPorts", self.vid))
-        new_untagged_port_list = VLAN._set_port_list_port_status(dot1qVlanStaticUntaggedPorts, port, status)
-        self.switch.snmp_set((("dot1qVlanStaticUntaggedPorts", self.vid), rfc1902.OctetString(new_untagged_port_list)))
-        # Only set the pvid if the port is being added to the VLAN
-        if status == True:
-            self.switch.snmp_set((("dot1qPvid", port.base_port), rfc1902.Gauge32(self.vid)))
-            # Remove the port from the VLAN that it belonged to before
-            if previous_untagged_vlan is not None and self != previous_untagged_vlan:
-                previous_untagged_vlan.remove_untagged_port(port)
-        # If the port was just removed from dot1qVlanStaticUntaggedPorts, it is still in dot1qVlanStaticEgressPorts and
-        # therefore still egresses this VLAN tagged
-        if status == False:
-            self.remove_tagged_port(port)
-
+        with self.switch.vlan_changes() as changes:
+            if status == True:
+                # Also removes the port from the VLAN that it belonged to before and sets the PVID
+                changes.untag(port, self)
+            else:
+                # The port is removed from dot1qVlanStaticEgressPorts as well, so that it does not egress this VLAN
+                # tagged
+                changes.remove(port, self)
 
     def add_untagged_port(self, port):
         """
@@ -258,3 +207,425 @@ class VLAN(object):
         Remove this VLAN as untagged from the Port `port`.
         """
         self._set_port_untagged_status(port, False)
+
+
+def get_ip_interface(address_octets, prefix_length):
+    """
+    Build an IPv4Interface or IPv6Interface from the 4 or 16 octets of an address in an OID and a prefix length.
+    """
+    packed_address = struct.pack("{0}B".format(len(address_octets)), *address_octets)
+    if len(address_octets) == 4:
+        return ipaddress.IPv4Interface((packed_address, int(prefix_length)))
+    return ipaddress.IPv6Interface((packed_address, int(prefix_length)))
+
+
+def get_add_ip_address_varbinds(ifindex, address, enable_interface=True):
+    """
+    Get the (oid, value) pairs that add the IPv4Interface or IPv6Interface `address` to the VLAN interface `ifindex`.
+
+    Unless `enable_interface` is False, the pairs also enable the interface for the IP version of `address`. Pass
+    False for all but the first of several addresses of the same version added to an interface in one SET.
+    """
+    if address.version == 4:
+        address_tuple = (1, 4) + struct.unpack("4B", address.ip.packed)
+        varbinds = [
+                (("ipv4InterfaceEnableStatus", ifindex), rfc1902.Integer(1)),
+                # hpicfIpv4InterfaceDhcpEnable off
+                (("hpicfIpv4InterfaceDhcpEnable", ifindex), rfc1902.Integer(2)),
+                ]
+    else:
+        # TODO: Convert a HP-ICF-IPCONFIG with this OID to pysnmp format
+        hpicfIpv6InterfaceCfgEnableStatus = (1, 3, 6, 1, 4, 1, 11, 2, 14, 11, 1, 10, 3, 2, 1, 1, 6)
+        hpicfIpv6InterfaceManual = (1, 3, 6, 1, 4, 1, 11, 2, 14, 11, 1, 10, 3, 2, 1, 1, 2)
+        address_tuple = (2, 16) + struct.unpack("16B", address.ip.packed)
+        varbinds = [
+                # Set enabled and configure a link-local address
+                (hpicfIpv6InterfaceCfgEnableStatus + (ifindex, ), rfc1902.Integer(1)),
+                # Enable manual address configuration
+                (hpicfIpv6InterfaceManual + (ifindex, ), rfc1902.Integer(1)),
+                (("ipv6InterfaceEnableStatus", ifindex), rfc1902.Integer(1)),
+                ]
+    if not enable_interface:
+        varbinds = []
+    return varbinds + [
+            (("hpicfIpAddressPrefixLength", ifindex) + address_tuple, rfc1902.Gauge32(address.network.prefixlen)),
+            # hpicfIpAddressType unicast
+            (("hpicfIpAddressType", ifindex) + address_tuple, rfc1902.Integer(1)),
+            # hpicfIpAddressRowStatus createAndGo 4
+            (("hpicfIpAddressRowStatus", ifindex) + address_tuple, rfc1902.Integer(4)),
+            ]
+
+
+def get_remove_ip_address_varbinds(ifindex, address):
+    """
+    Get the (oid, value) pairs that remove the IPv4Interface or IPv6Interface `address` from the VLAN interface
+    `ifindex`.
+    """
+    if address.version == 4:
+        address_tuple = (1, 4) + struct.unpack("4B", address.ip.packed)
+    else:
+        address_tuple = (2, 16) + struct.unpack("16B", address.ip.packed)
+    # hpicfIpAddressRowStatus destroy 6
+    return [(("hpicfIpAddressRowStatus", ifindex) + address_tuple, rfc1902.Integer(6))]
+
+
+class IPAddressIndex(object):
+    """
+    The IP addresses configured on the VLAN interfaces of a switch, indexed by interface and by address.
+
+    Use `Switch.ip_addresses` to read the addresses of all VLANs at once. Finding the VLAN that has an address or a
+    subnet containing an address takes one dict lookup per distinct prefix length configured on the switch.
+    """
+    def __init__(self, switch, addresses):
+        """
+        Construct a new index of the (ifindex, IPv4Interface or IPv6Interface) pairs in `addresses`.
+        """
+        self.switch = switch
+        # Maps ifindexes to the interface addresses configured on them
+        self._ifindex_addresses = {}
+        # Maps IPv4Addresses and IPv6Addresses to the ifindex they are configured on
+        self._address_ifindexes = {}
+        # Maps (IP version, prefix length, network address as an integer) to the ifindexes having this subnet
+        self._network_ifindexes = {}
+        # Maps IP versions to the prefix lengths configured for them, longest first
+        self._prefix_lengths = {}
+        for ifindex, address in addresses:
+            self._ifindex_addresses.setdefault(ifindex, []).append(address)
+            self._address_ifindexes[address.ip] = ifindex
+            network = address.network
+            self._network_ifindexes.setdefault((network.version, network.prefixlen,
+                    int(network.network_address)), []).append(ifindex)
+        for version, prefix_length, network_address in self._network_ifindexes:
+            self._prefix_lengths.setdefault(version, set()).add(prefix_length)
+        self._prefix_lengths = dict((version, sorted(prefix_lengths, reverse=True))
+                for (version, prefix_lengths) in self._prefix_lengths.items())
+
+    ifindexes = property(lambda self: sorted(self._ifindex_addresses),
+            doc="The sorted ifindexes of all interfaces with IP addresses.")
+
+    def __len__(self):
+        return len(self._address_ifindexes)
+
+    def __iter__(self):
+        """
+        Iterate over (ifindex, address) pairs ordered by ifindex.
+        """
+        for ifindex in self.ifindexes:
+            for address in self._ifindex_addresses[ifindex]:
+                yield ifindex, address
+
+    @staticmethod
+    def _get_ifindex(vlan):
+        return vlan if isinstance(vlan, int) else vlan.ifindex
+
+    def get_addresses(self, vlan):
+        """
+        Get the IPv4Interfaces and IPv6Interfaces configured on `vlan`, given as VLAN object or ifindex.
+        """
+        return list(self._ifindex_addresses.get(IPAddressIndex._get_ifindex(vlan), ()))
+
+    def get_ipv4_addresses(self, vlan):
+        return [address for address in self.get_addresses(vlan) if address.version == 4]
+
+    def get_ipv6_addresses(self, vlan):
+        return [address for address in self.get_addresses(vlan) if address.version == 6]
+
+    def get_ifindex(self, address):
+        """
+        Get the ifindex of the interface that `address` belongs to, or None if no interface matches.
+
+        For an IPv4Address or IPv6Address, this is the interface that has `address` configured and otherwise the one
+        with the longest subnet containing it. For an IPv4Network or IPv6Network, it is the interface with the longest
+        subnet containing the network. For an IPv4Interface or IPv6Interface, its address is looked up first and then
+        its network.
+        """
+        # Interfaces are subclasses of addresses, so they need to be told apart first
+        if isinstance(address, (ipaddress.IPv4Interface, ipaddress.IPv6Interface)):
+            ifindex = self._address_ifindexes.get(address.ip)
+            if ifindex is not None:
+                return ifindex
+            return self._get_network_ifindex(address.network)
+        if isinstance(address, (ipaddress.IPv4Network, ipaddress.IPv6Network)):
+            return self._get_network_ifindex(address)
+        if isinstance(address, (ipaddress.IPv4Address, ipaddress.IPv6Address)):
+            ifindex = self._address_ifindexes.get(address)
+            if ifindex is not None:
+                return ifindex
+            return self._get_network_ifindex(ipaddress.ip_network(address))
+        raise TypeError("Expected an IP address, interface or network, not {0!r}".format(address))
+
+    def _get_network_ifindex(self, network):
+        """
+        Get the ifindex of the interface with the longest subnet containing `network`, or None if there is none.
+        """
+        value = int(network.network_address)
+        for prefix_length in self._prefix_lengths.get(network.version, ()):
+            if prefix_length > network.prefixlen:
+                continue
+            host_bits = network.max_prefixlen - prefix_length
+            ifindexes = self._network_ifindexes.get((network.version, prefix_length, value >> host_bits << host_bits))
+            if ifindexes:
+                return ifindexes[0]
+        return None
+
+    def get_vlan(self, address):
+        """
+        Get the VLAN that `address` belongs to, see `get_ifindex`, or None if there is none.
+        """
+        ifindex = self.get_ifindex(address)
+        if ifindex is None:
+            return None
+        return VLAN(self.switch, ifindex - VLAN_IFINDEX_OFFSET)
+
+
+class VLANMembership(object):
+    """
+    A snapshot of the VLAN membership of all ports of a switch.
+
+    Use `Switch.vlan_membership` to take a snapshot. VLANs are identified by their VLAN ID and ports by their base port
+    number or a Port object; sets of ports are returned as PortSets.
+    """
+    def __init__(self, switch, egress_port_lists, untagged_port_lists, pvids):
+        """
+        Construct a new snapshot from the `dot1qVlanStaticEgressPorts` and `dot1qVlanStaticUntaggedPorts` port lists
+        indexed by VLAN ID and the `dot1qPvid` values indexed by base port.
+        """
+        self.switch = switch
+        self._egress_port_sets = dict((vid, PortSet.from_port_list(switch, port_list))
+                for (vid, port_list) in egress_port_lists.items())
+        self._untagged_port_sets = dict((vid, PortSet.from_port_list(switch, port_list))
+                for (vid, port_list) in untagged_port_lists.items())
+        self.pvids = pvids
+        # Maps base ports to the sorted VLAN IDs they egress, built on first use
+        self._port_vids = None
+
+    vids = property(lambda self: sorted(self._egress_port_sets))
+
+    def _get_port_vids(self):
+        if self._port_vids is None:
+            port_vids = {}
+            for vid in self.vids:
+                for base_port in self._egress_port_sets[vid].base_ports():
+                    port_vids.setdefault(base_port, []).append(vid)
+            self._port_vids = port_vids
+        return self._port_vids
+
+    def ports(self, vid):
+        """
+        Get a PortSet of the ports that are members of the VLAN `vid`, either tagged or untagged.
+        """
+        return self._egress_port_sets.get(vid, PortSet(self.switch)).copy()
+
+    def tagged_ports(self, vid):
+        """
+        Get a PortSet of the ports that have the VLAN `vid` configured as tagged.
+        """
+        return self.ports(vid) - self._untagged_port_sets.get(vid, PortSet(self.switch))
+
+    def untagged_ports(self, vid):
+        """
+        Get a PortSet of the ports that have the VLAN `vid` configured as untagged.
+        """
+        return self._untagged_port_sets.get(vid, PortSet(self.switch)).copy()
+
+    def vlans(self, port):
+        """
+        Get the sorted VLAN IDs of all VLANs that `port` is a member of, either tagged or untagged.
+        """
+        return list(self._get_port_vids().get(PortSet._get_base_port(port), ()))
+
+    def tagged_vlans(self, port):
+        """
+        Get the sorted VLAN IDs of the VLANs configured as tagged on `port`.
+        """
+        return [vid for vid in self.vlans(port) if port not in self._untagged_port_sets.get(vid, ())]
+
+    def untagged_vlan(self, port):
+        """
+        Get the VLAN ID of the VLAN configured as untagged on `port`, or None if there is none.
+        """
+        for vid in self.vlans(port):
+            if port in self._untagged_port_sets.get(vid, ()):
+                return vid
+        return None
+
+    def pvid(self, port):
+        """
+        Get the PVID configured for `port`.
+        """
+        return self.pvids.get(PortSet._get_base_port(port))
+
+    def pvid_mismatches(self):
+        """
+        Find the ports whose PVID is not the VLAN they are configured as untagged in.
+
+        Returns a list of (base port, PVID, untagged VLAN ID) tuples. Ports without an untagged VLAN are never included,
+        as their PVID remains at DEFAULT_VLAN.
+        """
+        mismatches = []
+        for base_port, pvid in sorted(self.pvids.items()):
+            untagged_vid = self.untagged_vlan(base_port)
+            if untagged_vid is not None and untagged_vid != pvid:
+                mismatches.append((base_port, pvid, untagged_vid))
+        return mismatches
+
+
+class VLANChangeSet(object):
+    """
+    A set of VLAN membership changes on a switch that are committed together.
+
+    Use `Switch.vlan_changes` to start a change set. The final egress and untagged port lists and PVIDs are computed in
+    memory and only the port lists and PVIDs that actually change are written, packed into as few SET requests as
+    possible.
+    """
+    def __init__(self, switch, membership=None):
+        self.switch = switch
+        self.membership = membership
+        self._operations = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+
+    @staticmethod
+    def _get_vid(vlan):
+        return vlan if isinstance(vlan, int) else vlan.vid
+
+    def tag(self, port, vlan):
+        """
+        Configure `vlan` as tagged on `port`.
+        """
+        self._operations.append(("tag", PortSet._get_base_port(port), VLANChangeSet._get_vid(vlan)))
+
+    def untag(self, port, vlan):
+        """
+        Configure `vlan` as untagged on `port`, removing `port` from the VLAN it was untagged in before.
+        """
+        self._operations.append(("untag", PortSet._get_base_port(port), VLANChangeSet._get_vid(vlan)))
+
+    def add(self, port, vlan, tagged=True):
+        """
+        Add `port` to `vlan`, either tagged or untagged.
+        """
+        if tagged:
+            self.tag(port, vlan)
+        else:
+            self.untag(port, vlan)
+
+    def remove(self, port, vlan):
+        """
+        Remove `port` from `vlan`, whether it is configured as tagged or untagged.
+        """
+        self._operations.append(("remove", PortSet._get_base_port(port), VLANChangeSet._get_vid(vlan)))
+
+    def _get_pvid_base_ports(self):
+        """
+        Get the base ports whose PVID needs to be read, as they are moved to another untagged VLAN or may be removed
+        from the VLAN they are untagged in.
+        """
+        return sorted(set(base_port for (operation, base_port, vid) in self._operations
+                if operation in ("untag", "remove")))
+
+    def _get_port_list_vids(self, pvids):
+        """
+        Get the VLAN IDs whose port lists need to be read, given the PVIDs of the ports moved to another untagged VLAN
+        or removed from a VLAN.
+        """
+        # The VLAN a port is moved away from is found through its PVID, just like in Port.untagged_vlan
+        return sorted(set(vid for (operation, base_port, vid) in self._operations) | set(pvids.values()))
+
+    def _get_port_sets(self, vids, port_lists):
+        """
+        Map `vids` to the egress and untagged PortSets built from the egress port lists of all `vids` followed by their
+        untagged port lists.
+        """
+        port_sets = [PortSet.from_port_list(self.switch, port_list) if isinstance(port_list, rfc1902.OctetString)
+                else PortSet(self.switch) for port_list in port_lists]
+        return dict(zip(vids, port_sets[:len(vids)])), dict(zip(vids, port_sets[len(vids):]))
+
+    def _read_membership(self):
+        return (dict((vid, ports.copy()) for (vid, ports) in self.membership._egress_port_sets.items()),
+                dict((vid, ports.copy()) for (vid, ports) in self.membership._untagged_port_sets.items()),
+                dict(self.membership.pvids))
+
+    def _read_state(self):
+        """
+        Get the egress and untagged PortSets of all VLANs affected by the changes as well as the PVIDs of the ports
+        moved to another untagged VLAN or removed from a VLAN.
+        """
+        if self.membership is not None:
+            return self._read_membership()
+        base_ports = self._get_pvid_base_ports()
+        pvids = dict(zip(base_ports, [int(pvid) for pvid in self.switch.snmp_get_many([("dot1qPvid", base_port)
+                for base_port in base_ports])]))
+        vids = self._get_port_list_vids(pvids)
+        port_lists = self.switch.snmp_get_many([("dot1qVlanStaticEgressPorts", vid) for vid in vids]
+                + [("dot1qVlanStaticUntaggedPorts", vid) for vid in vids])
+        egress_ports, untagged_ports = self._get_port_sets(vids, port_lists)
+        return egress_ports, untagged_ports, pvids
+
+    def get_varbinds(self):
+        """
+        Compute the (oid, value) pairs that need to be set on the switch to apply the changes in this change set.
+
+        Port lists that gain ports are set before the untagged port lists, and port lists that only lose ports after
+        them, so that untagged ports are always egress ports as well.
+        """
+        return self._get_varbinds(*self._read_state())
+
+    def _get_varbinds(self, egress_ports, untagged_ports, pvids):
+        # New port lists have the same length as the existing ones
+        size = max([ports.size for ports in egress_ports.values()] + [0])
+        new_egress_ports = dict((vid, ports.copy()) for (vid, ports) in egress_ports.items())
+        new_untagged_ports = dict((vid, ports.copy()) for (vid, ports) in untagged_ports.items())
+        new_pvids = dict(pvids)
+
+        for operation, base_port, vid in self._operations:
+            egress = new_egress_ports.setdefault(vid, PortSet(self.switch, size=size))
+            untagged = new_untagged_ports.setdefault(vid, PortSet(self.switch, size=size))
+            if operation == "tag":
+                egress.add(base_port)
+            elif operation == "untag":
+                # Remove the port from the VLAN that it was untagged in before
+                for other_vid, other_untagged in new_untagged_ports.items():
+                    if other_vid != vid and base_port in other_untagged:
+                        other_untagged.discard(base_port)
+                        new_egress_ports[other_vid].discard(base_port)
+                egress.add(base_port)
+                untagged.add(base_port)
+                new_pvids[base_port] = vid
+            elif operation == "remove":
+                egress.discard(base_port)
+                untagged.discard(base_port)
+                if new_pvids.get(base_port) == vid:
+                    # The port falls back to its remaining untagged VLAN, or to DEFAULT_VLAN if there is none
+                    new_pvids[base_port] = next((other_vid for (other_vid, other_untagged)
+                            in sorted(new_untagged_ports.items()) if base_port in other_untagged), 1)
+
+        growing_egress_varbinds = []
+        shrinking_egress_varbinds = []
+        for vid, ports in sorted(new_egress_ports.items()):
+            old_ports = egress_ports.get(vid, PortSet(self.switch))
+            if ports != old_ports:
+                varbind = (("dot1qVlanStaticEgressPorts", vid), rfc1902.OctetString(ports.to_port_list()))
+                if ports - old_ports:
+                    growing_egress_varbinds.append(varbind)
+                else:
+                    shrinking_egress_varbinds.append(varbind)
+        untagged_varbinds = [(("dot1qVlanStaticUntaggedPorts", vid), rfc1902.OctetString(ports.to_port_list()))
+                for (vid, ports) in sorted(new_untagged_ports.items())
+                if ports != untagged_ports.get(vid, PortSet(self.switch))]
+        pvid_varbinds = [(("dot1qPvid", base_port), rfc1902.Gauge32(vid))
+                for (base_port, vid) in sorted(new_pvids.items()) if pvids.get(base_port) != vid]
+        return growing_egress_varbinds + untagged_varbinds + shrinking_egress_varbinds + pvid_varbinds
+
+    def commit(self):
+        """
+        Apply the changes in this change set to the switch.
+        """
+        if self._operations:
+            self.switch.snmp_set_many(self.get_varbinds())
+            self._operations = []
@@ -8,5 +8,7 @@ setup(name='hpswitch',
         packages=['hpswitch', ],
         url='https://github.com/leonhandreke/hpswitch',
         license="MIT License",
-        install_requires=['pysnmp>=4.2.3', 'pysnmp-mibs>=0.1.4']
+        python_requires='>=3.5',
+        classifiers=['Programming Language :: Python :: 3', ],
+        install_requires=['pysnmp>=4.2.3', 'pyasn1', 'pysnmp-mibs>=0.1.4']
         )
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+Fixtures running the tests against a `SimulatedSwitchAgent` on a local UDP port.
+"""
+import pytest
+from pysnmp.smi import error
+
+from benchmarks.agent import SimulatedSwitchAgent
+from hpswitch.mib import mib_registry
+from hpswitch.switch import Switch
+
+
+class RequestRecorder(object):
+    """
+    An observer keeping the RequestEvents of all requests to a switch.
+    """
+    def __init__(self):
+        self.events = []
+
+    def request_completed(self, event):
+        self.events.append(event)
+
+    def clear(self):
+        del self.events[:]
+
+    count = property(lambda self: len(self.events))
+
+    operations = property(lambda self: [event.operation for event in self.events])
+
+
+@pytest.fixture
+def agent():
+    with SimulatedSwitchAgent(ports=48, vlans=4, ipv4_addresses=4) as agent:
+        yield agent
+
+
+@pytest.fixture
+def switch(agent):
+    switch = Switch(agent.address[0], agent.community, port=agent.address[1], timeout=1, retries=1)
+    yield switch
+    switch.close()
+
+
+@pytest.fixture
+def requests(switch):
+    recorder = RequestRecorder()
+    switch.add_observer(recorder)
+    return recorder
+
+
+@pytest.fixture
+def require_mib_object():
+    """
+    Skip the test unless the MIB defining the given object is available.
+    """
+    def require(name):
+        try:
+            mib_registry.get_oid((name, ))
+        except error.SmiError:
+            pytest.skip("MIB of {0} not available".format(name))
+    return require
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+import time
+
+import pytest
+from pysnmp.proto import rfc1902
+
+from hpswitch.port import Port, PortInstantiationError
+
+
+def test_ports_by_alias_share_one_walk(agent, switch):
+    ports = [Port(switch, alias="port{0}".format(base_port)) for base_port in (3, 17, 48)]
+    assert [port.base_port for port in ports] == [3, 17, 48]
+    walks = agent.requests_received
+    assert switch.alias_index.get_alias(17) == "port17"
+    assert agent.requests_received == walks
+
+
+def test_unknown_and_duplicate_aliases(agent, switch):
+    agent._set(("ifAlias", 5), rfc1902.OctetString("port4"))
+    with pytest.raises(PortInstantiationError):
+        Port(switch, alias="uplink")
+    with pytest.raises(PortInstantiationError):
+        Port(switch, alias="port4")
+    assert switch.alias_index.duplicates == {"port4": [4, 5]}
+    resolved = switch.alias_index.resolve(["port4", "port6", "uplink"])
+    assert resolved == {"port4": None, "port6": Port(switch, base_port=6), "uplink": None}
+
+
+def test_setting_an_alias_updates_the_index(agent, switch):
+    switch.alias_index.refresh()
+    Port(switch, base_port=7).alias = "uplink"
+    agent.reset_statistics()
+    assert Port(switch, alias="uplink").base_port == 7
+    with pytest.raises(PortInstantiationError):
+        Port(switch, alias="port7")
+    assert agent.requests_received == 0
+
+
+def test_stale_index_is_rebuilt(agent, switch, monkeypatch):
+    switch.alias_index.refresh()
+    agent._set(("ifAlias", 9), rfc1902.OctetString("uplink"))
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + switch.alias_index.ttl + 1)
+    agent.reset_statistics()
+    assert Port(switch, alias="uplink").base_port == 9
+    assert agent.requests_received > 0
+
+
+def test_unknown_alias_rebuilds_the_index_at_most_once_per_interval(agent, switch, monkeypatch):
+    switch.alias_index.refresh()
+    agent._set(("ifAlias", 9), rfc1902.OctetString("uplink"))
+    now = time.time()
+    # Too soon after the index was built
+    agent.reset_statistics()
+    with pytest.raises(PortInstantiationError):
+        Port(switch, alias="uplink")
+    assert agent.requests_received == 0
+    monkeypatch.setattr(time, "time", lambda: now + switch.alias_index.miss_refresh_interval + 1)
+    assert Port(switch, alias="uplink").base_port == 9
+    walks = agent.requests_received
+    assert walks > 0
+    with pytest.raises(PortInstantiationError):
+        Port(switch, alias="downlink")
+    assert switch.alias_index.resolve(["downlink"]) == {"downlink": None}
+    assert agent.requests_received == walks
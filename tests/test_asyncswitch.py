@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+import pytest
+
+from hpswitch.asyncswitch import AsyncPort, AsyncSwitch, AsyncVLAN
+
+
+def run(agent, coroutine_function):
+    """
+    Run `coroutine_function` with an open AsyncSwitch connected to `agent`.
+    """
+    async def main():
+        async with AsyncSwitch(agent.address[0], agent.community, port=agent.address[1], timeout=1,
+                retries=1) as switch:
+            return await coroutine_function(switch)
+    return asyncio.run(main())
+
+
+def test_snmp_get_and_get_many(agent):
+    async def get(switch):
+        return str(await switch.snmp_get(("ifAlias", 2))), await switch.snmp_get_many([("ifDescr", 1),
+                ("ifAlias", 3)])
+    alias, values = run(agent, get)
+    assert alias == "port2"
+    assert [str(value) for value in values] == ["A1", "port3"]
+
+
+def test_snmp_get_subtree_walks_all_rows(agent):
+    async def walk(switch):
+        return await switch.snmp_get_subtree(("ifAlias", ))
+    rows = run(agent, walk)
+    assert [str(value) for (oid, value) in rows] == ["port{0}".format(ifindex) for ifindex in range(1, 49)]
+
+
+def test_snmp_get_subtree_walks_like_switch(agent, switch):
+    async def walk(switch):
+        return await switch.snmp_get_subtree(("ifAlias", ))
+    agent.reset_statistics()
+    switch.snmp_get_subtree(("ifAlias", ))
+    operations = agent.operations
+    agent.reset_statistics()
+    run(agent, walk)
+    # The first request asks for max_repetitions rows, the following ones for as many as fit
+    assert agent.operations == operations == ["getbulk", "getbulk"]
+
+
+def test_port_alias_round_trip(agent):
+    async def set_alias(switch):
+        port = AsyncPort(switch, base_port=5)
+        await port.set_alias("uplink")
+        return await port.get_alias(), await switch.get_port_by_alias("uplink")
+    alias, port = run(agent, set_alias)
+    assert alias == "uplink"
+    assert port.base_port == 5
+    assert port.identifier == "A5"
+
+
+def test_vlan_name_round_trip(agent):
+    async def set_name(switch):
+        vlan = AsyncVLAN(switch, 10)
+        await vlan.set_name("servers")
+        return await vlan.get_name()
+    assert run(agent, set_name) == "servers"
+
+
+def test_blocking_properties_raise_type_error(agent):
+    async def use_properties(switch):
+        port = AsyncPort(switch, base_port=1)
+        vlan = AsyncVLAN(switch, 10)
+        with pytest.raises(TypeError):
+            port.alias
+        with pytest.raises(TypeError):
+            port.alias = "uplink"
+        with pytest.raises(TypeError):
+            vlan.untagged_ports
+        with pytest.raises(TypeError):
+            vlan.ipv4_addresses
+        with pytest.raises(TypeError):
+            AsyncPort(switch, alias="port1")
+    agent.reset_statistics()
+    run(agent, use_properties)
+    assert agent.requests_received == 0
+
+
+def test_vlans_are_created_through_create_new(agent):
+    async def create(switch):
+        with pytest.raises(ValueError):
+            AsyncVLAN(switch, 50, create=True)
+        vlan = await AsyncVLAN.create_new(switch, 50)
+        return await vlan.get_exists(), [vlan.vid for vlan in await switch.get_vlans()]
+    exists, vids = run(agent, create)
+    assert exists
+    assert vids == [1, 10, 20, 30, 50]
+
+
+def test_add_untagged_port_is_batched(agent):
+    async def untag(switch):
+        port = AsyncPort(switch, base_port=1)
+        vlan = AsyncVLAN(switch, 20)
+        agent.reset_statistics()
+        await vlan.add_untagged_port(port)
+        count = agent.requests_received
+        return count, (await port.get_untagged_vlan()).vid, await AsyncVLAN(switch, 1).get_untagged_ports()
+    count, untagged_vid, old_untagged_ports = run(agent, untag)
+    # The PVID, the port lists of the VLANs and one SET
+    assert count == 3
+    assert untagged_vid == 20
+    assert 1 not in [port.base_port for port in old_untagged_ports]
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+import json
+
+import pytest
+
+from benchmarks import run
+from hpswitch.session import SNMPTimeoutError
+from hpswitch.switch import Switch
+
+
+def test_agent_drops_requests():
+    with run.BenchmarkAgent(ports=8, vlans=2, loss=1.0) as agent:
+        switch = Switch(agent.address[0], port=agent.address[1], timeout=0.1, retries=1)
+        with pytest.raises(SNMPTimeoutError):
+            switch.snmp_get(("ifAlias", 1))
+        switch.close()
+        statistics = agent.get_statistics()
+    assert statistics["requests_received"] >= 1
+    assert statistics["requests_dropped"] == statistics["requests_received"]
+    assert statistics["responses_sent"] == 0
+
+
+def test_run_scenario_reports_packets_and_time():
+    with run.BenchmarkAgent(ports=48, vlans=4, ipv4_addresses=4) as agent:
+        result = run.run_scenario(agent, run.list_ports, repeat=2, timeout=1)
+    assert result["error"] is None
+    assert result["repeat"] == 2
+    assert result["requests_received"] == result["responses_sent"] > 0
+    assert result["bytes_received"] > 0 and result["bytes_sent"] > 0
+    assert result["wall_time"] > 0
+
+
+def test_main_runs_selected_scenarios(tmpdir, capsys):
+    output = tmpdir.join("results.json")
+    run.main(["--ports", "24", "--vlans", "4", "--repeat", "1",
+            "--scenario", "list_ports", "--scenario", "ipv4_address_listing", "--output", str(output)])
+    results = json.loads(output.read())
+    assert results["parameters"]["ports"] == 24
+    assert sorted(results["scenarios"]) == ["ipv4_address_listing", "list_ports"]
+    assert results["scenarios"]["list_ports"]["error"] is None
+    listing = results["scenarios"]["ipv4_address_listing"]
+    # Skipped where HP-ICF-IPCONFIG is not available
+    if "skipped" in listing:
+        assert "hpicfIpAddressPrefixLength" in capsys.readouterr().err
+    else:
+        assert listing["error"] is None
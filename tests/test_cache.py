@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+import time
+
+from pysnmp.proto import rfc1902, rfc1905
+
+from hpswitch.cache import ReadCache
+from hpswitch.mib import mib_registry
+from hpswitch.switch import Switch
+
+
+def get_oid(name):
+    return mib_registry.get_oid(name)
+
+
+def test_values_are_cached_per_hostname():
+    cache = ReadCache()
+    cache.store("switch1", (1, 3, 6, 1), "first")
+    cache.store("switch2", (1, 3, 6, 1), "second")
+    assert cache.lookup("switch1", (1, 3, 6, 1)) == "first"
+    assert cache.lookup("switch2", [1, 3, 6, 1]) == "second"
+    assert cache.lookup("switch3", (1, 3, 6, 1)) is None
+    assert cache.get_statistics()["hits"] == 2
+    assert cache.get_statistics()["misses"] == 1
+
+
+def test_values_expire_after_ttl_of_longest_prefix(monkeypatch):
+    cache = ReadCache(ttl=10, prefix_ttls={("ifEntry", ): 5, ("ifAlias", ): 0})
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now)
+    cache.store("switch", get_oid(("ifDescr", 1)), "A1")
+    cache.store("switch", get_oid(("ifAlias", 1)), "port1")
+    cache.store("switch", get_oid(("sysName", 0)), "switch")
+    assert cache.lookup("switch", get_oid(("ifAlias", 1))) is None
+    monkeypatch.setattr(time, "time", lambda: now + 6)
+    assert cache.lookup("switch", get_oid(("ifDescr", 1))) is None
+    assert cache.lookup("switch", get_oid(("sysName", 0))) == "switch"
+
+
+def test_host_ttls_replace_the_default_ttl_of_a_switch(monkeypatch):
+    cache = ReadCache(ttl=10, prefix_ttls={("ifAlias", ): 0}, host_ttls={"slow-switch": 60})
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now)
+    for hostname in ("switch", "slow-switch"):
+        cache.store(hostname, get_oid(("sysName", 0)), hostname)
+        cache.store(hostname, get_oid(("ifAlias", 1)), "port1")
+    monkeypatch.setattr(time, "time", lambda: now + 30)
+    assert cache.lookup("switch", get_oid(("sysName", 0))) is None
+    assert cache.lookup("slow-switch", get_oid(("sysName", 0))) == "slow-switch"
+    assert cache.lookup("slow-switch", get_oid(("ifAlias", 1))) is None
+
+
+def test_missing_objects_are_not_cached():
+    cache = ReadCache()
+    cache.store("switch", (1, 3, 6, 1), rfc1905.NoSuchInstance())
+    assert cache.get_statistics()["size"] == 0
+
+
+def test_least_recently_used_values_are_evicted():
+    cache = ReadCache(max_size=2)
+    cache.store("switch", (1, ), 1)
+    cache.store("switch", (2, ), 2)
+    cache.lookup("switch", (1, ))
+    cache.store("switch", (3, ), 3)
+    assert cache.lookup("switch", (2, )) is None
+    assert cache.lookup("switch", (1, )) == 1
+    assert cache.evictions == 1
+
+
+def test_invalidate_drops_overlapping_values_of_the_switch():
+    cache = ReadCache()
+    for oid in [(1, 3), (1, 3, 6), (1, 3, 6, 1), (1, 3, 6, 2, 5), (1, 3, 7), (1, 4)]:
+        cache.store("switch1", oid, oid)
+    cache.store("switch2", (1, 3, 6, 1), "other")
+    cache.invalidate("switch1", (1, 3, 6))
+    assert [oid for oid in [(1, 3), (1, 3, 6), (1, 3, 6, 1), (1, 3, 6, 2, 5), (1, 3, 7), (1, 4)]
+            if cache.lookup("switch1", oid) is not None] == [(1, 3, 7), (1, 4)]
+    assert cache.lookup("switch2", (1, 3, 6, 1)) == "other"
+
+
+def test_clear_drops_values_of_one_or_all_switches():
+    cache = ReadCache()
+    cache.store("switch1", (1, ), 1)
+    cache.store("switch2", (1, ), 2)
+    cache.clear("switch1")
+    assert cache.lookup("switch1", (1, )) is None
+    assert cache.lookup("switch2", (1, )) == 2
+    cache.clear()
+    assert cache.get_statistics()["size"] == 0
+
+
+def test_switch_reads_through_cache_and_invalidates_on_set(agent):
+    cache = ReadCache()
+    switch = Switch(agent.address[0], agent.community, port=agent.address[1], timeout=1, retries=1, cache=cache)
+    assert str(switch.snmp_get(("ifAlias", 1))) == "port1"
+    assert [str(value) for value in switch.snmp_get_many([("ifAlias", 1), ("ifAlias", 2)])] == ["port1", "port2"]
+    assert str(switch.snmp_get(("ifAlias", 2))) == "port2"
+    assert agent.requests_received == 2
+
+    switch.snmp_set((("ifAlias", 1), rfc1902.OctetString("uplink")))
+    assert str(switch.snmp_get(("ifAlias", 1))) == "uplink"
+    assert str(switch.snmp_get(("ifAlias", 2))) == "port2"
+    assert agent.operations[-2:] == ["set", "get"]
+    switch.close()
+
+
+def test_snmp_get_does_not_cache_missing_objects(agent):
+    switch = Switch(agent.address[0], port=agent.address[1], timeout=1, retries=1, cache=ReadCache())
+    assert isinstance(switch.snmp_get(("ifAlias", 100)), rfc1905.NoSuchInstance)
+    assert isinstance(switch.snmp_get_many([("ifAlias", 100)])[0], rfc1905.NoSuchInstance)
+    assert switch.cache.get_statistics()["size"] == 0
+    agent._set(("ifAlias", 100), rfc1902.OctetString("new"))
+    assert str(switch.snmp_get(("ifAlias", 100))) == "new"
+    switch.close()
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+import math
+from array import array
+
+import pytest
+from pysnmp.proto import rfc1902
+
+from benchmarks.agent import SimulatedSwitchAgent
+from hpswitch import counters
+from hpswitch.cache import ReadCache
+from hpswitch.counters import CounterPoller
+from hpswitch.port import Port
+from hpswitch.switch import Switch
+
+OCTETS = (("ifHCInOctets", 64), )
+
+
+class Clock(object):
+    """
+    A clock that only moves when told to, so that the sysUpTime of the agent does not depend on how long the tests
+    take.
+    """
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(autouse=True, params=["numpy", "array"])
+def rate_computation(request, monkeypatch):
+    """
+    Run every test with rates computed by NumPy and by the per-port fallback.
+    """
+    if request.param == "numpy" and counters.numpy is None:
+        pytest.skip("NumPy not installed")
+    if request.param == "array":
+        monkeypatch.setattr(counters, "numpy", None)
+    return request.param
+
+
+@pytest.fixture
+def agent():
+    with SimulatedSwitchAgent(ports=48, vlans=4, ipv4_addresses=4, clock=Clock()) as agent:
+        yield agent
+
+
+def advance(agent, seconds, **octets):
+    """
+    Let `seconds` pass on `agent` and set the ifHCInOctets of the given ports, named like `port1`.
+    """
+    agent.clock.now += seconds
+    for name, value in octets.items():
+        agent._set(("ifHCInOctets", int(name[4:])), rfc1902.Counter64(value))
+
+
+def test_rates_are_computed_from_agent_uptime(agent, switch):
+    poller = CounterPoller(switch)
+    assert poller.ifindexes == list(range(1, 49))
+    poller.poll()
+    assert all(math.isnan(rate) for rate in poller.get_rates("ifHCInOctets"))
+    advance(agent, 10, port1=6000, port3=3000)
+    poller.poll()
+    rates = poller.get_rates("ifHCInOctets")
+    assert rates[0] == 500
+    assert rates[1] == 0
+    assert rates[2] == 0
+    assert poller.get_rate(Port(switch, base_port=1), "ifHCInOctets") == rates[0]
+
+
+def test_rates_are_returned_as_the_same_array_type(agent, switch):
+    poller = CounterPoller(switch)
+    poller.poll()
+    assert type(poller.get_rates("ifHCInOctets")) is array
+    advance(agent, 10, port1=6000)
+    poller.poll()
+    rates = poller.get_rates("ifHCInOctets")
+    assert type(rates) is array
+    assert rates.typecode == "d"
+
+
+def test_every_request_carries_uptime_and_fits_a_message(agent, switch):
+    poller = CounterPoller(switch, ifindexes=range(1, 49))
+    agent.reset_statistics()
+    poller.poll()
+    # No response was too big and had to be split
+    assert agent.requests_received == len(poller._requests) > 1
+    assert all(oids[0] == ("sysUpTime", 0) for (first, last, oids) in poller._requests)
+
+
+def test_counters_bypass_the_cache(agent):
+    switch = Switch(agent.address[0], agent.community, port=agent.address[1], timeout=1, retries=1,
+            cache=ReadCache())
+    with switch:
+        poller = CounterPoller(switch, ifindexes=[1], counters=OCTETS)
+        poller.poll()
+        advance(agent, 10, port1=6000)
+        poller.poll()
+        assert poller.get_rates("ifHCInOctets")[0] == 500
+
+
+def test_missing_counters_give_nan(agent, switch):
+    poller = CounterPoller(switch, ifindexes=[1, 2])
+    poller.poll()
+    advance(agent, 10)
+    poller.poll()
+    # The agent does not simulate ifHCInUcastPkts
+    assert all(math.isnan(rate) for rate in poller.get_rates("ifHCInUcastPkts"))
+    assert list(poller.get_rates("ifHCOutOctets")) == [0, 0]
+
+
+def test_wrapped_counters(agent, switch):
+    poller = CounterPoller(switch, ifindexes=[1], counters=OCTETS)
+    advance(agent, 0, port1=2 ** 64 - 1000)
+    poller.poll()
+    advance(agent, 10, port1=1000)
+    poller.poll()
+    assert poller.get_rates("ifHCInOctets")[0] == 200
+
+
+def test_ring_buffer_wraps_around(agent, switch):
+    poller = CounterPoller(switch, ifindexes=[1, 2], counters=OCTETS, history=3)
+    for sample in range(5):
+        advance(agent, 10, port1=sample * 1000)
+        poller.poll()
+    assert poller.sample_count == 5
+    assert poller.get_rates("ifHCInOctets", samples_back=1)[0] == 100
+    assert poller.get_rates("ifHCInOctets", samples_back=2)[0] == 100
+    # Older samples have been overwritten
+    assert math.isnan(poller.get_rates("ifHCInOctets", samples_back=3)[0])
+
+
+def test_agent_restart_discards_older_samples(agent, switch):
+    poller = CounterPoller(switch, ifindexes=[1], counters=OCTETS)
+    advance(agent, 100)
+    poller.poll()
+    advance(agent, -90, port1=0)
+    poller.poll()
+    assert math.isnan(poller.get_rates("ifHCInOctets")[0])
+    advance(agent, 10, port1=1000)
+    poller.poll()
+    assert poller.get_rates("ifHCInOctets")[0] == 100
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+import pytest
+
+from benchmarks.agent import SimulatedSwitchAgent
+from hpswitch.fleet import SwitchFleet
+from hpswitch.session import SNMPDeadlineError
+
+
+@pytest.fixture
+def agents():
+    # Switches of a fleet are told apart by their hostnames, so the agents listen on different loopback addresses.
+    # Both listen on the same UDP port, which is the port of the whole fleet.
+    with SimulatedSwitchAgent(ports=8, vlans=2, host="127.0.0.1", latency=0.1) as first:
+        with SimulatedSwitchAgent(ports=16, vlans=3, host="127.0.0.2", port=first.address[1], community="secret",
+                latency=0.1) as second:
+            yield [first, second]
+
+
+@pytest.fixture
+def fleet(agents):
+    with SwitchFleet([agent.address[0] for agent in agents], port=agents[0].address[1],
+            communities={"127.0.0.2": "secret"}, timeout=1, retries=1) as fleet:
+        yield fleet
+
+
+def test_run_all_runs_named_operations_on_all_switches(fleet):
+    start = time.time()
+    results = fleet.run_all("get_ports")
+    # The switches are read at the same time
+    assert time.time() - start < 0.4
+    assert all(result.ok for result in results.values())
+    assert [port.base_port for port in results["127.0.0.1"].value] == list(range(1, 9))
+    assert [port.base_port for port in results["127.0.0.2"].value] == list(range(1, 17))
+
+
+def test_switches_use_their_own_community(fleet):
+    assert fleet.switches["127.0.0.1"].community == "public"
+    assert fleet.switches["127.0.0.2"].community == "secret"
+    results = fleet.run_all("snmp_get", args=(("ifAlias", 2), ))
+    assert [str(results[hostname].value) for hostname in ("127.0.0.1", "127.0.0.2")] == ["port2", "port2"]
+
+
+def test_run_reports_errors_per_switch(fleet):
+    def operation(switch, base_port):
+        if switch.hostname == "127.0.0.2":
+            raise ValueError(base_port)
+        return str(switch.snmp_get(("ifAlias", base_port)))
+    results = dict((result.hostname, result) for result in fleet.run(operation, args=(3, )))
+    assert results["127.0.0.1"].value == "port3"
+    assert isinstance(results["127.0.0.2"].error, ValueError)
+    assert results["127.0.0.1"].elapsed > 0
+
+
+def test_max_per_switch_limits_concurrent_operations(agents):
+    agent = agents[0]
+    for max_per_switch, min_elapsed, max_elapsed in ((1, 0.4, 1.0), (4, 0.1, 0.3)):
+        fleet = SwitchFleet([agent.address[0]], port=agent.address[1], max_per_switch=max_per_switch, timeout=1,
+                retries=1)
+        switch = fleet.switches[agent.address[0]]
+        with fleet:
+            start = time.time()
+            threads = [threading.Thread(target=fleet.run_all, args=("snmp_get", (("ifAlias", 1), )))
+                    for index in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.time() - start
+        assert min_elapsed <= elapsed < max_elapsed, max_per_switch
+        assert not switch.session.is_open
+
+
+def test_queued_operations_do_not_hold_up_other_switches(agents):
+    with SwitchFleet([agent.address[0] for agent in agents], port=agents[0].address[1],
+            communities={"127.0.0.2": "secret"}, max_workers=2, timeout=1, retries=1) as fleet:
+        threads = [threading.Thread(target=fleet.run_all, args=("snmp_get", (("ifAlias", 1), )),
+                kwargs={"hostnames": ["127.0.0.1"]}) for index in range(4)]
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        result = fleet.run_all("snmp_get", args=(("ifAlias", 1), ), hostnames=["127.0.0.2"])["127.0.0.2"]
+        elapsed = time.time() - start
+        for thread in threads:
+            thread.join()
+    # Only one worker thread serves the first switch, the other one is free for the second switch
+    assert result.ok
+    assert elapsed < 0.3
+
+
+def test_deadline_bounds_operations_on_unreachable_switches():
+    with SimulatedSwitchAgent(ports=8, vlans=2, loss=1.0) as agent:
+        with SwitchFleet([agent.address[0]], port=agent.address[1], timeout=1, retries=5, deadline=0.2) as fleet:
+            start = time.time()
+            result = fleet.run_all("snmp_get", args=(("ifAlias", 1), ))[agent.address[0]]
+    assert time.time() - start < 0.5
+    assert isinstance(result.error, SNMPDeadlineError)
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+from benchmarks.agent import SimulatedSwitchAgent
+from hpswitch.port import Port
+from hpswitch.switch import Switch
+
+
+def test_snmp_get_many_returns_values_in_order(agent, switch):
+    values = switch.snmp_get_many([("ifAlias", 3), ("ifDescr", 1), ("ifAlias", 1)])
+    assert [str(value) for value in values] == ["port3", "A1", "port1"]
+    assert agent.operations == ["get"]
+
+
+def test_snmp_get_many_splits_requests_to_fit_messages(agent, switch):
+    oids = [("ifAlias", ifindex) for ifindex in range(1, 49)] * 2
+    values = switch.snmp_get_many(oids)
+    assert [str(value) for value in values] == ["port{0}".format(ifindex) for ifindex in range(1, 49)] * 2
+    requests = list(switch._split_oids_for_message_size([switch.mib_registry.get_oid(oid) for oid in oids]))
+    assert len(requests) > 1
+    assert agent.requests_received == len(requests)
+
+
+def test_snmp_get_many_halves_requests_that_are_too_big():
+    with SimulatedSwitchAgent(ports=48, vlans=2, ipv4_addresses=0, max_message_size=300) as agent:
+        switch = Switch(agent.address[0], port=agent.address[1])
+        oids = [("ifAlias", ifindex) for ifindex in range(1, 49)]
+        values = switch.snmp_get_many(oids)
+        requests = agent.requests_received
+    assert [str(value) for value in values] == ["port{0}".format(ifindex) for ifindex in range(1, 49)]
+    # The requests packed for 1472 byte messages are answered with tooBig and split
+    assert requests > len(list(switch._split_oids_for_message_size([switch.mib_registry.get_oid(oid)
+            for oid in oids])))
+
+
+def test_get_port_attributes_reads_all_ports_at_once(agent, switch):
+    ports = [Port(switch, base_port=base_port) for base_port in (1, 2, 3)]
+    attributes = switch.get_port_attributes(ports)
+    assert agent.requests_received == 1
+    assert attributes[0] == {"alias": "port1", "description": "A1", "enabled": True, "operational": True}
+    # The agent reports every third port as down
+    assert attributes[2]["operational"] is False
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from benchmarks.agent import SimulatedSwitchAgent
+from hpswitch.instrumentation import LatencyHistogram, RequestStatistics
+from hpswitch.session import SNMPTimeoutError
+from hpswitch.switch import Switch
+
+
+def test_histogram_buckets_have_constant_relative_precision():
+    for microseconds in [0, 1, 15, 16, 17, 100, 1000, 123456, 10 ** 9]:
+        index = LatencyHistogram._get_bucket_index(microseconds)
+        upper_bound = LatencyHistogram._get_bucket_upper_bound(index)
+        assert microseconds < upper_bound <= microseconds * 1.07 + 1
+        assert LatencyHistogram._get_bucket_index(upper_bound) == index + 1
+
+
+def test_histogram_percentiles():
+    histogram = LatencyHistogram()
+    for millisecond in range(1, 101):
+        histogram.record(millisecond / 1000.0)
+    assert histogram.count == 100
+    assert histogram.maximum == 0.1
+    assert histogram.get_percentile(50) == pytest.approx(0.05, rel=0.07)
+    assert histogram.get_percentile(99) == pytest.approx(0.099, rel=0.07)
+    assert histogram.get_percentile(100) == 0.1
+    assert histogram.get_cumulative_counts([0.0005, 0.01, 1.0]) == [0, 9, 100]
+    assert LatencyHistogram().get_percentile(50) == 0.0
+
+
+def test_observers_receive_an_event_per_request(switch, requests):
+    switch.snmp_get_many([("ifAlias", 2), ("ifDescr", 2)])
+    assert requests.operations == ["get"]
+    event = requests.events[0]
+    assert event.varbind_count == 2
+    assert event.object_name == "ifAlias"
+    assert event.attempts == 1
+    assert event.response_size > event.request_size > 0
+    assert not event.failed
+
+
+def test_request_statistics_count_requests_per_object(switch):
+    statistics = RequestStatistics()
+    switch.add_observer(statistics)
+    switch.snmp_get(("ifAlias", 1))
+    switch.snmp_get_many([("ifAlias", 2), ("ifDescr", 2)])
+    switch.snmp_get_subtree(("ifDescr", ))
+
+    exported = statistics.as_dict()[switch.hostname]
+    alias_counters = exported["get"]["objects"]["ifAlias"]
+    assert alias_counters["requests"] == 2
+    assert alias_counters["varbinds"] == 3
+    assert alias_counters["errors"] == 0
+    assert alias_counters["response_bytes"] > alias_counters["request_bytes"] > 0
+    assert exported["get"]["latency"]["count"] == 2
+    assert exported["getbulk"]["objects"]["ifDescr"]["requests"] >= 1
+
+
+def test_request_statistics_count_timeouts():
+    statistics = RequestStatistics()
+    with SimulatedSwitchAgent(ports=8, vlans=2, loss=1.0) as agent:
+        switch = Switch(agent.address[0], port=agent.address[1], timeout=0.05, retries=2)
+        switch.add_observer(statistics)
+        with pytest.raises(SNMPTimeoutError):
+            switch.snmp_get(("ifAlias", 1))
+        switch.close()
+    counters = statistics.as_dict()[agent.address[0]]["get"]["objects"]["ifAlias"]
+    assert counters["timeouts"] == 1
+    # Timeouts are not counted as errors
+    assert counters["errors"] == 0
+    assert counters["retries"] == 2
+
+
+def test_prometheus_export(switch):
+    statistics = RequestStatistics()
+    switch.add_observer(statistics)
+    switch.snmp_get(("ifAlias", 1))
+    lines = statistics.to_prometheus().splitlines()
+    labels = 'switch="{0}",operation="get"'.format(switch.hostname)
+    assert "# TYPE hpswitch_snmp_requests_total counter" in lines
+    assert 'hpswitch_snmp_requests_total{{{0},object="ifAlias"}} 1'.format(labels) in lines
+    assert 'hpswitch_snmp_request_duration_seconds_bucket{{{0},le="+Inf"}} 1'.format(labels) in lines
+    assert "hpswitch_snmp_request_duration_seconds_count{{{0}}} 1".format(labels) in lines
+    statistics.reset()
+    assert statistics.as_dict() == {}
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+import gc
+import threading
+
+import pytest
+
+from hpswitch.port import Port
+from hpswitch.switch import Switch
+from hpswitch.vlan import VLAN
+
+
+def test_ports_and_vlans_are_interned_per_switch(agent, switch):
+    assert Port(switch, base_port=3) is Port(switch, "A3")
+    assert VLAN(switch, 10) is VLAN(switch, 10)
+    other_switch = Switch(agent.address[0], agent.community, port=agent.address[1])
+    assert Port(other_switch, base_port=3) is not Port(switch, base_port=3)
+    assert VLAN(other_switch, 10) != VLAN(switch, 10)
+    other_switch.close()
+
+
+def test_listed_objects_are_the_interned_ones(switch):
+    ports = switch.get_ports()
+    assert ports[4] is Port(switch, base_port=5)
+    assert switch.get_vlans()[2] is VLAN(switch, 20)
+    assert list(VLAN(switch, 1).untagged_ports)[0] is Port(switch, base_port=1)
+
+
+def test_ports_and_vlans_are_hashable_value_objects(switch):
+    ports = set([Port(switch, base_port=1), Port(switch, base_port=2), Port(switch, base_port=1)])
+    assert len(ports) == 2
+    vlans = {VLAN(switch, 1): "default"}
+    assert vlans[VLAN(switch, 1)] == "default"
+    assert Port(switch, base_port=1) != VLAN(switch, 1)
+    with pytest.raises(AttributeError):
+        Port(switch, base_port=1).extra = True
+    with pytest.raises(AttributeError):
+        VLAN(switch, 1).__dict__
+
+
+def test_identifying_attributes_cannot_be_rebound(switch):
+    port = Port(switch, base_port=1)
+    vlan = VLAN(switch, 10)
+    with pytest.raises(AttributeError):
+        port.base_port = 2
+    with pytest.raises(AttributeError):
+        vlan.vid = 20
+    with pytest.raises(AttributeError):
+        vlan.switch = None
+    assert port is Port(switch, base_port=1) and port.base_port == 1
+    assert vlan is VLAN(switch, 10) and vlan.vid == 10
+    # Properties with setters are still assignable
+    port.alias = "uplink"
+    assert Port(switch, base_port=1).alias == "uplink"
+
+
+def test_unused_objects_are_not_kept(switch):
+    port = Port(switch, base_port=7)
+    VLAN(switch, 50)
+    gc.collect()
+    assert (Port, 7) in switch.interned_objects
+    assert (VLAN, 50) not in switch.interned_objects
+    assert Port(switch, base_port=7) is port
+
+
+def test_interning_is_thread_safe(switch):
+    ports = []
+    threads = [threading.Thread(target=lambda: ports.append(Port(switch, base_port=40))) for index in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all(port is ports[0] for port in ports)
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+import ipaddress
+
+import pytest
+
+from hpswitch.vlan import VLAN, VLAN_IFINDEX_OFFSET, IPAddressIndex, get_ip_interface
+
+
+def interface(address):
+    return ipaddress.ip_interface(address)
+
+
+def test_get_ip_interface_decodes_oid_octets():
+    assert get_ip_interface((10, 0, 1, 1), 24) == interface(u"10.0.1.1/24")
+    assert get_ip_interface((0xfd, 0) + (0, ) * 13 + (1, ), 64) == interface(u"fd00::1/64")
+
+
+def test_index_by_interface_and_address():
+    index = IPAddressIndex(None, [(587, interface(u"10.0.1.1/24")), (578, interface(u"10.0.0.1/16")),
+            (587, interface(u"fd00:1::1/64")), (597, interface(u"10.0.1.129/25"))])
+    assert len(index) == 4
+    assert index.ifindexes == [578, 587, 597]
+    assert list(index)[0] == (578, interface(u"10.0.0.1/16"))
+    assert index.get_ipv4_addresses(587) == [interface(u"10.0.1.1/24")]
+    assert index.get_ipv6_addresses(587) == [interface(u"fd00:1::1/64")]
+    assert index.get_addresses(600) == []
+
+    # Configured addresses first, then the longest matching subnet
+    assert index.get_ifindex(ipaddress.ip_address(u"10.0.1.129")) == 597
+    assert index.get_ifindex(ipaddress.ip_address(u"10.0.1.1")) == 587
+    assert index.get_ifindex(ipaddress.ip_address(u"10.0.1.200")) == 597
+    assert index.get_ifindex(ipaddress.ip_address(u"10.0.1.5")) == 587
+    assert index.get_ifindex(ipaddress.ip_address(u"10.0.200.5")) == 578
+    assert index.get_ifindex(ipaddress.ip_address(u"10.1.0.1")) is None
+    assert index.get_ifindex(ipaddress.ip_address(u"fd00:1::5")) == 587
+
+
+def test_get_ifindex_of_networks():
+    index = IPAddressIndex(None, [(587, interface(u"10.0.1.1/24")), (578, interface(u"10.0.0.1/16"))])
+    assert index.get_ifindex(ipaddress.ip_network(u"10.0.1.0/26")) == 587
+    assert index.get_ifindex(ipaddress.ip_network(u"10.0.2.0/24")) == 578
+    assert index.get_ifindex(ipaddress.ip_network(u"10.0.0.0/8")) is None
+
+
+def test_get_ifindex_of_interfaces():
+    index = IPAddressIndex(None, [(587, interface(u"10.0.1.1/24")), (578, interface(u"10.0.0.1/16"))])
+    # The configured address is found even if the prefix length differs
+    assert index.get_ifindex(interface(u"10.0.1.1/16")) == 587
+    # Otherwise the network of the interface is looked up, not only its address
+    assert index.get_ifindex(interface(u"10.0.1.7/24")) == 587
+    assert index.get_ifindex(interface(u"10.0.1.7/20")) == 578
+    assert index.get_ifindex(interface(u"10.0.1.7/8")) is None
+
+
+def test_get_ifindex_of_addresses():
+    index = IPAddressIndex(None, [(587, interface(u"10.0.1.1/24")), (578, interface(u"10.0.0.1/16"))])
+    assert index.get_ifindex(ipaddress.ip_address(u"10.0.0.1")) == 578
+    assert index.get_ifindex(ipaddress.ip_address(u"10.0.1.7")) == 587
+    with pytest.raises(TypeError):
+        index.get_ifindex(u"10.0.1.7")
+
+
+def test_get_vlan(switch):
+    index = IPAddressIndex(switch, [(20 + VLAN_IFINDEX_OFFSET, interface(u"10.0.20.1/24"))])
+    assert index.get_vlan(ipaddress.ip_address(u"10.0.20.7")) is VLAN(switch, 20)
+    assert index.get_vlan(ipaddress.ip_address(u"10.0.21.7")) is None
+    assert index.get_ipv4_addresses(VLAN(switch, 20)) == [interface(u"10.0.20.1/24")]
+
+
+def test_ip_addresses_takes_a_single_walk(switch, requests, require_mib_object):
+    require_mib_object("hpicfIpAddressPrefixLength")
+    index = switch.ip_addresses()
+    # The agent gives the VLANs 1, 10, 20 and 30 one address each
+    assert requests.operations == ["getbulk"]
+    assert len(index) == 4
+    assert index.get_vlan(ipaddress.ip_address(u"10.0.1.7")) is VLAN(switch, 10)
+    assert VLAN(switch, 10).ipv4_addresses == [interface(u"10.0.1.1/24")]
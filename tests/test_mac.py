@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+import pytest
+from pysnmp.proto import rfc1902
+
+from benchmarks.agent import SimulatedSwitchAgent
+from hpswitch.mac import FDB_STATUS_LEARNED, MACEntry, MACTable, format_mac, parse_mac
+from hpswitch.port import Port
+from hpswitch.vlan import VLAN
+
+
+@pytest.fixture
+def agent():
+    # The agent learns 64 addresses from 00:11:22:00:00:00 on, spread over the VLANs 1, 10, 20 and 30 and the 48 ports
+    with SimulatedSwitchAgent(ports=48, vlans=4, ipv4_addresses=4, mac_addresses=64) as agent:
+        yield agent
+
+
+def test_parse_and_format_mac():
+    for mac in ("00:11:22:aa:bb:cc", "0011.22aa.bbcc", "00-11-22-AA-BB-CC", b"\x00\x11\x22\xaa\xbb\xcc",
+            0x001122aabbcc):
+        assert parse_mac(mac) == 0x001122aabbcc
+    assert format_mac(0x001122aabbcc) == "00:11:22:aa:bb:cc"
+    assert format_mac(1) == "00:00:00:00:00:01"
+    with pytest.raises(ValueError):
+        parse_mac("00:11:22:aa:bb")
+
+
+def test_read_and_find(switch):
+    table = switch.mac_table()
+    assert len(table) == 64
+    macs = [entry.mac for entry in table]
+    assert macs == sorted(macs)
+    assert table.find("00:11:22:00:00:05") == [MACEntry("00:11:22:00:00:05", 10, 6, FDB_STATUS_LEARNED)]
+    assert table.find("00:11:22:00:01:00") == []
+    assert "0011.2200.003f" in table
+    assert "0011.2200.0040" not in table
+    assert table.get_port("00:11:22:00:00:05") is Port(switch, base_port=6)
+    assert table.get_port("00:11:22:00:00:05", VLAN(switch, 20)) is None
+
+
+def test_get_entries_by_port_and_vlan(switch):
+    table = switch.mac_table()
+    assert [entry.mac for entry in table.get_entries(port=6)] == ["00:11:22:00:00:05", "00:11:22:00:00:35"]
+    assert len(table.get_entries(vlan=10)) == 16
+    assert [entry.mac for entry in table.get_entries(port=Port(switch, base_port=6), vlan=20)] == []
+    assert len(table.get_entries(port=6, vlan=VLAN(switch, 10))) == 2
+    assert len(table.get_entries()) == 64
+
+
+def test_refresh_reads_changed_filtering_databases(agent, switch):
+    table = switch.mac_table()
+    assert table.refresh() == []
+    agent._set(("dot1qTpFdbPort", 20, 0, 0x11, 0x22, 0xaa, 0, 1), rfc1902.Integer(7))
+    agent._set(("dot1qTpFdbStatus", 20, 0, 0x11, 0x22, 0xaa, 0, 1), rfc1902.Integer(FDB_STATUS_LEARNED))
+    agent._set(("dot1qFdbDynamicCount", 20), rfc1902.Counter32(17))
+    assert table.refresh() == [20]
+    assert table.get_port("00:11:22:aa:00:01") is Port(switch, base_port=7)
+    assert len(table) == 65
+    assert table.refresh(vids=[10]) == [10]
+    assert len(table.get_entries(vlan=10)) == 16
+
+
+def test_refresh_of_vlans_updates_their_dynamic_counts(agent, switch):
+    table = switch.mac_table()
+    agent._set(("dot1qTpFdbPort", 20, 0, 0x11, 0x22, 0xaa, 0, 1), rfc1902.Integer(7))
+    agent._set(("dot1qTpFdbStatus", 20, 0, 0x11, 0x22, 0xaa, 0, 1), rfc1902.Integer(FDB_STATUS_LEARNED))
+    agent._set(("dot1qFdbDynamicCount", 20), rfc1902.Counter32(17))
+    assert table.refresh(vids=[20]) == [20]
+    assert table.dynamic_counts[20] == 17
+    # The filtering database is not read again for the change already seen
+    assert table.refresh() == []
+
+
+def test_shared_filtering_databases():
+    table = MACTable(None, {1: (1, 10)})
+    table._replace(None, [(1, 0x001122000002, 3, FDB_STATUS_LEARNED), (1, 0x001122000001, 4, FDB_STATUS_LEARNED),
+            (20, 0x001122000001, 5, FDB_STATUS_LEARNED)])
+    # Addresses learned in FID 1 are reachable in both of its VLANs
+    assert [(entry.mac, entry.vid) for entry in table] == [("00:11:22:00:00:01", 1), ("00:11:22:00:00:01", 10),
+            ("00:11:22:00:00:01", 20), ("00:11:22:00:00:02", 1), ("00:11:22:00:00:02", 10)]
+    table._replace([1], [(1, 0x001122000003, 6, FDB_STATUS_LEARNED)])
+    assert [(entry.mac, entry.vid) for entry in table] == [("00:11:22:00:00:01", 20), ("00:11:22:00:00:03", 1),
+            ("00:11:22:00:00:03", 10)]
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+import pytest
+from pysnmp.smi import error
+
+from hpswitch.mib import FALLBACK_OIDS, MibRegistry, mib_registry
+from hpswitch.switch import Switch
+
+
+def test_get_oid_resolves_names_and_appends_the_index():
+    assert mib_registry.get_oid(("ifAlias", )) == (1, 3, 6, 1, 2, 1, 31, 1, 1, 1, 18)
+    assert mib_registry.get_oid(("ifAlias", 5)) == (1, 3, 6, 1, 2, 1, 31, 1, 1, 1, 18, 5)
+    assert mib_registry.get_oid(("dot1qPvid", 12))[-1] == 12
+
+
+def test_get_oid_returns_numeric_oids_unchanged():
+    assert mib_registry.get_oid((1, 3, 6, 1, 2, 1, 1, 3, 0)) == (1, 3, 6, 1, 2, 1, 1, 3, 0)
+
+
+def test_get_oid_raises_for_unknown_names():
+    with pytest.raises(error.SmiError):
+        MibRegistry(modules=("IF-MIB", )).get_oid(("noSuchObjectAnywhere", 1))
+
+
+def test_fallback_oids_resolve_names_of_missing_modules():
+    registry = MibRegistry(modules=("IF-MIB", ))
+    assert registry.get_oid(("inetCidrRouteStatus", 1)) == (1, 3, 6, 1, 2, 1, 4, 24, 7, 1, 17, 1)
+    assert registry.get_name((1, 3, 6, 1, 2, 1, 4, 24, 7, 1, 17, 1)) == "inetCidrRouteStatus"
+
+
+def test_fallback_oids_match_the_installed_modules():
+    registry = MibRegistry(fallback_oids={})
+    for name, oid in FALLBACK_OIDS.items():
+        try:
+            assert registry.get_oid((name, )) == oid, name
+        except error.SmiError:
+            # The module is not installed
+            pass
+
+
+def test_modules_are_loaded_lazily_and_once():
+    registry = MibRegistry()
+    registry.get_oid(("ifAlias", ))
+    assert "IF-MIB" in registry._loaded_modules
+    assert "Q-BRIDGE-MIB" not in registry._loaded_modules
+    mib_builder = registry.mib_builder
+    registry.get_oid(("dot1qPvid", ))
+    assert "Q-BRIDGE-MIB" in registry._loaded_modules
+    assert registry.mib_builder is mib_builder
+
+
+def test_get_name_finds_the_longest_resolved_prefix():
+    oid = mib_registry.get_oid(("ifAlias", 7))
+    assert mib_registry.get_name(oid) == "ifAlias"
+    assert mib_registry.get_name((1, 2, 3)) == "1.2.3"
+
+
+def test_switches_share_the_registry():
+    first = Switch("192.0.2.1")
+    second = Switch("192.0.2.2")
+    assert first.mib_registry is second.mib_registry is mib_registry
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+from hpswitch.port import Port, PortSet, get_port_list_enabled_ports
+from hpswitch.vlan import VLAN
+
+
+def test_first_port_is_most_significant_bit_of_first_byte():
+    port_set = PortSet.from_port_list(None, b"\x80\x01\x00")
+    assert list(port_set.base_ports()) == [1, 16]
+    assert 1 in port_set and 16 in port_set
+    assert 2 not in port_set and 17 not in port_set
+    assert PortSet(None, [1, 9]).to_port_list() == b"\x80\x80"
+
+
+def test_port_list_round_trip_keeps_size():
+    port_list = b"\x41\x00\x03\x00"
+    port_set = PortSet.from_port_list(None, port_list)
+    assert list(port_set.base_ports()) == [2, 8, 23, 24]
+    assert port_set.to_port_list() == port_list
+    assert PortSet(None, size=3).to_port_list() == b"\x00\x00\x00"
+    # Grows to hold all ports
+    assert PortSet(None, [17], size=1).to_port_list() == b"\x00\x00\x80"
+
+
+def test_add_discard_and_set_operations():
+    first = PortSet(None, [1, 2, 3], size=1)
+    second = PortSet(None, [3, 4], size=2)
+    first.add(10)
+    first.discard(2)
+    first.discard(12)
+    assert list(first.base_ports()) == [1, 3, 10]
+    assert len(first) == 3
+    assert list((first | second).base_ports()) == [1, 3, 4, 10]
+    assert list((first & second).base_ports()) == [3]
+    assert list((first - second).base_ports()) == [1, 10]
+    assert list((first ^ second).base_ports()) == [1, 4, 10]
+    assert (first - second).size == 2
+    assert not PortSet(None)
+    assert PortSet(None, [5]) == PortSet(None, [5], size=4)
+    assert PortSet(None, [5]) != PortSet(None, [6])
+
+
+def test_iteration_yields_ports(switch):
+    port_set = PortSet(switch, [2, 7])
+    assert [port.base_port for port in port_set] == [2, 7]
+    assert Port(switch, base_port=7) in port_set
+    assert [port.base_port for port in get_port_list_enabled_ports(switch, port_set.to_port_list())] == [2, 7]
+
+
+def test_vlan_and_port_memberships_use_port_sets(switch):
+    # The agent makes each port untagged in one of the VLANs 1, 10, 20 and 30 in turn and tagged in the next one
+    vlan = VLAN(switch, 10)
+    assert list(vlan.untagged_ports.base_ports())[:3] == [2, 6, 10]
+    assert list(vlan.tagged_ports.base_ports())[:3] == [1, 5, 9]
+    assert [tagged_vlan.vid for tagged_vlan in Port(switch, base_port=1).tagged_vlans] == [10]
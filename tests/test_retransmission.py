@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+import time
+
+import pytest
+
+from benchmarks.agent import SimulatedSwitchAgent
+from hpswitch.session import (CircuitBreaker, RetransmissionTimer, RetryBudget, SNMPDeadlineError, SNMPTimeoutError,
+        SNMPUnavailableError)
+from hpswitch.switch import Switch
+
+
+@pytest.fixture
+def lossy_agent():
+    with SimulatedSwitchAgent(ports=8, vlans=2, ipv4_addresses=0, loss=1.0) as agent:
+        yield agent
+
+
+@pytest.fixture
+def lossy_switch(lossy_agent):
+    switch = Switch(lossy_agent.address[0], port=lossy_agent.address[1], timeout=0.2, retries=3)
+    yield switch
+    switch.close()
+
+
+def test_timer_follows_rfc_6298():
+    timer = RetransmissionTimer(initial=1.0, minimum=0.01, maximum=8)
+    assert timer.rto == 1.0
+    timer.update(0.1)
+    assert timer.srtt == 0.1
+    assert timer.rttvar == 0.05
+    assert timer.rto == pytest.approx(0.3)
+    timer.update(0.2)
+    assert timer.rttvar == pytest.approx(0.75 * 0.05 + 0.25 * 0.1)
+    assert timer.srtt == pytest.approx(0.875 * 0.1 + 0.125 * 0.2)
+    assert timer.rto == pytest.approx(timer.srtt + 4 * timer.rttvar)
+
+
+def test_timer_bounds_and_backoff():
+    timer = RetransmissionTimer(initial=1.0, minimum=0.2, maximum=3)
+    timer.update(0.001)
+    assert timer.rto == 0.2
+    for expected in (0.4, 0.8, 1.6, 3, 3):
+        timer.backoff()
+        assert timer.rto == expected
+    assert RetransmissionTimer(initial=10, maximum=8).rto == 8
+
+
+def test_retry_budget():
+    budget = RetryBudget(ratio=0.5, max_tokens=2)
+    assert budget.withdraw() and budget.withdraw()
+    assert not budget.withdraw()
+    budget.deposit()
+    assert not budget.withdraw()
+    for request in range(10):
+        budget.deposit()
+    assert budget.tokens == 2
+
+
+def test_circuit_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=2)
+    assert not breaker.record_failure()
+    breaker.record_success()
+    assert not breaker.record_failure()
+    assert breaker.record_failure()
+    assert breaker.is_open
+    # Only the failure opening the breaker reports it
+    assert not breaker.record_failure()
+    breaker.record_success()
+    assert not breaker.is_open
+
+
+def test_timer_adapts_to_the_switch(switch):
+    for request in range(5):
+        switch.snmp_get(("ifAlias", 1))
+    # The agent answers at once
+    assert switch.session.timer.rto == switch.session.timer.minimum
+
+
+def test_retransmissions_back_off_and_draw_from_the_budget(lossy_agent, lossy_switch):
+    session = lossy_switch.session
+    session.retry_budget.tokens = 1
+    session.timer.rto = 0.05
+    with pytest.raises(SNMPTimeoutError):
+        lossy_switch.snmp_get(("ifAlias", 1))
+    # One retransmission was in the budget
+    assert lossy_agent.requests_received == 2
+    # Doubled after each unanswered attempt
+    assert session.timer.rto == 0.2
+
+
+def test_circuit_breaker_fails_fast_until_probe_succeeds(lossy_agent, lossy_switch):
+    session = lossy_switch.session
+    session.retries = 0
+    session.circuit_breaker.failure_threshold = 2
+    session.circuit_breaker.probe_interval = 0.05
+    for request in range(2):
+        with pytest.raises(SNMPTimeoutError):
+            lossy_switch.snmp_get(("ifAlias", 1))
+    assert session.circuit_breaker.is_open
+    lossy_agent.reset_statistics()
+    with pytest.raises(SNMPUnavailableError):
+        lossy_switch.snmp_get(("ifAlias", 1))
+    assert lossy_agent.requests_received == 0
+
+    lossy_agent.loss = 0.0
+    for attempt in range(40):
+        if not session.circuit_breaker.is_open:
+            break
+        time.sleep(0.05)
+    assert str(lossy_switch.snmp_get(("ifAlias", 1))) == "port1"
+
+
+def test_deadline_cuts_requests_short(lossy_switch):
+    session = lossy_switch.session
+    session.timer.rto = 1.0
+    start = time.time()
+    with pytest.raises(SNMPDeadlineError):
+        with lossy_switch.deadline(0.1):
+            lossy_switch.snmp_get(("ifAlias", 1))
+    assert time.time() - start < 0.5
+    # Giving up early says nothing about the switch
+    assert session.timer.rto == 1.0
+    assert session.circuit_breaker.failures == 0
+
+
+def test_retransmissions_cut_short_by_the_deadline_draw_from_the_budget(lossy_agent, lossy_switch):
+    session = lossy_switch.session
+    session.retry_budget.tokens = 0
+    session.timer.rto = 0.1
+    # The first attempt gets its full timeout, after which the backed off timeout no longer fits before the deadline
+    with pytest.raises(SNMPTimeoutError):
+        with lossy_switch.deadline(0.15):
+            lossy_switch.snmp_get(("ifAlias", 1))
+    assert lossy_agent.requests_received == 1
+
+
+def test_nested_deadlines_never_extend_the_outer_one(lossy_switch):
+    session = lossy_switch.session
+    with lossy_switch.deadline(0.1):
+        outer_deadline = session._get_deadline()
+        with lossy_switch.deadline(10):
+            assert session._get_deadline() == outer_deadline
+        assert session._get_deadline() == outer_deadline
+    assert session._get_deadline() is None
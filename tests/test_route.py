@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+import ipaddress
+
+import pytest
+from pysnmp.proto import rfc1902
+
+from hpswitch.route import IPv4Route, IPv6Route, RouteTable
+from hpswitch.switch import _get_inet_cidr_route_index, _parse_inet_cidr_route_index
+
+
+def route(destination, gateway):
+    route_class = IPv4Route if ":" not in destination else IPv6Route
+    return route_class(ipaddress.ip_network(destination), ipaddress.ip_address(gateway))
+
+
+def test_lookup_finds_longest_prefix():
+    default = route(u"0.0.0.0/0", u"10.0.0.1")
+    private = route(u"10.0.0.0/8", u"10.0.0.2")
+    subnet = route(u"10.1.0.0/16", u"10.0.0.3")
+    table = RouteTable([default, private, subnet])
+    assert table.lookup(u"10.1.2.3") == [subnet]
+    assert table.lookup(u"10.2.0.1") == [private]
+    assert table.lookup(u"192.168.0.1") == [default]
+    assert RouteTable([private]).lookup(u"192.168.0.1") == []
+
+
+def test_add_skips_duplicates_and_keeps_gateways_apart():
+    table = RouteTable()
+    assert table.add(route(u"10.0.0.0/8", u"10.0.0.1"))
+    assert not table.add(route(u"10.0.0.0/8", u"10.0.0.1"))
+    assert table.add(route(u"10.0.0.0/8", u"10.0.0.2"))
+    assert len(table) == 2
+    assert len(table.get_routes(ipaddress.ip_network(u"10.0.0.0/8"))) == 2
+    assert table.get_routes(ipaddress.ip_network(u"10.0.0.0/16")) == []
+
+
+def test_overlapping_routes_and_order():
+    routes = [route(u"0.0.0.0/0", u"10.0.0.1"), route(u"10.0.0.0/8", u"10.0.0.1"),
+            route(u"10.1.0.0/16", u"10.0.0.1"), route(u"10.1.2.0/24", u"10.0.0.1"),
+            route(u"10.2.0.0/16", u"10.0.0.1"), route(u"192.168.0.0/16", u"10.0.0.1")]
+    table = RouteTable(reversed(routes))
+    assert list(table) == routes
+    assert table.get_overlapping_routes(ipaddress.ip_network(u"10.1.0.0/16")) == routes[:4]
+    assert table.get_overlapping_routes(ipaddress.ip_network(u"10.0.0.0/8")) == routes[:5]
+
+
+def test_remove_prunes_the_trie():
+    table = RouteTable()
+    host = route(u"10.1.2.3/32", u"10.0.0.1")
+    table.add(host)
+    table.remove(host)
+    assert host not in table
+    assert len(table) == 0
+    assert table._root.children == [None, None]
+    with pytest.raises(KeyError):
+        table.remove(host)
+    table.discard(host)
+
+
+def test_ipv6_routes():
+    table = RouteTable([route(u"fd00::/8", u"fe80::1"), route(u"fd00:1::/32", u"fe80::2")])
+    assert table.lookup(u"fd00:1::5")[0].gateway == ipaddress.ip_address(u"fe80::2")
+    assert table.lookup(u"fd01::5")[0].gateway == ipaddress.ip_address(u"fe80::1")
+
+
+def test_inet_cidr_route_index_round_trip():
+    for static_route in (route(u"10.1.0.0/16", u"10.0.0.1"), route(u"fd00::/8", u"fe80::1")):
+        index = _get_inet_cidr_route_index(static_route)
+        assert _parse_inet_cidr_route_index(index) == (static_route.destination, static_route.gateway)
+
+
+def test_switch_reads_static_routes_once(agent, switch, requests):
+    static_route = route(u"10.1.0.0/16", u"10.0.0.1")
+    agent._set(("inetCidrRouteProto", ) + _get_inet_cidr_route_index(static_route), rfc1902.Integer(3))
+    # A route learned through OSPF == 13
+    agent._set(("inetCidrRouteProto", ) + _get_inet_cidr_route_index(route(u"10.2.0.0/16", u"10.0.0.1")),
+            rfc1902.Integer(13))
+    ipv4_routes, ipv6_routes = switch.get_static_routes()
+    assert list(ipv4_routes) == [static_route]
+    assert len(ipv6_routes) == 0
+
+    requests.clear()
+    added = switch.add_static_routes([static_route, route(u"10.3.0.0/16", u"10.0.0.1"),
+            route(u"fd00::/8", u"fe80::1")])
+    assert added == [route(u"10.3.0.0/16", u"10.0.0.1"), route(u"fd00::/8", u"fe80::1")]
+    # The routes just read are known, so only the SET is needed
+    assert requests.operations == ["set"]
+    assert switch.add_static_routes([route(u"10.3.0.0/16", u"10.0.0.1")]) == []
+
+    switch.remove_static_routes([route(u"10.3.0.0/16", u"10.0.0.1")])
+    assert switch.add_static_routes([route(u"10.3.0.0/16", u"10.0.0.1")]) == [route(u"10.3.0.0/16", u"10.0.0.1")]
+    assert requests.operations == ["set", "set", "set"]
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+import pytest
+from pysnmp.proto import rfc1902, rfc1905
+
+from benchmarks.agent import SimulatedSwitchAgent
+from hpswitch.session import SNMPError, SNMPTimeoutError
+from hpswitch.switch import Switch
+
+
+def test_session_keeps_its_socket_between_requests(switch):
+    switch.snmp_get(("ifAlias", 1))
+    sock = switch.session._socket
+    switch.snmp_get(("ifAlias", 2))
+    assert switch.session._socket is sock
+    assert switch.session.is_open
+
+
+def test_closed_session_is_opened_again_by_the_next_request(switch):
+    switch.snmp_get(("ifAlias", 1))
+    switch.close()
+    assert not switch.session.is_open
+    assert str(switch.snmp_get(("ifAlias", 1))) == "port1"
+
+
+def test_switch_as_context_manager(agent):
+    with Switch(agent.address[0], port=agent.address[1]) as switch:
+        assert switch.session.is_open
+        assert str(switch.snmp_get(("ifDescr", 25))) == "B1"
+    assert not switch.session.is_open
+
+
+def test_snmp_get_returns_missing_objects(switch):
+    assert isinstance(switch.snmp_get(("ifAlias", 100)), rfc1905.NoSuchInstance)
+
+
+def test_snmp_set_raises_on_error_status(switch):
+    # The response would exceed the message size of the agent, which answers tooBig
+    with pytest.raises(SNMPError):
+        switch.snmp_set((("ifAlias", 1), rfc1902.OctetString("x" * 1500)))
+
+
+def test_snmp_set_many_raises_on_error_status(switch):
+    with pytest.raises(SNMPError):
+        switch.snmp_set_many([(("ifAlias", 1), rfc1902.OctetString("x" * 1500))])
+
+
+def test_requests_are_retransmitted():
+    with SimulatedSwitchAgent(ports=8, vlans=2, ipv4_addresses=0, loss=1.0) as agent:
+        switch = Switch(agent.address[0], port=agent.address[1], timeout=0.1, retries=2)
+        with pytest.raises(SNMPTimeoutError):
+            switch.snmp_get(("ifAlias", 1))
+        switch.close()
+        assert agent.requests_received == 3
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+import ipaddress
+
+from benchmarks.agent import SimulatedSwitchAgent
+from hpswitch.port import Port, PortSet
+from hpswitch.snapshot import SwitchSnapshot, _format_port_ranges, _parse_port_ranges
+from hpswitch.switch import Switch
+
+# The state of a SimulatedSwitchAgent with 8 ports and 2 VLANs, apart from IP addresses
+AGENT_STATE = {
+    "port_list_size": 1,
+    "ports": dict((str(base_port), {"alias": u"port{0}".format(base_port), "enabled": True,
+        "pvid": 1 if base_port % 2 else 10}) for base_port in range(1, 9)),
+    "vlans": {
+        "1": {"name": u"VLAN1", "egress": "1-8", "untagged": "1,3,5,7"},
+        "10": {"name": u"VLAN10", "egress": "1-8", "untagged": "2,4,6,8"},
+    },
+}
+
+
+def get_names(varbinds):
+    return [name for (name, value) in varbinds]
+
+
+def test_port_ranges():
+    assert _format_port_ranges(PortSet(None, [1, 2, 3, 5, 7, 8])) == "1-3,5,7-8"
+    assert _format_port_ranges(PortSet(None)) == ""
+    assert _parse_port_ranges("1-3,5,7-8") == [1, 2, 3, 5, 7, 8]
+    assert _parse_port_ranges("") == []
+
+
+def test_dict_and_file_round_trip(tmpdir):
+    snapshot = SwitchSnapshot.from_dict(dict(AGENT_STATE, addresses={"10": ["10.0.0.1/24", "fd00::1/64"]}))
+    assert snapshot.vlans[10]["untagged"] == PortSet(None, [2, 4, 6, 8])
+    assert snapshot.addresses[10] == set([ipaddress.ip_interface(u"10.0.0.1/24"),
+            ipaddress.ip_interface(u"fd00::1/64")])
+    for name in ("snapshot.json", "snapshot.json.gz"):
+        path = str(tmpdir.join(name))
+        snapshot.save(path)
+        assert SwitchSnapshot.load(path).to_dict() == snapshot.to_dict()
+
+
+def test_identical_snapshots_have_no_diff():
+    snapshot = SwitchSnapshot.from_dict(AGENT_STATE)
+    assert not snapshot.diff(SwitchSnapshot.from_dict(AGENT_STATE))
+    # Partial states only compare what they declare
+    assert not snapshot.diff(SwitchSnapshot.from_dict({"ports": {"1": {"alias": u"port1"}}}))
+
+
+def test_diff_orders_phases():
+    current = SwitchSnapshot.from_dict(AGENT_STATE)
+    desired = SwitchSnapshot.from_dict({
+        "ports": {"3": {"alias": u"uplink"}},
+        "vlans": {"20": {"name": u"servers", "untagged": "1"}},
+        "addresses": {"20": ["10.0.20.1/24"]},
+    })
+    diff = current.diff(desired, prune=True)
+    create, names, membership, addresses, remove = diff.phases
+    assert get_names(create) == [("dot1qVlanStaticRowStatus", 20)]
+    assert get_names(names) == [("dot1qVlanStaticName", 20)]
+    assert get_names(membership) == [
+        ("dot1qVlanStaticEgressPorts", 20),
+        ("dot1qVlanStaticUntaggedPorts", 1),
+        ("dot1qVlanStaticUntaggedPorts", 20),
+        ("dot1qVlanStaticEgressPorts", 1),
+        ("dot1qPvid", 1),
+        ("dot1qPvid", 2),
+        ("dot1qPvid", 4),
+        ("dot1qPvid", 6),
+        ("dot1qPvid", 8),
+        ("ifAlias", 3),
+    ]
+    assert ("hpicfIpAddressRowStatus", 20 + 577, 1, 4, 10, 0, 20, 1) in get_names(addresses)
+    # VLAN 10 is not in the desired state, while VLAN 1 is never removed
+    assert get_names(remove) == [("dot1qVlanStaticRowStatus", 10)]
+    assert diff.aliases == {3: u"uplink"}
+
+
+def test_prune_moves_pvids_out_of_removed_vlans():
+    current = SwitchSnapshot.from_dict(dict(AGENT_STATE, vlans=dict(AGENT_STATE["vlans"],
+            **{"20": {"name": u"VLAN20", "egress": "1-8", "untagged": ""}})))
+    # Port 3 still has VLAN 20 as its PVID, and port 4 is moved to VLAN 20 before VLAN 10 is removed
+    current.ports[3]["pvid"] = 20
+    desired = SwitchSnapshot.from_dict({"vlans": {"1": {}, "20": {"untagged": "4"}}})
+    membership, remove = current.diff(desired, prune=True).phases
+    pvids = dict((name[1], int(value)) for (name, value) in membership if name[0] == "dot1qPvid")
+    assert pvids == {2: 1, 4: 20, 6: 1, 8: 1}
+    # The port lists of VLAN 10 are not written before it is removed
+    assert ("dot1qVlanStaticUntaggedPorts", 10) not in get_names(membership)
+    assert get_names(remove) == [("dot1qVlanStaticRowStatus", 10)]
+
+
+def test_demoted_ports_get_a_new_pvid():
+    current = SwitchSnapshot.from_dict(AGENT_STATE)
+    # Ports 6 and 8 stay in VLAN 10 as tagged ports, and port 8 is untagged in VLAN 1 instead
+    desired = SwitchSnapshot.from_dict({"vlans": {"10": {"untagged": "2,4"}, "1": {"untagged": "1,3,5,7,8"}}})
+    membership, = current.diff(desired).phases
+    pvids = dict((name[1], int(value)) for (name, value) in membership if name[0] == "dot1qPvid")
+    assert pvids == {6: 1, 8: 1}
+    assert ("dot1qVlanStaticEgressPorts", 10) not in get_names(membership)
+
+
+def test_apply_changes_the_switch():
+    with SimulatedSwitchAgent(ports=8, vlans=2, ipv4_addresses=0) as agent:
+        switch = Switch(agent.address[0], port=agent.address[1], timeout=1, retries=1)
+        current = SwitchSnapshot.from_dict(AGENT_STATE)
+        desired = SwitchSnapshot.from_dict({
+            "ports": {"2": {"alias": u"uplink", "enabled": False}},
+            "vlans": {"10": {"untagged": "1-8"}},
+        })
+        current.diff(desired).apply(switch)
+
+        membership = switch.vlan_membership()
+        assert list(membership.untagged_ports(10).base_ports()) == list(range(1, 9))
+        assert not membership.untagged_ports(1)
+        assert membership.pvid_mismatches() == []
+        assert Port(switch, alias="uplink").base_port == 2
+        assert not Port(switch, base_port=2).enabled
+        switch.close()
+
+
+def test_apply_with_prune_leaves_no_pvid_in_removed_vlans():
+    with SimulatedSwitchAgent(ports=8, vlans=2, ipv4_addresses=0) as agent:
+        switch = Switch(agent.address[0], port=agent.address[1], timeout=1, retries=1)
+        SwitchSnapshot.from_dict(AGENT_STATE).diff(SwitchSnapshot.from_dict({"vlans": {"1": {}}}), prune=True).apply(
+                switch)
+        assert set(switch.vlan_membership().pvids.values()) == set([1])
+        switch.close()
+
+
+def test_take_reads_the_switch(switch, require_mib_object):
+    require_mib_object("hpicfIpAddressPrefixLength")
+    snapshot = switch.snapshot()
+    assert snapshot.hostname == switch.hostname
+    assert snapshot.ports[2] == {"alias": u"port2", "enabled": True, "pvid": 10}
+    assert snapshot.vlans[20]["name"] == u"VLAN20"
+    assert not snapshot.diff(SwitchSnapshot.from_dict(snapshot.to_dict()))
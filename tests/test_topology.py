@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+import ipaddress
+import struct
+
+import pytest
+from pysnmp.proto import rfc1902
+
+from benchmarks.agent import SimulatedSwitchAgent
+from hpswitch.port import Port
+from hpswitch.switch import Switch
+from hpswitch.topology import LLDPNeighbor, Topology, TopologyCrawler, TopologyNode, format_lldp_id
+
+
+class FakeSwitch(object):
+    """
+    Stands in for the switches read by a TopologyCrawler.
+    """
+    def __init__(self, hostname):
+        self.hostname = hostname
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+# LLDP information of a chain of switches core - access1 - access2 and of a server on access1, by hostname: the chassis
+# ID, the system name, the port IDs of the base ports 1 to 3 and the neighbors as (local base port, chassis ID, port ID,
+# system name, management address) tuples
+NETWORK = {
+    "10.0.0.1": ("core", "core", ["1", "2", "3"], [(1, "access1", "24", "access1", u"10.0.0.2")]),
+    "10.0.0.2": ("access1", "access1", ["1", "24", "3"], [
+        (2, "core", "1", "core", u"10.0.0.1"),
+        (3, "access2", "24", "access2", u"10.0.0.3"),
+        (1, "server", "eth0", "server", None),
+    ]),
+    "10.0.0.3": ("access2", "access2", ["1", "24", "3"], [(2, "access1", "3", "access1", u"10.0.0.2")]),
+}
+
+
+def read_switch(crawler, hostname):
+    if hostname not in NETWORK:
+        raise IOError("No response from {0}".format(hostname))
+    chassis_id, system_name, port_ids, neighbors = NETWORK[hostname]
+    switch = FakeSwitch(hostname)
+    ports = dict((port_id, Port(switch, base_port=base_port)) for (base_port, port_id) in enumerate(port_ids, 1))
+    return switch, (chassis_id, system_name, ports), [
+            LLDPNeighbor(Port(switch, base_port=base_port), remote_chassis_id, remote_port_id, remote_system_name,
+                management_addresses=[ipaddress.ip_address(address)] if address else [])
+            for (base_port, remote_chassis_id, remote_port_id, remote_system_name, address) in neighbors]
+
+
+def test_format_lldp_id():
+    mac = rfc1902.OctetString(b"\x00\x11\x22\xaa\xbb\xcc")
+    # macAddress == 4 for chassis IDs
+    assert format_lldp_id(4, mac, 4) == "00:11:22:aa:bb:cc"
+    assert format_lldp_id(7, rfc1902.OctetString(b"A1"), 4) == "A1"
+    assert format_lldp_id(7, mac, 4) == "00:11:22:aa:bb:cc"
+    assert format_lldp_id(7, rfc1902.OctetString(b"\x01\x02"), 4) == "01:02"
+    assert format_lldp_id(None, None, 4) is None
+
+
+def test_links_are_recorded_once():
+    topology = Topology()
+    first = topology.nodes["a"] = TopologyNode("a", "alpha")
+    second = topology.nodes["b"] = TopologyNode("b")
+    link = topology.add_link(first, "1", second, "2")
+    assert link is not None
+    assert topology.add_link(second, "2", first, "1") is None
+    assert topology.add_link(first, "3", second, "4") is not None
+    assert len(topology.links) == 2
+    assert topology.get_links(second, first)[0] is link
+    assert link.get_end(second) == ("2", None)
+    assert topology.get_neighbors(first) == [second]
+    assert topology.find_node("alpha") is first
+    assert topology.as_dict() == {"alpha": {"b": [("1", "2"), ("3", "4")]}, "b": {"alpha": [("2", "1"), ("4", "3")]}}
+
+
+def test_crawl_reads_every_switch_once(monkeypatch):
+    monkeypatch.setattr(TopologyCrawler, "_read_switch", read_switch)
+    with TopologyCrawler(max_workers=4).crawl(["10.0.0.1", "10.0.0.2", "10.0.0.9"]) as topology:
+        assert sorted(topology.nodes) == ["access1", "access2", "core", "server"]
+        assert sorted(node.chassis_id for node in topology.nodes.values() if node.crawled) == [
+                "access1", "access2", "core"]
+        assert topology.get_node("access2").depth == 1
+        # The server advertises no management address, so it is tried at its system name
+        assert sorted(topology.errors) == ["10.0.0.9", "server"]
+        # Both ends of the links between switches report them
+        assert len(topology.links) == 3
+        access1 = topology.get_node("access1")
+        assert sorted(node.chassis_id for node in topology.get_neighbors(access1)) == ["access2", "core", "server"]
+        link = topology.get_links(access1, topology.get_node("core"))[0]
+        assert link.get_end(access1)[0] == "24"
+        assert link.get_end(access1)[1].base_port == 2
+        assert topology.as_dict()["core"] == {"access1": [("1", "24")]}
+        switches = [node.switch for node in topology.nodes.values() if node.crawled]
+    assert all(switch.closed for switch in switches)
+
+
+def test_crawl_stops_at_max_depth(monkeypatch):
+    monkeypatch.setattr(TopologyCrawler, "_read_switch", read_switch)
+    topology = TopologyCrawler(max_depth=1).crawl(["10.0.0.1"])
+    assert topology.get_node("access1").crawled
+    # Known from the neighbors of access1 only
+    assert not topology.get_node("access2").crawled
+    topology.close()
+
+
+def test_crawler_reaches_switches_at_its_port():
+    created = []
+
+    class UnreachableSwitch(FakeSwitch):
+        def __init__(self, hostname, community, port, timeout, retries):
+            FakeSwitch.__init__(self, hostname)
+            created.append((hostname, community, port))
+            raise IOError("No response from {0}".format(hostname))
+
+    topology = TopologyCrawler(community="secret", port=1161, switch_class=UnreachableSwitch).crawl(["10.0.0.1"])
+    assert created == [("10.0.0.1", "secret", 1161)]
+    assert list(topology.errors) == ["10.0.0.1"]
+    topology.close()
+
+
+def test_snmp_iter_columns_matches_separate_walks(switch, requests):
+    rows = list(switch.snmp_iter_columns([("ifAlias", ), ("ifDescr", ), ("dot1qPvid", )], max_repetitions=10))
+    walks = requests.count
+    for position, name in enumerate(["ifAlias", "ifDescr", "dot1qPvid"]):
+        assert [(tuple(oid), str(value)) for (column, oid, value) in rows if column == position] == [
+                (tuple(oid), str(value)) for (oid, value) in switch.snmp_get_subtree((name, ))]
+    # Walking the columns side by side takes fewer requests than walking them one after the other
+    assert walks < requests.count - walks
+
+
+def simulate_lldp(agent, chassis_id, system_name, neighbors):
+    """
+    Let `agent` advertise the MAC `chassis_id` and `system_name` and the port IDs "A1", "A2", ... for its base ports,
+    and report `neighbors` as (local base port, remote MAC chassis ID, remote port ID, remote system name, IPv4
+    management address) tuples.
+    """
+    # LldpChassisIdSubtype macAddress == 4, LldpPortIdSubtype local == 7
+    agent._set(("lldpLocChassisIdSubtype", 0), rfc1902.Integer(4))
+    agent._set(("lldpLocChassisId", 0), rfc1902.OctetString(chassis_id))
+    agent._set(("lldpLocSysName", 0), rfc1902.OctetString(system_name))
+    for base_port in range(1, agent.port_count + 1):
+        agent._set(("lldpLocPortIdSubtype", base_port), rfc1902.Integer(7))
+        agent._set(("lldpLocPortId", base_port), rfc1902.OctetString("A{0}".format(base_port)))
+    for remote_index, (base_port, remote_chassis_id, port_id, remote_system_name, address) in enumerate(neighbors, 1):
+        # Indexed by lldpRemTimeMark, lldpRemLocalPortNum and lldpRemIndex
+        index = (0, base_port, remote_index)
+        agent._set(("lldpRemChassisIdSubtype", ) + index, rfc1902.Integer(4))
+        agent._set(("lldpRemChassisId", ) + index, rfc1902.OctetString(remote_chassis_id))
+        agent._set(("lldpRemPortIdSubtype", ) + index, rfc1902.Integer(7))
+        agent._set(("lldpRemPortId", ) + index, rfc1902.OctetString(port_id))
+        agent._set(("lldpRemSysName", ) + index, rfc1902.OctetString(remote_system_name))
+        # AddressFamilyNumbers ipV4 == 1 and the length of the address; ifIndex == 2
+        agent._set(("lldpRemManAddrIfSubtype", ) + index + (1, 4) + struct.unpack("4B", ipaddress.ip_address(
+                address).packed), rfc1902.Integer(2))
+
+
+@pytest.fixture
+def lldp_agents():
+    # Two switches linked by their ports A8, which the crawler reaches at different loopback addresses
+    with SimulatedSwitchAgent(ports=8, vlans=2, host="127.0.0.1") as first:
+        with SimulatedSwitchAgent(ports=8, vlans=2, host="127.0.0.2", port=first.address[1]) as second:
+            simulate_lldp(first, b"\x00\x11\x22\x00\x00\x01", "first",
+                    [(8, b"\x00\x11\x22\x00\x00\x02", "A8", "second", u"127.0.0.2")])
+            simulate_lldp(second, b"\x00\x11\x22\x00\x00\x02", "second",
+                    [(8, b"\x00\x11\x22\x00\x00\x01", "A8", "first", u"127.0.0.1")])
+            yield [first, second]
+
+
+def test_lldp_neighbors(switch):
+    # The agent does not simulate any LLDP neighbors
+    assert switch.lldp_neighbors() == []
+
+
+def test_lldp_neighbors_of_a_simulated_switch(lldp_agents):
+    agent = lldp_agents[0]
+    with Switch(agent.address[0], agent.community, port=agent.address[1], timeout=1, retries=1) as switch:
+        neighbors = switch.lldp_neighbors()
+    assert len(neighbors) == 1
+    neighbor = neighbors[0]
+    assert neighbor.local_port.base_port == 8
+    assert (neighbor.chassis_id, neighbor.port_id, neighbor.system_name) == ("00:11:22:00:00:02", "A8", "second")
+    assert neighbor.management_addresses == [ipaddress.ip_address(u"127.0.0.2")]
+
+
+def test_crawl_simulated_switches(lldp_agents):
+    port = lldp_agents[0].address[1]
+    with TopologyCrawler(port=port, timeout=1, retries=1).crawl(["127.0.0.1"]) as topology:
+        assert not topology.errors
+        assert sorted(node.system_name for node in topology.nodes.values() if node.crawled) == ["first", "second"]
+        assert topology.get_node("00:11:22:00:00:02").depth == 1
+        assert topology.as_dict() == {"first": {"second": [("A8", "A8")]}, "second": {"first": [("A8", "A8")]}}
+        link = topology.links[0]
+        assert [link.get_end(node)[1].base_port for node in topology.nodes.values()] == [8, 8]
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import socket
+import threading
+
+from pyasn1.codec.ber import decoder, encoder
+from pysnmp.proto import api, rfc1902
+
+from hpswitch.asyncswitch import AsyncPort, AsyncSwitch, AsyncTrapListener
+from hpswitch.cache import ReadCache
+from hpswitch.port import Port
+from hpswitch.switch import Switch
+from hpswitch.traps import (COLD_START, COLD_START_OID, CONFIG_CHANGE, HP_SWITCH_RUNNING_CONFIG_CHANGE_OID,
+        HP_SWITCH_STARTUP_CONFIG_CHANGE_OID, LINK_DOWN, LINK_DOWN_OID, LINK_UP_OID, OTHER, SNMP_TRAP_OID_OID,
+        SYS_UP_TIME_OID, TrapListener, TrapProcessor, decode_notification)
+from hpswitch.vlan import VLAN, VLAN_IFINDEX_OFFSET
+
+SENDER = ("127.0.0.1", 162)
+
+# ifIndex of IF-MIB
+IF_INDEX_OID = (1, 3, 6, 1, 2, 1, 2, 2, 1, 1)
+
+# entConfigChange of ENTITY-MIB, which reports changes of the physical entity table
+ENT_CONFIG_CHANGE_OID = (1, 3, 6, 1, 2, 1, 47, 2, 0, 1)
+
+
+def encode_notification(notification_oid, ifindex=None, community="public", inform=False, request_id=1):
+    """
+    Encode an SNMPv2c trap or inform with the given `notification_oid`, concerning the interface `ifindex` if given.
+    """
+    pMod = api.protoModules[api.protoVersion2c]
+    pdu = pMod.InformRequestPDU() if inform else pMod.SNMPv2TrapPDU()
+    pMod.apiPDU.setDefaults(pdu)
+    pMod.apiPDU.setRequestID(pdu, request_id)
+    varbinds = [(SYS_UP_TIME_OID, rfc1902.TimeTicks(1234)), (SNMP_TRAP_OID_OID, rfc1902.ObjectName(notification_oid))]
+    if ifindex is not None:
+        varbinds.append((IF_INDEX_OID + (ifindex, ), rfc1902.Integer(ifindex)))
+    pMod.apiPDU.setVarBinds(pdu, varbinds)
+    message = pMod.Message()
+    pMod.apiMessage.setDefaults(message)
+    pMod.apiMessage.setCommunity(message, community)
+    pMod.apiMessage.setPDU(message, pdu)
+    return encoder.encode(message)
+
+
+def encode_v1_trap(generic_trap, specific_trap=0, enterprise=(1, 3, 6, 1, 4, 1, 11), agent_address="127.0.0.1"):
+    pMod = api.protoModules[api.protoVersion1]
+    pdu = pMod.TrapPDU()
+    pMod.apiTrapPDU.setDefaults(pdu)
+    pMod.apiTrapPDU.setEnterprise(pdu, enterprise)
+    pMod.apiTrapPDU.setAgentAddr(pdu, pMod.IpAddress(agent_address))
+    pMod.apiTrapPDU.setGenericTrap(pdu, generic_trap)
+    pMod.apiTrapPDU.setSpecificTrap(pdu, specific_trap)
+    pMod.apiTrapPDU.setTimeStamp(pdu, 99)
+    message = pMod.Message()
+    pMod.apiMessage.setDefaults(message)
+    pMod.apiMessage.setCommunity(message, "public")
+    pMod.apiMessage.setPDU(message, pdu)
+    return encoder.encode(message)
+
+
+def test_decode_notifications():
+    notification = decode_notification(encode_notification(LINK_UP_OID, ifindex=3))
+    assert notification.notification_oid == LINK_UP_OID
+    assert notification.uptime == 1234
+    assert notification.varbinds[0][0] == IF_INDEX_OID + (3, )
+    assert notification.inform_request_id is None
+    assert decode_notification(encode_notification(LINK_UP_OID, inform=True, request_id=7)).inform_request_id == 7
+
+    # SNMPv1 traps are translated as in RFC 3584
+    notification = decode_notification(encode_v1_trap(2))
+    assert notification.notification_oid == LINK_DOWN_OID
+    assert notification.agent_address == "127.0.0.1"
+    assert notification.uptime == 99
+    notification = decode_notification(encode_v1_trap(6, specific_trap=5))
+    assert notification.notification_oid == (1, 3, 6, 1, 4, 1, 11, 0, 5)
+    assert decode_notification(b"garbage") is None
+
+
+def test_link_notifications_invalidate_the_interface(agent):
+    cache = ReadCache()
+    switch = Switch(agent.address[0], agent.community, port=agent.address[1], cache=cache)
+    processor = TrapProcessor([switch])
+    switch.snmp_get_many([("ifOperStatus", 5), ("ifOperStatus", 6), ("ifAlias", 5)])
+
+    event, response = processor.process(encode_notification(LINK_DOWN_OID, ifindex=5), SENDER)
+    assert event.kind == LINK_DOWN
+    assert event.switch is switch
+    assert event.port is Port(switch, base_port=5)
+    assert response is None
+    get_oid = switch.mib_registry.get_oid
+    assert cache.lookup(switch.hostname, get_oid(("ifOperStatus", 5))) is None
+    assert cache.lookup(switch.hostname, get_oid(("ifOperStatus", 6))) is not None
+    assert cache.lookup(switch.hostname, get_oid(("ifAlias", 5))) is not None
+
+    event, response = processor.process(encode_notification(LINK_DOWN_OID, ifindex=VLAN_IFINDEX_OFFSET + 10), SENDER)
+    assert event.vlan is VLAN(switch, 10)
+    assert event.port is None
+    switch.close()
+
+
+def test_restarts_drop_all_cached_values_of_the_switch(agent):
+    cache = ReadCache()
+    switch = Switch(agent.address[0], agent.community, port=agent.address[1], cache=cache)
+    cache.store("other", (1, 3, 6, 1), "kept")
+    switch.snmp_get(("ifAlias", 1))
+    switch.alias_index.refresh()
+
+    event, response = TrapProcessor([switch]).process(encode_notification(COLD_START_OID), SENDER)
+    assert event.kind == COLD_START
+    assert cache.lookup(switch.hostname, switch.mib_registry.get_oid(("ifAlias", 1))) is None
+    assert cache.lookup("other", (1, 3, 6, 1)) == "kept"
+    assert switch.alias_index.built_at is None
+    switch.close()
+
+
+def test_hp_config_changes_drop_all_cached_values_of_the_switch(agent):
+    cache = ReadCache()
+    switch = Switch(agent.address[0], agent.community, port=agent.address[1], cache=cache)
+    processor = TrapProcessor([switch])
+    oid = switch.mib_registry.get_oid(("ifAlias", 1))
+    for notification_oid in (HP_SWITCH_RUNNING_CONFIG_CHANGE_OID, HP_SWITCH_STARTUP_CONFIG_CHANGE_OID):
+        switch.snmp_get(("ifAlias", 1))
+        event, response = processor.process(encode_notification(notification_oid), SENDER)
+        assert event.kind == CONFIG_CHANGE
+        assert cache.lookup(switch.hostname, oid) is None
+
+    # Changes of the physical entities are not configuration changes
+    switch.snmp_get(("ifAlias", 1))
+    event, response = processor.process(encode_notification(ENT_CONFIG_CHANGE_OID), SENDER)
+    assert event.kind == OTHER
+    assert cache.lookup(switch.hostname, oid) is not None
+    switch.close()
+
+
+def test_unacceptable_notifications_are_rejected(switch):
+    processor = TrapProcessor([switch])
+    assert processor.process(encode_notification(LINK_UP_OID, community="private"), SENDER) == (None, None)
+    assert processor.process(encode_notification(LINK_UP_OID), ("192.0.2.1", 162)) == (None, None)
+    assert processor.process(b"garbage", SENDER) == (None, None)
+    assert processor.rejected == 3
+    assert processor.received == 0
+
+    event, response = TrapProcessor([switch], accept_unknown_senders=True).process(
+            encode_notification((1, 3, 6, 1, 4, 1, 11, 0, 1)), ("192.0.2.1", 162))
+    assert event.switch is None
+    assert event.kind == OTHER
+
+
+def test_informs_are_acknowledged(switch):
+    event, response = TrapProcessor([switch]).process(encode_notification(LINK_UP_OID, inform=True, request_id=42),
+            SENDER)
+    pMod = api.protoModules[api.protoVersion2c]
+    message, rest = decoder.decode(response, asn1Spec=pMod.Message())
+    pdu = pMod.apiMessage.getPDU(message)
+    assert pdu.tagSet == pMod.ResponsePDU.tagSet
+    assert int(pMod.apiPDU.getRequestID(pdu)) == 42
+
+
+def test_listener_publishes_events(switch):
+    received = threading.Event()
+    events = []
+
+    def subscriber(event):
+        events.append(event)
+        received.set()
+
+    def failing_subscriber(event):
+        raise ValueError()
+
+    with TrapListener([switch], host="127.0.0.1", port=0) as listener:
+        listener.subscribe(failing_subscriber)
+        listener.subscribe(subscriber)
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.sendto(encode_notification(LINK_UP_OID, ifindex=2), listener.address)
+        sock.close()
+        assert received.wait(2)
+    assert events[0].port is Port(switch, base_port=2)
+
+
+def test_listener_binds_its_socket_on_start(switch):
+    listener = TrapListener([switch], host="127.0.0.1", port=0)
+    assert listener.address is None
+    # Stopping a listener that was never started does nothing
+    listener.stop()
+    with listener:
+        assert listener.address[1] != 0
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    # The port is free again
+    sock.bind(listener.address)
+    sock.close()
+
+
+def test_async_listener_yields_events(agent):
+    async def receive():
+        switch = AsyncSwitch(agent.address[0], agent.community, port=agent.address[1])
+        async with AsyncTrapListener([switch], host="127.0.0.1", port=0) as listener:
+            events = listener.__aiter__()
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.sendto(encode_notification(LINK_UP_OID, community="private"), listener.address)
+            sock.sendto(encode_notification(LINK_UP_OID, ifindex=4), listener.address)
+            sock.close()
+            event = await asyncio.wait_for(events.__anext__(), 2)
+            return switch, event, listener.rejected
+    switch, event, rejected = asyncio.run(receive())
+    assert isinstance(event.port, AsyncPort)
+    assert event.port.base_port == 4
+    assert rejected == 1
+
+
+def test_async_listener_binds_its_socket_on_start(switch):
+    async def start_and_stop():
+        listener = AsyncTrapListener([switch], host="127.0.0.1", port=0)
+        assert listener.address is None
+        listener.stop()
+        async with listener:
+            return listener.address
+    assert asyncio.run(start_and_stop())[1] != 0
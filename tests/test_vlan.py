@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from hpswitch.port import Port
+from hpswitch.vlan import VLAN
+
+
+def test_vlans_are_constructed_without_requests(agent, switch):
+    vlan = VLAN(switch, 999)
+    assert vlan.vid == 999
+    assert agent.requests_received == 0
+    assert not vlan.exists
+
+
+def test_get_vlans_takes_a_single_walk(agent, switch):
+    vlans = switch.get_vlans()
+    assert [vlan.vid for vlan in vlans] == [1, 10, 20, 30]
+    assert agent.operations == ["getbulk"]
+    assert vlans[1] is VLAN(switch, 10)
+
+
+def test_reading_port_vlans_creates_no_vlans(agent, switch):
+    port = Port(switch, base_port=2)
+    assert port.untagged_vlan.vid == 10
+    assert [vlan.vid for vlan in port.tagged_vlans] == [20]
+    assert "set" not in agent.operations
+
+
+def test_vlans_are_created_explicitly(agent, switch):
+    vlan = VLAN(switch, 40, create=True)
+    assert vlan.exists
+    switch.create_vlans([10, 50, 60])
+    assert [vlan.vid for vlan in switch.get_vlans()] == [1, 10, 20, 30, 40, 50, 60]
+    # Creating existing VLANs does not set anything
+    assert agent.operations.count("set") == 2
+    assert VLAN(switch, 50).exists
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from hpswitch.port import Port
+from hpswitch.vlan import VLAN
+
+
+def get_names(varbinds):
+    return [name for (name, value) in varbinds]
+
+
+def test_untag_orders_sets_so_untagged_ports_stay_egress_ports(switch):
+    changes = switch.vlan_changes()
+    # Port 1 is untagged in VLAN 1 and tagged in VLAN 10
+    changes.untag(Port(switch, base_port=1), VLAN(switch, 20))
+    assert get_names(changes.get_varbinds()) == [
+        ("dot1qVlanStaticEgressPorts", 20),
+        ("dot1qVlanStaticUntaggedPorts", 1),
+        ("dot1qVlanStaticUntaggedPorts", 20),
+        ("dot1qVlanStaticEgressPorts", 1),
+        ("dot1qPvid", 1),
+    ]
+
+
+def test_changes_are_committed_in_a_single_set(agent, switch):
+    agent.reset_statistics()
+    with switch.vlan_changes() as changes:
+        for base_port in range(1, 49):
+            changes.untag(base_port, 30)
+        changes.tag(5, 20)
+        changes.remove(6, 10)
+    # The PVIDs and the port lists are read in a few GETs before the single SET
+    assert agent.operations[-1] == "set"
+    assert agent.operations.count("set") == 1
+    assert agent.requests_received <= 4
+
+    membership = switch.vlan_membership()
+    assert all(membership.untagged_vlan(base_port) == 30 for base_port in range(1, 49))
+    assert all(membership.pvid(base_port) == 30 for base_port in range(1, 49))
+    assert not membership.untagged_ports(1)
+    assert membership.tagged_vlans(5) == [10, 20]
+    assert 6 not in membership.ports(10)
+
+
+def test_changes_are_dropped_on_error(agent, switch):
+    agent.reset_statistics()
+    with pytest.raises(ValueError):
+        with switch.vlan_changes() as changes:
+            changes.untag(1, 20)
+            raise ValueError()
+    assert agent.requests_received == 0
+    assert switch.vlan_membership().untagged_vlan(1) == 1
+
+
+def test_changes_based_on_snapshot_only_set(agent, switch):
+    membership = switch.vlan_membership()
+    agent.reset_statistics()
+    with switch.vlan_changes(membership) as changes:
+        changes.untag(2, 1)
+        # Already the case
+        changes.tag(2, 20)
+    assert agent.operations == ["set"]
+    assert switch.vlan_membership().untagged_vlan(2) == 1
+
+
+def test_nothing_is_set_without_changes(agent, switch):
+    agent.reset_statistics()
+    with switch.vlan_changes() as changes:
+        changes.untag(1, 1)
+    assert "set" not in agent.operations
+
+
+@pytest.mark.parametrize("snapshot", [False, True])
+def test_removing_a_port_from_its_untagged_vlan_resets_its_pvid(switch, snapshot):
+    # Port 2 is untagged in VLAN 10 and tagged in VLAN 20
+    with switch.vlan_changes(switch.vlan_membership() if snapshot else None) as changes:
+        changes.remove(2, 10)
+    membership = switch.vlan_membership()
+    assert 2 not in membership.ports(10)
+    assert membership.pvid(2) == 1
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+from hpswitch.port import Port
+from hpswitch.vlan import VLANMembership
+
+
+def test_vlan_membership_answers_from_memory(agent, switch):
+    membership = switch.vlan_membership()
+    walks = agent.requests_received
+    # The agent makes each port untagged in one of the VLANs 1, 10, 20 and 30 in turn and tagged in the next one
+    assert membership.vids == [1, 10, 20, 30]
+    assert membership.vlans(1) == [1, 10]
+    assert membership.vlans(Port(switch, base_port=4)) == [1, 30]
+    assert membership.untagged_vlan(4) == 30
+    assert membership.tagged_vlans(4) == [1]
+    assert membership.pvid(2) == 10
+    assert list(membership.untagged_ports(20).base_ports())[:2] == [3, 7]
+    assert list(membership.tagged_ports(20).base_ports())[:2] == [2, 6]
+    assert len(membership.ports(20)) == 24
+    assert membership.pvid_mismatches() == []
+    assert agent.requests_received == walks
+
+
+def test_vlan_membership_matches_per_port_properties(switch):
+    membership = switch.vlan_membership()
+    for base_port in (1, 2, 3, 4, 48):
+        port = Port(switch, base_port=base_port)
+        assert membership.untagged_vlan(port) == port.untagged_vlan.vid
+        assert membership.tagged_vlans(port) == [vlan.vid for vlan in port.tagged_vlans]
+
+
+def test_ports_answer_from_a_membership_snapshot(agent, switch):
+    membership = switch.vlan_membership()
+    agent.reset_statistics()
+    for base_port in (1, 2, 3, 4, 48):
+        port = Port(switch, base_port=base_port)
+        assert port.get_untagged_vlan(membership).vid == membership.untagged_vlan(port)
+        assert [vlan.vid for vlan in port.get_tagged_vlans(membership)] == membership.tagged_vlans(port)
+    assert agent.requests_received == 0
+
+
+def test_pvid_mismatches_and_unknown_vlans():
+    membership = VLANMembership(None, {1: b"\xc0", 10: b"\xc0"}, {1: b"\x80", 10: b"\x40"}, {1: 1, 2: 1, 3: 10})
+    # Port 3 has no untagged VLAN, so its PVID does not count
+    assert membership.pvid_mismatches() == [(2, 1, 10)]
+    assert membership.untagged_vlan(3) is None
+    assert membership.vlans(3) == []
+    assert not membership.ports(20)
+    assert not membership.tagged_ports(20)
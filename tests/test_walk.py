@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from benchmarks.agent import SimulatedSwitchAgent
+from hpswitch.session import SNMPError
+from hpswitch.switch import Switch
+
+
+class RepeatingAgent(SimulatedSwitchAgent):
+    """
+    An agent that answers ifAlias.3 again when asked for the object following it, like a broken agent would.
+    """
+    def _get_next(self, oid):
+        if oid == self.repeated_oid:
+            return oid, self._values[oid]
+        return super(RepeatingAgent, self)._get_next(oid)
+
+
+def test_snmp_get_subtree_returns_all_objects_in_order(switch):
+    rows = switch.snmp_get_subtree(("ifAlias", ))
+    assert [int(oid[-1]) for (oid, value) in rows] == list(range(1, 49))
+    assert [str(value) for (oid, value) in rows][:2] == ["port1", "port2"]
+
+
+def test_snmp_get_subtree_stops_at_the_end_of_the_subtree(switch):
+    # ifDescr is followed by other columns of ifTable in the agent
+    rows = switch.snmp_get_subtree(("ifDescr", ))
+    root_oid = switch.mib_registry.get_oid(("ifDescr", ))
+    assert len(rows) == 48
+    assert all(tuple(oid)[:len(root_oid)] == root_oid for (oid, value) in rows)
+
+
+def test_snmp_get_subtree_of_an_empty_subtree(switch):
+    assert switch.snmp_get_subtree(("ifAlias", 1000)) == []
+
+
+def test_snmp_iter_subtree_only_fetches_what_is_consumed(agent, switch):
+    rows = switch.snmp_iter_subtree(("ifAlias", ))
+    next(rows)
+    assert agent.requests_received == 1
+    rows.close()
+
+
+def test_walk_grows_requests_to_fill_messages(agent, switch):
+    switch.snmp_get_subtree(("ifAlias", ))
+    # The first request asks for max_repetitions rows, the following ones for as many as fit
+    assert agent.operations == ["getbulk", "getbulk"]
+
+
+def test_walk_repetitions_fit_the_measured_rows(switch):
+    varBindTable = [[varBind] for varBind in switch.snmp_get_subtree(("ifAlias", ))]
+    # The biggest row, ifAlias.48 = "port48", is estimated to take 31 bytes
+    assert switch._get_walk_repetitions(varBindTable) == switch._get_available_message_size() // 31
+    switch.max_message_size = 484
+    assert switch._get_walk_repetitions(varBindTable) == switch._get_available_message_size() // 31
+    switch.max_message_size = 65535
+    assert switch._get_walk_repetitions(varBindTable) == switch.max_repetitions_limit
+
+
+def test_walk_responses_fit_into_small_messages():
+    with SimulatedSwitchAgent(ports=96, vlans=2, ipv4_addresses=0, max_message_size=484) as agent:
+        switch = Switch(agent.address[0], port=agent.address[1])
+        switch.max_message_size = 484
+        rows = switch.snmp_get_subtree(("ifAlias", ))
+        requests = agent.requests_received
+        rows_per_request = switch._get_available_message_size() // 31
+    assert [str(value) for (oid, value) in rows] == ["port{0}".format(ifindex) for ifindex in range(1, 97)]
+    # After the first request, every request asks for as many rows as fit
+    assert requests == 1 + -(-(96 - switch.max_repetitions) // rows_per_request)
+
+
+def test_walk_raises_on_a_repeated_oid():
+    with RepeatingAgent(ports=8, vlans=1, ipv4_addresses=0) as agent:
+        switch = Switch(agent.address[0], port=agent.address[1])
+        agent.repeated_oid = switch.mib_registry.get_oid(("ifAlias", 3))
+        with pytest.raises(SNMPError):
+            switch.snmp_get_subtree(("ifAlias", ))